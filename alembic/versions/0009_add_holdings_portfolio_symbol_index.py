@@ -0,0 +1,23 @@
+"""add (portfolio_id, symbol) index on holdings
+
+Revision ID: 0009_add_holdings_portfolio_symbol_index
+Revises: 0008_add_audit_log
+Create Date: 2026-10-19 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009_add_holdings_portfolio_symbol_index'
+down_revision = '0008_add_audit_log'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_holdings_portfolio_symbol', 'holdings', ['portfolio_id', 'symbol'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_holdings_portfolio_symbol', table_name='holdings')
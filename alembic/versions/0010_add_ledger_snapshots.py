@@ -0,0 +1,50 @@
+"""add ledger snapshot tables
+
+Revision ID: 0010_add_ledger_snapshots
+Revises: 0009_add_holdings_portfolio_symbol_index
+Create Date: 2026-10-19 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010_add_ledger_snapshots'
+down_revision = '0009_add_holdings_portfolio_symbol_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ledger_snapshots',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('portfolio_id', sa.Integer(), nullable=False),
+        sa.Column('last_transaction_id', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['portfolio_id'], ['portfolios.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ledger_snapshots_id'), 'ledger_snapshots', ['id'], unique=False)
+    op.create_index(op.f('ix_ledger_snapshots_portfolio_id'), 'ledger_snapshots', ['portfolio_id'], unique=False)
+    op.create_table(
+        'ledger_snapshot_positions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('snapshot_id', sa.Integer(), nullable=False),
+        sa.Column('symbol', sa.String(), nullable=False),
+        sa.Column('quantity', sa.Float(), nullable=False),
+        sa.Column('totalcost', sa.Float(), nullable=False, server_default='0'),
+        sa.ForeignKeyConstraint(['snapshot_id'], ['ledger_snapshots.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ledger_snapshot_positions_id'), 'ledger_snapshot_positions', ['id'], unique=False)
+    op.create_index(op.f('ix_ledger_snapshot_positions_snapshot_id'), 'ledger_snapshot_positions', ['snapshot_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_ledger_snapshot_positions_snapshot_id'), table_name='ledger_snapshot_positions')
+    op.drop_index(op.f('ix_ledger_snapshot_positions_id'), table_name='ledger_snapshot_positions')
+    op.drop_table('ledger_snapshot_positions')
+    op.drop_index(op.f('ix_ledger_snapshots_portfolio_id'), table_name='ledger_snapshots')
+    op.drop_index(op.f('ix_ledger_snapshots_id'), table_name='ledger_snapshots')
+    op.drop_table('ledger_snapshots')
@@ -0,0 +1,27 @@
+"""add version to portfolios for optimistic concurrency control
+
+Revision ID: 0011_add_portfolio_version
+Revises: 0010_add_ledger_snapshots
+Create Date: 2026-10-19 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0011_add_portfolio_version'
+down_revision = '0010_add_ledger_snapshots'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    cols = {col['name'] for col in inspector.get_columns('portfolios')}
+    if 'version' not in cols:
+        op.add_column('portfolios', sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('portfolios', 'version')
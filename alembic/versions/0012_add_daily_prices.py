@@ -0,0 +1,35 @@
+"""add daily prices table
+
+Revision ID: 0012_add_daily_prices
+Revises: 0011_add_portfolio_version
+Create Date: 2026-10-19 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0012_add_daily_prices'
+down_revision = '0011_add_portfolio_version'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'daily_prices',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('symbol', sa.String(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('close', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('symbol', 'date', name='uq_daily_prices_symbol_date')
+    )
+    op.create_index(op.f('ix_daily_prices_id'), 'daily_prices', ['id'], unique=False)
+    op.create_index(op.f('ix_daily_prices_symbol'), 'daily_prices', ['symbol'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_daily_prices_symbol'), table_name='daily_prices')
+    op.drop_index(op.f('ix_daily_prices_id'), table_name='daily_prices')
+    op.drop_table('daily_prices')
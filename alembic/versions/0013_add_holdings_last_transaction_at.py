@@ -0,0 +1,89 @@
+"""add typed, indexed last_transaction_at to holdings
+
+Revision ID: 0013_add_holdings_last_transaction_at
+Revises: 0012_add_daily_prices
+Create Date: 2026-10-19 00:00:00.000000
+"""
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0013_add_holdings_last_transaction_at'
+down_revision = '0012_add_daily_prices'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+# a frozen copy of project.csv_import.parse_timestamp, so the migration does
+# not change when the application parser does
+FORMATS = ('%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M', '%m/%d/%Y', '%Y/%m/%d')
+
+
+def parse_timestamp(value):
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        for fmt in FORMATS:
+            try:
+                parsed = datetime.datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    cols = {col['name'] for col in inspector.get_columns('holdings')}
+    if 'last_transaction_at' not in cols:
+        op.add_column('holdings', sa.Column('last_transaction_at', sa.DateTime(), nullable=True))
+
+    holdings = sa.table(
+        'holdings',
+        sa.column('id', sa.Integer),
+        sa.column('lasttransactiondate', sa.String),
+        sa.column('last_transaction_at', sa.DateTime),
+    )
+    # backfill in id-ordered batches so large tables are not loaded at once
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(holdings.c.id, holdings.c.lasttransactiondate)
+            .where(holdings.c.id > last_id, holdings.c.lasttransactiondate.isnot(None))
+            .order_by(holdings.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        updates = [
+            {'row_id': row_id, 'parsed': parse_timestamp(text)}
+            for row_id, text in rows
+        ]
+        updates = [u for u in updates if u['parsed'] is not None]
+        if updates:
+            bind.execute(
+                holdings.update()
+                .where(holdings.c.id == sa.bindparam('row_id'))
+                .values(last_transaction_at=sa.bindparam('parsed')),
+                updates,
+            )
+        last_id = rows[-1][0]
+
+    op.create_index('ix_holdings_portfolio_last_transaction_at', 'holdings',
+                    ['portfolio_id', 'last_transaction_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_holdings_portfolio_last_transaction_at', table_name='holdings')
+    op.drop_column('holdings', 'last_transaction_at')
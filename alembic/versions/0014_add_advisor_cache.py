@@ -0,0 +1,37 @@
+"""add advisor response cache
+
+Revision ID: 0014_add_advisor_cache
+Revises: 0013_add_holdings_last_transaction_at
+Create Date: 2026-10-19 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0014_add_advisor_cache'
+down_revision = '0013_add_holdings_last_transaction_at'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'advisor_cache',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('model', sa.String(), nullable=False),
+        sa.Column('response_text', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_advisor_cache_id'), 'advisor_cache', ['id'], unique=False)
+    op.create_index(op.f('ix_advisor_cache_key'), 'advisor_cache', ['key'], unique=True)
+    op.create_index(op.f('ix_advisor_cache_created_at'), 'advisor_cache', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_advisor_cache_created_at'), table_name='advisor_cache')
+    op.drop_index(op.f('ix_advisor_cache_key'), table_name='advisor_cache')
+    op.drop_index(op.f('ix_advisor_cache_id'), table_name='advisor_cache')
+    op.drop_table('advisor_cache')
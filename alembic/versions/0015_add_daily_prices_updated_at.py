@@ -0,0 +1,28 @@
+"""add updated_at to daily_prices
+
+Revision ID: 0015_add_daily_prices_updated_at
+Revises: 0014_add_advisor_cache
+Create Date: 2026-10-19 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0015_add_daily_prices_updated_at'
+down_revision = '0014_add_advisor_cache'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    cols = {col['name'] for col in sa.inspect(bind).get_columns('daily_prices')}
+    if 'updated_at' not in cols:
+        op.add_column('daily_prices', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_daily_prices_updated_at'), 'daily_prices', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_daily_prices_updated_at'), table_name='daily_prices')
+    op.drop_column('daily_prices', 'updated_at')
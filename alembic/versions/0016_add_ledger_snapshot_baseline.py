@@ -0,0 +1,27 @@
+"""mark ledger snapshots that replaced positions as baselines
+
+Revision ID: 0016_add_ledger_snapshot_baseline
+Revises: 0015_add_daily_prices_updated_at
+Create Date: 2026-10-19 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0016_add_ledger_snapshot_baseline'
+down_revision = '0015_add_daily_prices_updated_at'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    cols = {col['name'] for col in sa.inspect(bind).get_columns('ledger_snapshots')}
+    if 'baseline' not in cols:
+        op.add_column('ledger_snapshots',
+                      sa.Column('baseline', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade():
+    op.drop_column('ledger_snapshots', 'baseline')
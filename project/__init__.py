@@ -2,6 +2,6 @@
 # Avoid importing `api` on package import to prevent creating DB engine with
 # the wrong DATABASE_URL during test collection. Import `api` explicitly
 # after setting DATABASE_URL in tests or the runtime environment.
-from .portfolio_manager import get_ticker_price, check_file_is_csv, write_portfolio, retrieve_portfolio, buy_ticker, sell_ticker
+from .portfolio_manager import get_ticker_price, check_file_is_csv, write_portfolio, stream_portfolio, retrieve_portfolio, iter_portfolio, filter_portfolio, aggregate_portfolio, buy_ticker, sell_ticker
 
-__all__ = ['get_ticker_price', 'check_file_is_csv', 'write_portfolio', 'retrieve_portfolio', 'buy_ticker', 'sell_ticker']
+__all__ = ['get_ticker_price', 'check_file_is_csv', 'write_portfolio', 'stream_portfolio', 'retrieve_portfolio', 'iter_portfolio', 'filter_portfolio', 'aggregate_portfolio', 'buy_ticker', 'sell_ticker']
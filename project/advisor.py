@@ -0,0 +1,377 @@
+"""Process-wide Gemini advisor client.
+
+One ``AdvisorClient`` is created per process (in the app lifespan) and keeps
+the configured ``GenerativeModel`` for its lifetime. Model calls run on the
+client's own small thread pool, so slow generations never occupy the request
+threadpool used by the trading endpoints. At most ``max_concurrency`` calls
+run at once and ``max_queue`` more may wait; beyond that callers get
+``AdvisorBusy``. ``advise`` awaits a call with a deadline of
+``timeout_seconds``, covering both queueing and generation.
+
+``stream`` relays answer chunks as they are generated; ``JSONObjectScanner``
+picks the recommendations object out of them incrementally.
+
+With ``ADVISOR_BACKEND=stub`` the client answers from ``StubModel`` instead
+of Gemini, without network or API key, for tests and local development.
+
+Answers are cached in ``advisor_cache`` under a hash of the normalized
+prompt, profile and model name for ``ADVISOR_CACHE_TTL_SECONDS``, keeping at
+most ``ADVISOR_CACHE_MAX_ENTRIES`` rows.
+"""
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from sqlalchemy.exc import IntegrityError
+
+from . import models
+
+ADVISOR_BACKEND = os.environ.get('ADVISOR_BACKEND', 'gemini')  # or 'stub'
+ADVISOR_MODEL = os.environ.get('ADVISOR_MODEL', 'models/gemini-2.5-flash')
+ADVISOR_STUB_DELAY_SECONDS = float(os.environ.get('ADVISOR_STUB_DELAY_SECONDS', '0'))
+ADVISOR_TIMEOUT_SECONDS = float(os.environ.get('ADVISOR_TIMEOUT_SECONDS', '60'))
+ADVISOR_MAX_CONCURRENCY = int(os.environ.get('ADVISOR_MAX_CONCURRENCY', '4'))
+ADVISOR_MAX_QUEUE = int(os.environ.get('ADVISOR_MAX_QUEUE', '16'))
+ADVISOR_CACHE_TTL_SECONDS = int(os.environ.get('ADVISOR_CACHE_TTL_SECONDS', '86400'))  # 0 disables the cache
+ADVISOR_CACHE_MAX_ENTRIES = int(os.environ.get('ADVISOR_CACHE_MAX_ENTRIES', '1000'))
+
+
+class AdvisorUnavailable(RuntimeError):
+    """The advisor is not configured (no API key or library)."""
+
+
+class AdvisorBusy(RuntimeError):
+    """Every advisor slot and queue position is taken."""
+
+
+class AdvisorTimeout(RuntimeError):
+    """The advisor did not answer within the deadline."""
+
+
+def parse_recommendations(text):
+    """Extract the outermost ``{...}`` object of a model answer.
+
+    Returns None when the text holds no object; raises ``json.JSONDecodeError``
+    when it does but the object is malformed. A ``ticker`` key is copied to
+    ``symbol`` on recommendations that lack one.
+    """
+    start = text.find('{')
+    end = text.rfind('}') + 1
+    if start == -1 or end == 0:
+        return None
+    return normalize_recommendations(json.loads(text[start:end]))
+
+
+def normalize_recommendations(data):
+    recs = data.get('recommendations') if isinstance(data, dict) else None
+    if isinstance(recs, list):
+        for rec in recs:
+            if isinstance(rec, dict) and 'symbol' not in rec and 'ticker' in rec:
+                rec['symbol'] = rec.get('ticker')
+    return data
+
+
+class JSONObjectScanner:
+    """Find the first top-level JSON object in text that arrives in chunks.
+
+    Braces are counted outside string literals, so each character is looked
+    at once however the text is split. A balanced ``{...}`` that is not valid
+    JSON (braces in prose) is skipped and scanning continues after it.
+    """
+
+    def __init__(self):
+        self.data = None
+        self._chars = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk):
+        """Scan ``chunk``; returns the parsed object once one is complete."""
+        for ch in chunk:
+            if self.data is not None:
+                break
+            if self._depth == 0:
+                if ch == '{':
+                    self._chars = ['{']
+                    self._depth = 1
+                continue
+            self._chars.append(ch)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == '\\':
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == '{':
+                self._depth += 1
+            elif ch == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        self.data = normalize_recommendations(json.loads(''.join(self._chars)))
+                    except json.JSONDecodeError:
+                        pass
+                    self._chars = []
+        return self.data
+
+
+def cache_key(prompt, profile, model_name):
+    """sha256 over the whitespace-normalized prompt, the profile with sorted
+    keys, and the model name."""
+    normalized = json.dumps(
+        [' '.join(str(prompt).split()), profile or {}, model_name],
+        sort_keys=True, separators=(',', ':'), default=str,
+    )
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def _cutoff(ttl_seconds, now=None):
+    return (now or datetime.datetime.now(datetime.UTC)) - datetime.timedelta(seconds=ttl_seconds)
+
+
+def cached_answer(db, key, ttl_seconds=ADVISOR_CACHE_TTL_SECONDS, now=None):
+    """Cached answer text for ``key`` younger than ``ttl_seconds``, or None."""
+    if ttl_seconds <= 0:
+        return None
+    row = (
+        db.query(models.AdvisorCache.response_text)
+        .filter(models.AdvisorCache.key == key, models.AdvisorCache.created_at >= _cutoff(ttl_seconds, now))
+        .first()
+    )
+    return row[0] if row else None
+
+
+def store_answer(db, key, model_name, text, ttl_seconds=ADVISOR_CACHE_TTL_SECONDS,
+                 max_entries=ADVISOR_CACHE_MAX_ENTRIES, now=None):
+    """Cache ``text`` under ``key``, then drop expired rows and the oldest
+    beyond ``max_entries``."""
+    if ttl_seconds <= 0 or max_entries <= 0:
+        return
+    now = now or datetime.datetime.now(datetime.UTC)
+    Cache = models.AdvisorCache
+    db.query(Cache).filter((Cache.key == key) | (Cache.created_at < _cutoff(ttl_seconds, now))).delete(
+        synchronize_session=False)
+    db.add(Cache(key=key, model=model_name, response_text=text, created_at=now))
+    try:
+        db.commit()
+    except IntegrityError:
+        # a concurrent miss stored the same key first
+        db.rollback()
+        return
+    excess = db.query(Cache).count() - max_entries
+    if excess > 0:
+        oldest = [row.id for row in db.query(Cache.id).order_by(Cache.created_at, Cache.id).limit(excess)]
+        db.query(Cache).filter(Cache.id.in_(oldest)).delete(synchronize_session=False)
+        db.commit()
+
+
+STUB_ANSWER = json.dumps({
+    'recommendations': [
+        {'symbol': 'VTI', 'action': 'buy', 'allocation': 60, 'reason': 'Stub advisor: broad market core holding.'},
+        {'symbol': 'BND', 'action': 'buy', 'allocation': 40, 'reason': 'Stub advisor: bonds for stability.'},
+    ],
+})
+
+
+class StubModel:
+    """Local stand-in for ``GenerativeModel`` returning ``answer`` after ``delay_seconds``.
+
+    Like the SDK it honours ``request_options={'timeout': ...}`` by raising
+    ``TimeoutError`` once the answer would take longer.
+    """
+
+    def __init__(self, answer=STUB_ANSWER, delay_seconds=None):
+        self.answer = answer
+        self.delay_seconds = ADVISOR_STUB_DELAY_SECONDS if delay_seconds is None else delay_seconds
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        timeout = (request_options or {}).get('timeout')
+        if not stream:
+            self._wait(self.delay_seconds, timeout)
+            return SimpleNamespace(text=self.answer)
+        return self._parts(timeout)
+
+    @staticmethod
+    def _wait(seconds, remaining):
+        if remaining is not None and seconds > remaining:
+            time.sleep(max(remaining, 0))
+            raise TimeoutError('stub model deadline exceeded')
+        time.sleep(seconds)
+
+    def _parts(self, timeout, size=16):
+        step = self.delay_seconds / max(1, len(self.answer) // size)
+        started = time.monotonic()
+        for start in range(0, len(self.answer), size):
+            remaining = None if timeout is None else timeout - (time.monotonic() - started)
+            self._wait(step, remaining)
+            yield SimpleNamespace(text=self.answer[start:start + size])
+
+
+def _is_deadline_error(error):
+    # the SDK raises google.api_core.exceptions.DeadlineExceeded; transports may raise their own timeouts
+    return isinstance(error, TimeoutError) or type(error).__name__ in ('DeadlineExceeded', 'ReadTimeout', 'Timeout')
+
+
+class AdvisorClient:
+    def __init__(self, api_key=None, model_name=ADVISOR_MODEL, timeout_seconds=ADVISOR_TIMEOUT_SECONDS,
+                 max_concurrency=ADVISOR_MAX_CONCURRENCY, max_queue=ADVISOR_MAX_QUEUE, backend='gemini'):
+        self.api_key = api_key
+        self.backend = backend
+        self.model_name = model_name
+        self.timeout_seconds = timeout_seconds
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='advisor')
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._model_lock = threading.Lock()
+        self._model = None
+
+    @classmethod
+    def from_env(cls):
+        if ADVISOR_BACKEND == 'stub':
+            # its own model name keeps stub answers out of real cache entries
+            return cls(model_name='stub', backend='stub')
+        return cls(api_key=os.environ.get('GEMINI_API_KEY'))
+
+    @property
+    def in_flight(self):
+        """Calls running or queued."""
+        with self._lock:
+            return self._in_flight
+
+    def model(self):
+        """The configured GenerativeModel (or StubModel), built on first use."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = self._build_model()
+        return self._model
+
+    def _build_model(self):
+        if self.backend == 'stub':
+            return StubModel()
+        if not self.api_key:
+            raise AdvisorUnavailable('Gemini API key not configured')
+        try:
+            import google.generativeai as genai
+        except ImportError:
+            raise AdvisorUnavailable('Gemini API library not installed. Run: pip install google-generativeai')
+        genai.configure(api_key=self.api_key)
+        return genai.GenerativeModel(self.model_name)
+
+    def _deadline_error(self):
+        return AdvisorTimeout(f'Advisor did not respond within {self.timeout_seconds:g} seconds')
+
+    def generate(self, prompt):
+        """Blocking call returning the full answer text.
+
+        The deadline is passed to the model as well, so a hung call ends and
+        frees its advisor slot instead of only being abandoned by the caller.
+        """
+        try:
+            response = self.model().generate_content(prompt, request_options={'timeout': self.timeout_seconds})
+        except Exception as e:
+            if _is_deadline_error(e):
+                raise self._deadline_error() from e
+            raise
+        return response.text if response else None
+
+    def generate_stream(self, prompt):
+        """Blocking iterator over answer text chunks as the model produces them."""
+        try:
+            for part in self.model().generate_content(prompt, stream=True,
+                                                      request_options={'timeout': self.timeout_seconds}):
+                if part.text:
+                    yield part.text
+        except Exception as e:
+            if _is_deadline_error(e):
+                raise self._deadline_error() from e
+            raise
+
+    def submit(self, fn, *args):
+        """Run ``fn(*args)`` on an advisor thread, or raise ``AdvisorBusy``."""
+        with self._lock:
+            if self._in_flight >= self.max_concurrency + self.max_queue:
+                raise AdvisorBusy('Advisor is busy; please retry shortly')
+            self._in_flight += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self._lock:
+            self._in_flight -= 1
+
+    async def advise(self, prompt):
+        """Answer text for ``prompt`` without blocking the event loop."""
+        future = asyncio.wrap_future(self.submit(self.generate, prompt))
+        try:
+            # a call still queued when the deadline passes is cancelled and never runs
+            return await asyncio.wait_for(future, self.timeout_seconds)
+        except asyncio.TimeoutError:
+            raise self._deadline_error()
+
+    def stream(self, prompt):
+        """Start generating on an advisor thread and return an async iterator of
+        text chunks.
+
+        ``AdvisorBusy`` is raised here, before anything is sent; the deadline
+        applies to the wait for each chunk, and ``AdvisorTimeout`` is raised
+        from the iterator.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # the event loop is gone; nobody is listening any more
+                stop.set()
+
+        def produce():
+            try:
+                for chunk in self.generate_stream(prompt):
+                    if stop.is_set():
+                        return
+                    put((chunk, None))
+            except Exception as e:
+                put((None, e))
+                return
+            put((None, None))
+
+        future = self.submit(produce)
+
+        async def chunks():
+            try:
+                while True:
+                    try:
+                        chunk, error = await asyncio.wait_for(queue.get(), self.timeout_seconds)
+                    except asyncio.TimeoutError:
+                        raise self._deadline_error()
+                    if error is not None:
+                        raise error
+                    if chunk is None:
+                        return
+                    yield chunk
+            finally:
+                # stops the producer when the client goes away or the deadline passes
+                stop.set()
+                future.cancel()
+
+        return chunks()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
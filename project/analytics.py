@@ -0,0 +1,170 @@
+"""Columnar portfolio analytics.
+
+Holdings and prices are loaded into parallel NumPy arrays (one row per
+position, tagged with its portfolio) and every metric is computed with
+array operations: per-position cost basis, value, gain/loss and weight, and
+per-portfolio totals, concentration and group breakdowns via ``bincount``.
+Any number of portfolios can be valued in one call.
+"""
+import numpy as np
+
+
+def position_frame(holdings, prices, labels=None):
+    """Build the columnar input from holdings.
+
+    ``holdings`` yields ``(portfolio_id, symbol, quantity, avgcost, curprice)``
+    tuples, ``prices`` maps upper-cased symbol to the current price (or None),
+    and ``labels`` optionally maps upper-cased symbol to a grouping label
+    (e.g. the ticker name). Positions with zero or negative quantity are
+    dropped.
+    """
+    rows = [h for h in holdings if h[2] is not None and h[2] > 0]
+    portfolio_ids = np.array([h[0] for h in rows], dtype=np.int64)
+    symbols = np.array([h[1] for h in rows], dtype=str)
+    quantity = np.array([h[2] for h in rows], dtype=float)
+    avg_cost = np.array([np.nan if h[3] is None else h[3] for h in rows], dtype=float)
+    stored = np.array([np.nan if h[4] is None else h[4] for h in rows], dtype=float)
+    keys = [s.strip().upper() for s in symbols]
+    quoted = np.array([np.nan if prices.get(k) is None else prices[k] for k in keys], dtype=float)
+    # same fallback order as the per-holding loop: quote, stored curprice, avgcost, 0
+    missing = np.isnan(quoted)
+    price = np.where(missing, stored, quoted)
+    price = np.where(missing & (np.isnan(price) | (price == 0)), avg_cost, price)
+    labels = labels or {}
+    group = np.array([labels.get(k) or k for k in keys], dtype=str)
+    return {
+        'portfolio_id': portfolio_ids,
+        'symbol': symbols,
+        'quantity': quantity,
+        'avg_cost': np.nan_to_num(avg_cost),
+        'current_price': np.nan_to_num(price),
+        'group': group,
+    }
+
+
+def consolidate(frame, portfolio_id=0):
+    """Merge a frame into one position per symbol under ``portfolio_id``.
+
+    Quantities and cost add up across portfolios; the average cost is the
+    combined cost over the combined quantity.
+    """
+    symbols, idx = np.unique(frame['symbol'], return_inverse=True)
+    n = len(symbols)
+    quantity = np.bincount(idx, weights=frame['quantity'], minlength=n)
+    cost = np.bincount(idx, weights=frame['avg_cost'] * frame['quantity'], minlength=n)
+    value = np.bincount(idx, weights=frame['current_price'] * frame['quantity'], minlength=n)
+    avg_cost = np.zeros(n)
+    np.divide(cost, quantity, out=avg_cost, where=quantity > 0)
+    price = np.zeros(n)
+    np.divide(value, quantity, out=price, where=quantity > 0)
+    group = np.empty(n, dtype=frame['group'].dtype)
+    group[idx] = frame['group']
+    return {
+        'portfolio_id': np.full(n, portfolio_id, dtype=np.int64),
+        'symbol': symbols,
+        'quantity': quantity,
+        'avg_cost': avg_cost,
+        'current_price': price,
+        'group': group,
+    }
+
+
+def _percent(numerator, denominator):
+    out = np.zeros_like(numerator, dtype=float)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out * 100.0
+
+
+def analyze(frame):
+    """Compute per-position, per-portfolio and per-group metrics.
+
+    Returns ``{'positions': columns, 'portfolios': columns, 'groups': columns}``
+    where each value is a dict of equal-length arrays.
+    """
+    qty = frame['quantity']
+    cost_basis = frame['avg_cost'] * qty
+    current_value = frame['current_price'] * qty
+    gain_loss = current_value - cost_basis
+
+    portfolio_ids, pidx = np.unique(frame['portfolio_id'], return_inverse=True)
+    n = len(portfolio_ids)
+    total_cost = np.bincount(pidx, weights=cost_basis, minlength=n)
+    total_value = np.bincount(pidx, weights=current_value, minlength=n)
+    weight = np.zeros_like(current_value)
+    np.divide(current_value, total_value[pidx], out=weight, where=total_value[pidx] > 0)
+
+    hhi = np.bincount(pidx, weights=weight ** 2, minlength=n)
+    top_weight = np.zeros(n)
+    np.maximum.at(top_weight, pidx, weight)
+    effective = np.zeros(n)
+    np.divide(1.0, hhi, out=effective, where=hhi > 0)
+
+    groups, gidx = np.unique(frame['group'], return_inverse=True)
+    # one bucket per (portfolio, group) pair
+    pair = pidx * max(len(groups), 1) + gidx
+    pairs, pair_idx = np.unique(pair, return_inverse=True)
+    group_value = np.bincount(pair_idx, weights=current_value, minlength=len(pairs))
+    group_cost = np.bincount(pair_idx, weights=cost_basis, minlength=len(pairs))
+    group_portfolio = pairs // max(len(groups), 1)
+    group_weight = np.zeros_like(group_value)
+    np.divide(group_value, total_value[group_portfolio], out=group_weight, where=total_value[group_portfolio] > 0)
+
+    total_gain = total_value - total_cost
+    return {
+        'positions': {
+            'portfolio_id': frame['portfolio_id'],
+            'symbol': frame['symbol'],
+            'quantity': qty,
+            'avg_cost': frame['avg_cost'],
+            'current_price': frame['current_price'],
+            'cost_basis': cost_basis,
+            'current_value': current_value,
+            'gain_loss': gain_loss,
+            'gain_loss_percent': _percent(gain_loss, cost_basis),
+            'weight': weight,
+        },
+        'portfolios': {
+            'portfolio_id': portfolio_ids,
+            'total_cost_basis': total_cost,
+            'total_current_value': total_value,
+            'total_gain_loss': total_gain,
+            'total_gain_loss_percent': _percent(total_gain, total_cost),
+            'num_holdings': np.bincount(pidx, minlength=n),
+            'hhi': hhi,
+            'top_weight': top_weight,
+            'effective_holdings': effective,
+        },
+        'groups': {
+            'portfolio_id': portfolio_ids[group_portfolio],
+            'group': groups[pairs % max(len(groups), 1)] if len(groups) else groups,
+            'cost_basis': group_cost,
+            'current_value': group_value,
+            'weight': group_weight,
+        },
+    }
+
+
+def subset(columns, mask):
+    """Rows of a column dict where ``mask`` is true."""
+    return {key: values[mask] for key, values in columns.items()}
+
+
+def portfolio_view(result, portfolio_id):
+    """Positions, groups and scalar totals of one portfolio in an ``analyze`` result."""
+    positions = subset(result['positions'], result['positions']['portfolio_id'] == portfolio_id)
+    groups = subset(result['groups'], result['groups']['portfolio_id'] == portfolio_id)
+    del positions['portfolio_id'], groups['portfolio_id']
+    portfolios = result['portfolios']
+    row = np.flatnonzero(portfolios['portfolio_id'] == portfolio_id)
+    totals = {
+        key: (values[row[0]].item() if len(row) else 0.0)
+        for key, values in portfolios.items() if key != 'portfolio_id'
+    }
+    return positions, groups, totals
+
+
+def records(columns):
+    """Column dict to a list of plain-Python dicts."""
+    keys = list(columns)
+    values = [np.asarray(columns[k]).tolist() for k in keys]
+    return [dict(zip(keys, row)) for row in zip(*values)]
@@ -2,7 +2,9 @@ from fastapi import FastAPI, HTTPException, UploadFile, File, Request
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
 import csv
 import io
 import os
@@ -16,7 +18,7 @@ from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 from slowapi.util import get_remote_address
-from .portfolio_manager import retrieve_portfolio, write_portfolio, buy_ticker, sell_ticker, check_file_is_csv, get_ticker_price, get_ticker_name
+from .portfolio_manager import retrieve_portfolio, write_portfolio, buy_ticker, sell_ticker, check_file_is_csv, iter_portfolio_csv, get_ticker_price, get_ticker_prices, get_ticker_name
 
 logging.basicConfig(level=logging.INFO)
 
@@ -33,11 +35,31 @@ if SENTRY_DSN:
 
 @asynccontextmanager
 async def lifespan(app):
+    global advisor_client
     backfill_ticker_metadata()
+    advisor_client = advisor.AdvisorClient.from_env()
     yield
+    advisor_client.close()
+    advisor_client = None
 
 app = FastAPI(title="Portfolio Management API", version="1.0", lifespan=lifespan)
 
+# Compress responses above a size threshold; brotli when brotli-asgi is installed
+# (it falls back to gzip for clients that do not accept br), gzip otherwise.
+# Added first so it runs innermost and sees whole bodies rather than the
+# re-streamed ones produced by the BaseHTTPMiddleware layers.
+ENABLE_COMPRESSION = os.environ.get('ENABLE_COMPRESSION', 'true').lower() in ('1', 'true', 'yes')
+COMPRESSION_MINIMUM_SIZE = int(os.environ.get('COMPRESSION_MINIMUM_SIZE', '1024'))  # bytes
+if ENABLE_COMPRESSION:
+    try:
+        from brotli_asgi import BrotliMiddleware  # optional
+        app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE)
+        logging.info('Using brotli/gzip response compression')
+    except ImportError:
+        from starlette.middleware.gzip import GZipMiddleware
+        app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE)
+        logging.info('brotli-asgi not installed; using gzip response compression')
+
 RATE_LIMIT_DEFAULT = os.environ.get('RATE_LIMIT_DEFAULT', '200/minute')
 RATE_LIMIT_AUTH = os.environ.get('RATE_LIMIT_AUTH', '10/minute')  # login, refresh
 RATE_LIMIT_REGISTER = os.environ.get('RATE_LIMIT_REGISTER', '3/hour')  # stricter for registration
@@ -118,12 +140,43 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
 
 app.add_middleware(SecurityHeadersMiddleware)
 
+try:
+    import orjson  # optional fast serializer
+except ImportError:
+    orjson = None
+    logging.info('orjson not installed; read endpoints use the standard JSON encoder')
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson when it is installed.
+
+    NumPy scalars and arrays are serialized natively and NaN becomes null.
+    Falls back to ``jsonable_encoder`` and the standard encoder otherwise.
+    """
+
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(jsonable_encoder(content))
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+def fast_json(content, response=None):
+    """``content`` as a ready FastJSONResponse.
+
+    Returning a Response skips FastAPI's ``jsonable_encoder`` pass, which
+    otherwise costs more than the orjson render itself. Headers already set
+    on the injected ``response`` (ETags) are carried over.
+    """
+    return FastJSONResponse(content, headers=dict(response.headers) if response is not None else None)
+
 # DB-backed users/sessions using SQLAlchemy models
 from project.db import get_db, SessionLocal
 from sqlalchemy.orm import Session
-from project import models
+from sqlalchemy import func, insert, select
+from project import models, ledger, lots, metrics, analytics, history, cache, risk, prices, csv_import, arrow_io, advisor
 from passlib.context import CryptContext
 import datetime
+import hashlib
 import uuid
 
 # Prefer bcrypt if available; include pbkdf2_sha256 in schemes for compatibility
@@ -136,6 +189,19 @@ FINNHUB_SYMBOLS_EXCHANGE = os.environ.get('FINNHUB_SYMBOLS_EXCHANGE', 'US')
 FINNHUB_SYMBOLS_CACHE_TTL_SECONDS = int(os.environ.get('FINNHUB_SYMBOLS_CACHE_TTL_SECONDS', '604800'))
 ENABLE_TICKER_BACKFILL = os.environ.get('ENABLE_TICKER_BACKFILL', 'false').lower() in ('1', 'true', 'yes')
 MAX_UPLOAD_SIZE_BYTES = int(os.environ.get('MAX_UPLOAD_SIZE_BYTES', 5 * 1024 * 1024))  # Default 5MB
+# users allowed to replace shared market data (POST /prices/daily/load)
+PRICE_ADMIN_USERS = {u.strip() for u in os.environ.get('PRICE_ADMIN_USERS', '').split(',') if u.strip()}
+# where /portfolio/save writes and /portfolio/file reads saved CSVs
+PORTFOLIO_FILES_DIR = os.environ.get('PORTFOLIO_FILES_DIR') or os.path.dirname(__file__)
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '1000'))  # rows per multi-row insert on CSV load
+MAX_BATCH_ORDERS = int(os.environ.get('MAX_BATCH_ORDERS', '100'))
+TRADE_MAX_RETRIES = int(os.environ.get('TRADE_MAX_RETRIES', '3'))
+HISTORY_CACHE_SIZE = int(os.environ.get('HISTORY_CACHE_SIZE', '256'))  # portfolios with a cached value curve
+ANALYTICS_CACHE_SIZE = int(os.environ.get('ANALYTICS_CACHE_SIZE', '1024'))  # portfolios with cached /portfolio/analytics
+ADVISOR_JOB_RETENTION = int(os.environ.get('ADVISOR_JOB_RETENTION', '1000'))  # advisor jobs kept for polling
+ADVISOR_JOB_TTL_SECONDS = int(os.environ.get('ADVISOR_JOB_TTL_SECONDS', '3600'))
+RISK_BENCHMARK = os.environ.get('RISK_BENCHMARK', 'SPY').strip().upper()
+RISK_WINDOW_DAYS = int(os.environ.get('RISK_WINDOW_DAYS', '252'))
 
 
 def utcnow():
@@ -188,8 +254,12 @@ def verify_csrf_token(token: str) -> bool:
 
 def log_audit(db: Session, user_id: int = None, action: str = None, 
               resource: str = None, details: str = None, status: str = 'success',
-              request: Request = None, username: str = None):
-    """Log an audit event."""
+              request: Request = None, username: str = None, commit: bool = True):
+    """Log an audit event.
+
+    Pass ``commit=False`` to stage the record in the caller's transaction so it
+    is written atomically with the operation being audited.
+    """
     try:
         ip_address = None
         if request:
@@ -205,12 +275,13 @@ def log_audit(db: Session, user_id: int = None, action: str = None,
             username=username
         )
         db.add(audit)
-        db.commit()
+        if commit:
+            db.commit()
     except Exception as e:
         logging.error(f'Failed to log audit event: {e}')
 
 
-from fastapi import Header, Depends
+from fastapi import Header, Depends, BackgroundTasks, Response
 
 COMMON_PASSWORDS = {
     'password', 'password123', '12345678', '123456789', 'qwerty123', 'letmein123',
@@ -266,7 +337,31 @@ def require_csrf(x_csrf_token: str = Header(None, alias='X-CSRF-Token')):
         raise HTTPException(status_code=403, detail='Invalid or missing CSRF token')
     return x_csrf_token
 
-def get_cached_price(symbol: str, db: Session, force_refresh: bool = False):
+def store_cached_price(symbol: str, price: float, updated_at=None, db: Session = None):
+    """Upsert a quote into the price cache.
+
+    Without ``db`` a short-lived session is opened, so the write can run as a
+    background task after the response instead of inside a trade transaction.
+    """
+    own_session = db is None
+    if own_session:
+        db = SessionLocal()
+    try:
+        cached = db.query(models.PriceCache).filter(models.PriceCache.symbol == symbol).first()
+        if cached:
+            cached.price = price
+            cached.updated_at = updated_at or utcnow()
+        else:
+            db.add(models.PriceCache(symbol=symbol, price=price, updated_at=updated_at or utcnow()))
+        db.commit()
+    except OperationalError as e:
+        logging.error('Failed to store cached price for %s: %s', symbol, e)
+        db.rollback()
+    finally:
+        if own_session:
+            db.close()
+
+def get_cached_price(symbol: str, db: Session, force_refresh: bool = False, background_tasks: BackgroundTasks = None):
     symbol = (symbol or '').strip().upper()
     if not symbol:
         return None
@@ -284,6 +379,10 @@ def get_cached_price(symbol: str, db: Session, force_refresh: bool = False):
         if cached and cached.price is not None:
             return cached.price
         return None
+    if background_tasks is not None:
+        # keep the cache write out of the caller's transaction
+        background_tasks.add_task(store_cached_price, symbol, price, now)
+        return price
     if cached:
         cached.price = price
         cached.updated_at = now
@@ -293,6 +392,53 @@ def get_cached_price(symbol: str, db: Session, force_refresh: bool = False):
     db.commit()
     return price
 
+def store_cached_prices(prices: dict, updated_at=None):
+    """Upsert several quotes into the price cache in one background session."""
+    db = SessionLocal()
+    try:
+        for symbol, price in prices.items():
+            store_cached_price(symbol, price, updated_at, db=db)
+    finally:
+        db.close()
+
+def get_cached_prices(symbols, db: Session, force_refresh: bool = False, background_tasks: BackgroundTasks = None):
+    """Resolve prices for many symbols with one cache query and one concurrent fetch.
+
+    Returns {SYMBOL: price or None} keyed by the upper-cased symbol.
+    """
+    wanted = list(dict.fromkeys((s or '').strip().upper() for s in symbols))
+    wanted = [s for s in wanted if s]
+    if not wanted:
+        return {}
+    now = utcnow()
+    try:
+        cached = {
+            row.symbol: row
+            for row in db.query(models.PriceCache).filter(models.PriceCache.symbol.in_(wanted)).all()
+        }
+    except OperationalError:
+        return get_ticker_prices(wanted)
+    prices = {}
+    stale = []
+    for symbol in wanted:
+        row = cached.get(symbol)
+        if row and row.updated_at and row.price is not None and not force_refresh:
+            if (now - ensure_utc(row.updated_at)).total_seconds() <= PRICE_CACHE_TTL_SECONDS:
+                prices[symbol] = row.price
+                continue
+        stale.append(symbol)
+    fetched = {symbol: price for symbol, price in get_ticker_prices(stale).items() if price is not None}
+    for symbol in stale:
+        row = cached.get(symbol)
+        prices[symbol] = fetched.get(symbol, row.price if row else None)
+    if fetched:
+        if background_tasks is not None:
+            background_tasks.add_task(store_cached_prices, fetched, now)
+        else:
+            for symbol, price in fetched.items():
+                store_cached_price(symbol, price, now, db=db)
+    return prices
+
 def get_cached_ticker_name(symbol: str, db: Session, force_refresh: bool = False):
     symbol = (symbol or '').strip().upper()
     if not symbol:
@@ -331,6 +477,45 @@ def attach_ticker_names(rows, db: Session, force_refresh: bool = False):
     return rows
 
 
+def cached_ticker_names(symbols, db: Session):
+    """{SYMBOL: name} for symbols already in the name cache, with one query."""
+    symbols = {(s or '').strip().upper() for s in symbols}
+    symbols.discard('')
+    if not symbols:
+        return {}
+    try:
+        return dict(
+            db.query(models.TickerMetadata.symbol, models.TickerMetadata.name)
+            .filter(models.TickerMetadata.symbol.in_(symbols), models.TickerMetadata.name.isnot(None))
+            .all()
+        )
+    except OperationalError:
+        return {}
+
+
+def attach_cached_ticker_names(rows, db: Session):
+    """Attach ticker names already in the cache with one query and no upstream calls."""
+    names = cached_ticker_names((row.get('symbol') or row.get('ticker') for row in rows), db)
+    if not names:
+        return rows
+    for row in rows:
+        name = names.get((row.get('symbol') or row.get('ticker') or '').strip().upper())
+        if name:
+            row['ticker_name'] = name
+    return rows
+
+
+def refresh_ticker_name(symbol: str):
+    """Refresh one cached ticker name in its own session (for background tasks)."""
+    db = SessionLocal()
+    try:
+        get_cached_ticker_name(symbol, db, force_refresh=True)
+    except Exception as e:
+        logging.error('Failed to refresh ticker name for %s: %s', symbol, e)
+    finally:
+        db.close()
+
+
 def filter_zero_holdings(rows):
     if not isinstance(rows, list):
         return []
@@ -346,6 +531,54 @@ def filter_zero_holdings(rows):
     return filtered
 
 
+def holding_to_row(h):
+    return {
+        'symbol': h.symbol,
+        'quantity': str(h.quantity),
+        'avgcost': str(h.avgcost) if h.avgcost is not None else '',
+        'curprice': str(h.curprice) if h.curprice is not None else '',
+        'lasttransactiondate': h.lasttransactiondate or '',
+    }
+
+
+def recent_holdings(db: Session, portfolio_id: int):
+    """Holdings of a portfolio, most recent activity first (undated rows last)."""
+    return (
+        db.query(models.Holding)
+        .filter(models.Holding.portfolio_id == portfolio_id)
+        .order_by(models.Holding.last_transaction_at.desc().nulls_last(), models.Holding.id)
+    )
+
+
+def holding_trade_row(holding):
+    """Row in the 'ticker' keyed shape expected by portfolio_manager."""
+    row = holding_to_row(holding)
+    row['ticker'] = row.pop('symbol')
+    return row
+
+
+def write_holding_row(db: Session, portfolio, holding, r):
+    """Persist one traded row onto its holding: update, insert, or delete at zero."""
+    qty_val = float(r.get('quantity') or 0)
+    if qty_val <= 0:
+        if holding is not None:
+            db.delete(holding)
+        return None
+    totalcost_val = r.get('totalcost')
+    avgcost_val = float(totalcost_val) / qty_val if totalcost_val not in (None, '') else r.get('avgcost')
+    r['avgcost'] = avgcost_val
+    if holding is None:
+        holding = models.Holding(portfolio_id=portfolio.id, symbol=r.get('ticker') or r.get('symbol'))
+        db.add(holding)
+    holding.quantity = qty_val
+    holding.avgcost = float(avgcost_val) if avgcost_val not in (None, '') else None
+    holding.curprice = float(r.get('curprice') or 0) if r.get('curprice') else None
+    holding.lasttransactiondate = r.get('lasttransactiondate', '')
+    holding.last_transaction_at = csv_import.parse_timestamp(holding.lasttransactiondate)
+    holding.raw = str(r)
+    return holding
+
+
 def backfill_ticker_metadata():
     if not ENABLE_TICKER_BACKFILL:
         return
@@ -368,6 +601,108 @@ def backfill_ticker_metadata():
         db.close()
 
 
+def upsert_holding_trade(db: Session, portfolio, symbol: str, quantity, price: float, side: str):
+    """Apply a single buy or sell to the one affected holding row.
+
+    The row is located by (portfolio_id, symbol) and updated in place, inserted
+    when the symbol is new to the portfolio, or deleted once its quantity
+    reaches zero. Other holdings of the portfolio are never read or rewritten.
+    Returns the trade message from ``buy_ticker``/``sell_ticker``.
+    """
+    holding = (
+        db.query(models.Holding)
+        .filter(models.Holding.portfolio_id == portfolio.id, models.Holding.symbol == symbol)
+        .first()
+    )
+    rows = [holding_trade_row(holding)] if holding is not None else []
+    trade = buy_ticker if side == 'buy' else sell_ticker
+    new_rows, message = trade(rows, symbol, str(quantity), price=price)
+    write_holding_row(db, portfolio, holding, new_rows[0])
+    return message
+
+
+class ConcurrentUpdateError(Exception):
+    """The portfolio's version changed between reading and writing its holdings."""
+
+
+def bump_portfolio_version(db: Session, portfolio_id: int, expected_version: int):
+    """Compare-and-swap the portfolio version inside the caller's transaction.
+
+    Raises ConcurrentUpdateError when another writer committed first, so the
+    caller can roll back and redo its read-modify-write.
+    """
+    updated = (
+        db.query(models.Portfolio)
+        .filter(models.Portfolio.id == portfolio_id, models.Portfolio.version == expected_version)
+        .update({models.Portfolio.version: expected_version + 1}, synchronize_session=False)
+    )
+    if updated != 1:
+        raise ConcurrentUpdateError(f'Portfolio {portfolio_id} changed concurrently')
+
+
+def touch_portfolio_version(db: Session, portfolio_id: int):
+    """Unconditionally bump the version for writers that replace all holdings."""
+    db.query(models.Portfolio).filter(models.Portfolio.id == portfolio_id).update(
+        {models.Portfolio.version: models.Portfolio.version + 1}, synchronize_session=False
+    )
+
+
+history_cache = cache.LRUCache(HISTORY_CACHE_SIZE)
+# entries expire with the price TTL so stale quotes still get refreshed
+analytics_cache = cache.LRUCache(ANALYTICS_CACHE_SIZE, ttl_seconds=PRICE_CACHE_TTL_SECONDS)
+# job id -> state of queued advisor requests (process-local, like the other caches)
+advisor_jobs = cache.LRUCache(ADVISOR_JOB_RETENTION, ttl_seconds=ADVISOR_JOB_TTL_SECONDS)
+
+
+def invalidate_portfolio_caches(portfolio_id: int):
+    """Drop computed results for a portfolio whose holdings or ledger changed."""
+    history_cache.invalidate(portfolio_id)
+    analytics_cache.invalidate(portfolio_id)
+
+
+def make_etag(*parts):
+    """Strong ETag from the data versions a response is built from."""
+    return '"' + hashlib.sha256(repr(parts).encode()).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str, etag: str):
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(',')]
+    return '*' in tags or any(t.removeprefix('W/') == etag for t in tags)
+
+
+def conditional(response: Response, if_none_match: str, etag: str):
+    """Tag ``response``; return a bodyless 304 when the client already has ``etag``."""
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+def run_portfolio_unit(db: Session, unit, label: str, portfolio_id: int = None):
+    """Run ``unit()`` and commit, retrying on version conflicts.
+
+    ``unit`` re-reads whatever it modifies and must call
+    ``bump_portfolio_version`` with the version it read. After
+    TRADE_MAX_RETRIES conflicts the request fails with 409.
+    """
+    for attempt in range(1, TRADE_MAX_RETRIES + 1):
+        metrics.increment('trade_attempts')
+        try:
+            result = unit()
+            db.commit()
+            if portfolio_id is not None:
+                invalidate_portfolio_caches(portfolio_id)
+            return result
+        except ConcurrentUpdateError as e:
+            db.rollback()
+            metrics.increment('trade_conflicts')
+            logging.warning('%s conflict (attempt %d/%d): %s', label, attempt, TRADE_MAX_RETRIES, e)
+    metrics.increment('trade_conflict_failures')
+    raise HTTPException(status_code=409, detail='Portfolio was modified concurrently; please retry')
+
 
 from sqlalchemy.exc import OperationalError
 
@@ -526,6 +861,16 @@ def health():
     }
 
 
+@app.get('/metrics')
+def get_metrics():
+    """Process-local operational counters."""
+    return {
+        'counters': metrics.snapshot(),
+        'trade_conflict_rate': metrics.rate('trade_conflicts', 'trade_attempts'),
+        'advisor_cache_hit_rate': metrics.rate('advisor_cache_hits', 'advisor_cache_lookups'),
+    }
+
+
 @limiter.limit(RATE_LIMIT_AUTH)
 @app.post('/token/refresh')
 def refresh_token(request: Request, db: Session = Depends(get_db)):
@@ -619,7 +964,7 @@ def logout(request: Request, username: str = Depends(require_auth), db: Session
     
     return response
 
-@app.get('/user/audit-log')
+@app.get('/user/audit-log', response_class=FastJSONResponse)
 def get_audit_log(username: str = Depends(require_auth), limit: int = 50, db: Session = Depends(get_db)):
     """Get audit log for the authenticated user."""
     user = db.query(models.User).filter(models.User.username == username).first()
@@ -630,7 +975,7 @@ def get_audit_log(username: str = Depends(require_auth), limit: int = 50, db: Se
         models.AuditLog.user_id == user.id
     ).order_by(models.AuditLog.created_at.desc()).limit(limit).all()
     
-    return [
+    return fast_json([
         {
             'id': log.id,
             'action': log.action,
@@ -640,11 +985,11 @@ def get_audit_log(username: str = Depends(require_auth), limit: int = 50, db: Se
             'details': log.details
         }
         for log in logs
-    ]
+    ])
 
-@app.get('/user/transactions')
-def get_transactions(username: str = Depends(require_auth), limit: int = 100, 
-                     symbol: str = None, portfolio: str = None,
+@app.get('/user/transactions', response_class=FastJSONResponse)
+def get_transactions(response: Response, username: str = Depends(require_auth), limit: int = 100,
+                     symbol: str = None, portfolio: str = None, if_none_match: str = Header(None),
                      db: Session = Depends(get_db)):
     """Get transaction history for the authenticated user."""
     user = db.query(models.User).filter(models.User.username == username).first()
@@ -655,15 +1000,27 @@ def get_transactions(username: str = Depends(require_auth), limit: int = 100,
     
     # Apply filters
     if symbol:
-        query = query.filter(models.Transaction.symbol == symbol.upper())
+        # symbols are stored as typed, so match case-insensitively
+        query = query.filter(func.upper(models.Transaction.symbol) == symbol.strip().upper())
     if portfolio:
         portfolio_obj = next((p for p in user.portfolios if p.name == portfolio), None)
         if portfolio_obj:
             query = query.filter(models.Transaction.portfolio_id == portfolio_obj.id)
-    
+
+    # the ledger is append-only, so the newest id and row count identify its state
+    last_id, count = (
+        db.query(func.max(models.Transaction.id), func.count(models.Transaction.id))
+        .filter(models.Transaction.user_id == user.id)
+        .one()
+    )
+    etag = make_etag('transactions', user.id, last_id, count, limit, symbol, portfolio)
+    not_modified = conditional(response, if_none_match, etag)
+    if not_modified is not None:
+        return not_modified
+
     transactions = query.order_by(models.Transaction.created_at.desc()).limit(limit).all()
     
-    return [
+    return fast_json([
         {
             'id': t.id,
             'symbol': t.symbol,
@@ -676,11 +1033,72 @@ def get_transactions(username: str = Depends(require_auth), limit: int = 100,
             'notes': t.notes
         }
         for t in transactions
+    ], response)
+
+def holdings_frame(holdings, db: Session):
+    """Columnar analytics input for ``(portfolio_id, symbol, quantity, avgcost, curprice)``
+    rows, with one batched price pass over the distinct symbols."""
+    symbols = {h[1] for h in holdings}
+    prices = get_cached_prices(symbols, db)
+    labels = cached_ticker_names(symbols, db)
+    return analytics.position_frame(holdings, prices, labels)
+
+
+def value_portfolios(portfolios, db: Session):
+    """Run the columnar analytics over the holdings of ``portfolios``."""
+    holdings = [
+        (p.id, h.symbol, h.quantity, h.avgcost, h.curprice)
+        for p in portfolios for h in p.holdings if h.quantity and h.quantity > 0
     ]
+    return analytics.analyze(holdings_frame(holdings, db))
+
+
+def ticker_names_stamp(db: Session, portfolio_id):
+    """(newest id, newest update) of the ticker metadata behind a portfolio's
+    name and group labels, so renames change the ETag too."""
+    symbols = select(func.upper(models.Holding.symbol)).where(models.Holding.portfolio_id == portfolio_id)
+    return tuple(
+        db.query(func.max(models.TickerMetadata.id), func.max(models.TickerMetadata.updated_at))
+        .filter(models.TickerMetadata.symbol.in_(symbols))
+        .one()
+    )
+
+
+def analytics_stamp(db: Session, portfolio):
+    """(holdings version, newest price-cache update among the portfolio's symbols,
+    ticker metadata stamp) and whether all of those cached prices are still within the TTL."""
+    symbols = select(func.upper(models.Holding.symbol)).where(models.Holding.portfolio_id == portfolio.id)
+    newest, oldest = (
+        db.query(func.max(models.PriceCache.updated_at), func.min(models.PriceCache.updated_at))
+        .filter(models.PriceCache.symbol.in_(symbols))
+        .one()
+    )
+    fresh = oldest is None or (utcnow() - ensure_utc(oldest)).total_seconds() <= PRICE_CACHE_TTL_SECONDS
+    return (portfolio.id, portfolio.version, newest, ticker_names_stamp(db, portfolio.id)), fresh
+
+
+def serialize_analytics(result, portfolio_id, name):
+    """Response body for one portfolio out of an ``analytics.analyze`` result."""
+    holdings, groups, totals = analytics.portfolio_view(result, portfolio_id)
+    return {
+        'portfolio_name': name,
+        'total_cost_basis': totals['total_cost_basis'],
+        'total_current_value': totals['total_current_value'],
+        'total_gain_loss': totals['total_gain_loss'],
+        'total_gain_loss_percent': totals['total_gain_loss_percent'],
+        'holdings': analytics.records(holdings),
+        'num_holdings': len(holdings['symbol']),
+        'concentration': {
+            'hhi': totals['hhi'],
+            'top_weight': totals['top_weight'],
+            'effective_holdings': totals['effective_holdings'],
+        },
+        'groups': analytics.records(groups),
+    }
 
-@app.get('/portfolio/analytics')
-def get_portfolio_analytics(username: str = Depends(require_auth), name: str = None, 
-                            db: Session = Depends(get_db)):
+@app.get('/portfolio/analytics', response_class=FastJSONResponse)
+def get_portfolio_analytics(response: Response, username: str = Depends(require_auth), name: str = None,
+                            if_none_match: str = Header(None), db: Session = Depends(get_db)):
     """Get analytics for a portfolio including total value, cost basis, and gain/loss."""
     user = db.query(models.User).filter(models.User.username == username).first()
     if not user:
@@ -691,51 +1109,167 @@ def get_portfolio_analytics(username: str = Depends(require_auth), name: str = N
     if portfolio is None:
         raise HTTPException(status_code=404, detail='Portfolio not found')
     
-    # Calculate analytics
-    total_cost_basis = 0.0
-    total_current_value = 0.0
-    holdings_analytics = []
-    
-    for holding in portfolio.holdings:
-        if holding.quantity <= 0:
-            continue
-            
-        # Get current price
-        current_price = get_cached_price(holding.symbol, db, force_refresh=False)
-        if current_price is None:
-            current_price = holding.curprice or holding.avgcost or 0
-        
-        cost_basis = (holding.avgcost or 0) * holding.quantity
-        current_value = current_price * holding.quantity
-        gain_loss = current_value - cost_basis
-        gain_loss_percent = (gain_loss / cost_basis * 100) if cost_basis > 0 else 0
-        
-        total_cost_basis += cost_basis
-        total_current_value += current_value
-        
-        holdings_analytics.append({
-            'symbol': holding.symbol,
-            'quantity': holding.quantity,
-            'avg_cost': holding.avgcost or 0,
-            'current_price': current_price,
-            'cost_basis': cost_basis,
-            'current_value': current_value,
-            'gain_loss': gain_loss,
-            'gain_loss_percent': gain_loss_percent
-        })
-    
-    total_gain_loss = total_current_value - total_cost_basis
-    total_gain_loss_percent = (total_gain_loss / total_cost_basis * 100) if total_cost_basis > 0 else 0
-    
-    return {
+    stamp, fresh = analytics_stamp(db, portfolio)
+    if fresh:
+        not_modified = conditional(response, if_none_match, make_etag('analytics', stamp))
+        if not_modified is not None:
+            return not_modified
+        cached = analytics_cache.get(portfolio.id)
+        if cached is not None and cached[0] == stamp:
+            metrics.increment('analytics_cache_hits')
+            return fast_json(cached[1], response)
+    metrics.increment('analytics_cache_misses')
+    body = serialize_analytics(value_portfolios([portfolio], db), portfolio.id, pname)
+    # pricing may have refreshed the cache, so stamp what the body was computed from
+    stamp, _ = analytics_stamp(db, portfolio)
+    analytics_cache.set(portfolio.id, (stamp, body))
+    conditional(response, None, make_etag('analytics', stamp))
+    return fast_json(body, response)
+
+@app.get('/portfolio/analytics/all', response_class=FastJSONResponse)
+def get_all_portfolio_analytics(username: str = Depends(require_auth), db: Session = Depends(get_db)):
+    """Analytics for every portfolio of the user plus consolidated totals.
+
+    Holdings are loaded with a single query and priced in one batched pass
+    over the distinct symbols.
+    """
+    user = db.query(models.User).filter(models.User.username == username).first()
+    if not user:
+        raise HTTPException(status_code=404, detail='User not found')
+
+    names = dict(
+        db.query(models.Portfolio.id, models.Portfolio.name)
+        .filter(models.Portfolio.user_id == user.id)
+        .order_by(models.Portfolio.name)
+        .all()
+    )
+    holdings = (
+        db.query(models.Holding.portfolio_id, models.Holding.symbol, models.Holding.quantity,
+                 models.Holding.avgcost, models.Holding.curprice)
+        .join(models.Portfolio, models.Holding.portfolio_id == models.Portfolio.id)
+        .filter(models.Portfolio.user_id == user.id, models.Holding.quantity > 0)
+        .order_by(models.Holding.portfolio_id, models.Holding.id)
+        .all()
+    )
+    frame = holdings_frame([tuple(h) for h in holdings], db)
+    result = analytics.analyze(frame)
+    consolidated = serialize_analytics(analytics.analyze(analytics.consolidate(frame)), 0, None)
+    del consolidated['portfolio_name']
+    return fast_json({
+        'portfolios': [serialize_analytics(result, pid, pname) for pid, pname in names.items()],
+        'consolidated': consolidated,
+        'num_portfolios': len(names),
+    })
+
+@app.get('/portfolio/history', response_class=FastJSONResponse)
+def get_portfolio_history(username: str = Depends(require_auth), name: str = None, start: str = None,
+                          end: str = None, db: Session = Depends(get_db)):
+    """Daily portfolio value reconstructed from the ledger and stored daily closes."""
+    user = db.query(models.User).filter(models.User.username == username).first()
+    if not user:
+        raise HTTPException(status_code=404, detail='User not found')
+    pname = name or user.active_portfolio or 'default'
+    portfolio = next((p for p in user.portfolios if p.name == pname), None)
+    if portfolio is None:
+        raise HTTPException(status_code=404, detail='Portfolio not found')
+    try:
+        start_date = datetime.date.fromisoformat(start) if start else None
+        end_date = datetime.date.fromisoformat(end) if end else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail='start and end must be ISO dates (YYYY-MM-DD)')
+
+    curve = history.portfolio_history(db, portfolio.id, start=start_date, end=end_date, cache=history_cache)
+    return fast_json({'portfolio_name': pname, 'points': history.points(curve)})
+
+@app.get('/portfolio/risk', response_class=FastJSONResponse)
+def get_portfolio_risk(username: str = Depends(require_auth), name: str = None, benchmark: str = None,
+                       window: int = RISK_WINDOW_DAYS, confidence: float = 0.95,
+                       db: Session = Depends(get_db)):
+    """Volatility, beta, max drawdown and historical VaR from stored daily closes."""
+    if window < 2:
+        raise HTTPException(status_code=400, detail='window must be at least 2 days')
+    if not 0 < confidence < 1:
+        raise HTTPException(status_code=400, detail='confidence must be between 0 and 1')
+    user = db.query(models.User).filter(models.User.username == username).first()
+    if not user:
+        raise HTTPException(status_code=404, detail='User not found')
+    pname = name or user.active_portfolio or 'default'
+    portfolio = next((p for p in user.portfolios if p.name == pname), None)
+    if portfolio is None:
+        raise HTTPException(status_code=404, detail='Portfolio not found')
+
+    quantities = {}
+    for h in portfolio.holdings:
+        if h.quantity and h.quantity > 0:
+            symbol = h.symbol.strip().upper()
+            quantities[symbol] = quantities.get(symbol, 0.0) + h.quantity
+    result = risk.holdings_risk(db, quantities, benchmark or RISK_BENCHMARK, window, confidence)
+    result.update({
         'portfolio_name': pname,
-        'total_cost_basis': total_cost_basis,
-        'total_current_value': total_current_value,
-        'total_gain_loss': total_gain_loss,
-        'total_gain_loss_percent': total_gain_loss_percent,
-        'holdings': holdings_analytics,
-        'num_holdings': len(holdings_analytics)
-    }
+        'confidence': confidence,
+    })
+    return fast_json(result)
+
+@app.get('/portfolio/lots', response_class=FastJSONResponse)
+def get_portfolio_lots(username: str = Depends(require_auth), name: str = None, method: str = 'fifo',
+                       symbol: str = None, db: Session = Depends(get_db)):
+    """Tax lots from the transaction ledger: open lots with unrealized P&L,
+    closed lots with realized P&L, and holding periods (FIFO or LIFO).
+
+    Matching starts from the latest baseline snapshot (reset or CSV load),
+    whose positions are the opening lots."""
+    method = (method or 'fifo').lower()
+    if method not in lots.METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of {', '.join(lots.METHODS)}")
+    user = db.query(models.User).filter(models.User.username == username).first()
+    if not user:
+        raise HTTPException(status_code=404, detail='User not found')
+    pname = name or user.active_portfolio or 'default'
+    portfolio = next((p for p in user.portfolios if p.name == pname), None)
+    if portfolio is None:
+        raise HTTPException(status_code=404, detail='Portfolio not found')
+
+    # a reset or CSV load replaced the positions; match from that baseline
+    baseline = ledger.latest_baseline(db, portfolio.id)
+    opening = ledger.snapshot_positions(baseline)
+    query = db.query(
+        models.Transaction.id, models.Transaction.symbol, models.Transaction.transaction_type,
+        models.Transaction.quantity, models.Transaction.price, models.Transaction.created_at,
+    ).filter(models.Transaction.portfolio_id == portfolio.id)
+    if baseline is not None:
+        query = query.filter(models.Transaction.id > baseline.last_transaction_id)
+    if symbol:
+        # symbols are stored as typed, so match case-insensitively
+        query = query.filter(func.upper(models.Transaction.symbol) == symbol.strip().upper())
+        opening = {s: pos for s, pos in opening.items() if s.strip().upper() == symbol.strip().upper()}
+    rows = query.all()
+    ids, symbols, sides, quantities, prices, created = zip(*rows) if rows else ((),) * 6
+    timestamps = [ensure_utc(c).timestamp() for c in created]
+    open_symbols = set(symbols) | set(opening)
+    report = lots.match_lots(
+        ids, symbols, sides, quantities, prices, timestamps, method=method,
+        as_of=utcnow().timestamp(),
+        current_prices=get_cached_prices(open_symbols, db) if open_symbols else {},
+        opening=opening,
+        opened_at=ensure_utc(baseline.created_at).timestamp() if baseline is not None else 0.0,
+    )
+    per_symbol, totals = lots.summarize(report)
+
+    def with_dates(records, *keys):
+        for record in records:
+            for key in keys:
+                record[key] = datetime.datetime.fromtimestamp(record[key], datetime.UTC).isoformat()
+        return records
+
+    return fast_json({
+        'portfolio_name': pname,
+        'method': method,
+        'open_lots': with_dates(lots.columns_to_records(report['open']), 'opened_at'),
+        'realized_lots': with_dates(lots.columns_to_records(report['realized']), 'opened_at', 'closed_at'),
+        'unmatched_sells': lots.columns_to_records(report['unmatched']),
+        'by_symbol': lots.columns_to_records(per_symbol),
+        'totals': totals,
+    })
 
 @app.get('/user/me')
 def me(username: str = Depends(require_auth), db: Session = Depends(get_db)):
@@ -769,12 +1303,21 @@ def set_preferences(data: dict, username: str = Depends(require_auth), db: Sessi
     db.commit()
     return {'theme_mode': theme_mode}
 
-@app.get('/advisor/history')
-def advisor_history(username: str = Depends(require_auth), db: Session = Depends(get_db)):
+@app.get('/advisor/history', response_class=FastJSONResponse)
+def advisor_history(response: Response, username: str = Depends(require_auth),
+                    if_none_match: str = Header(None), db: Session = Depends(get_db)):
     user = db.query(models.User).filter(models.User.username == username).first()
     if not user:
         raise HTTPException(status_code=404, detail='User not found')
-    return {'history': get_recent_advisor_history(user.id, db)}
+    last_id, count = (
+        db.query(func.max(models.AdvisorHistory.id), func.count(models.AdvisorHistory.id))
+        .filter(models.AdvisorHistory.user_id == user.id)
+        .one()
+    )
+    not_modified = conditional(response, if_none_match, make_etag('advisor_history', user.id, last_id, count))
+    if not_modified is not None:
+        return not_modified
+    return fast_json({'history': get_recent_advisor_history(user.id, db)}, response)
 
 @app.post('/portfolio/create')
 def create_portfolio(data: dict, username: str = Depends(require_auth), db: Session = Depends(get_db)):
@@ -808,30 +1351,23 @@ def select_portfolio(data: dict, username: str = Depends(require_auth), db: Sess
     db.commit()
     return {'message': 'Selected', 'active': name}
 
-@app.get('/portfolio')
-def get_portfolio(name: str = None, username: str = Depends(require_auth), db: Session = Depends(get_db)):
+@app.get('/portfolio', response_class=FastJSONResponse)
+def get_portfolio(response: Response, name: str = None, username: str = Depends(require_auth),
+                  if_none_match: str = Header(None), db: Session = Depends(get_db)):
     user = db.query(models.User).filter(models.User.username == username).first()
     pname = name or user.active_portfolio or 'default'
     portfolio = next((p for p in user.portfolios if p.name == pname), None)
     if portfolio is None:
         raise HTTPException(status_code=404, detail='Portfolio not found')
+    etag = make_etag('portfolio', portfolio.id, portfolio.version, ticker_names_stamp(db, portfolio.id))
+    not_modified = conditional(response, if_none_match, etag)
+    if not_modified is not None:
+        return not_modified
     # convert holdings to list of dicts
-    rows = []
-    for h in portfolio.holdings:
-        rows.append({
-            'symbol': h.symbol,
-            'quantity': str(h.quantity),
-            'avgcost': str(h.avgcost) if h.avgcost is not None else '',
-            'curprice': str(h.curprice) if h.curprice is not None else '',
-            'lasttransactiondate': h.lasttransactiondate or '',
-        })
+    rows = [holding_to_row(h) for h in recent_holdings(db, portfolio.id)]
     rows = filter_zero_holdings(rows)
     attach_ticker_names(rows, db)
-    try:
-        sorted_port = sorted(rows, key=lambda r: __import__('pandas').to_datetime(r.get('lasttransactiondate')), reverse=True)
-    except Exception:
-        sorted_port = rows
-    return {'portfolio': sorted_port, 'name': pname}
+    return fast_json({'portfolio': rows, 'name': pname}, response)
 
 
 @app.post('/portfolio/reset')
@@ -847,51 +1383,111 @@ def reset_portfolio(username: str = Depends(require_auth), db: Session = Depends
         db.commit()
         db.refresh(portfolio)
     db.query(models.Holding).filter(models.Holding.portfolio_id == portfolio.id).delete()
+    # an emptied portfolio is the new ledger baseline
+    ledger.take_snapshot(db, portfolio.id, positions={})
+    touch_portfolio_version(db, portfolio.id)
     db.commit()
+    invalidate_portfolio_caches(portfolio.id)
     logging.info('Reset portfolio %s for user %s', pname, username)
     return {'message': 'Started new portfolio', 'portfolio': [], 'name': pname}
 
 
 @app.post("/portfolio/load")
-async def load_portfolio(file: UploadFile = File(...), name: str = None, username: str = Depends(require_auth), db: Session = Depends(get_db)):
+def load_portfolio(background_tasks: BackgroundTasks, file: UploadFile = File(...), name: str = None,
+                   username: str = Depends(require_auth), db: Session = Depends(get_db)):
+    """Replace a portfolio's holdings with an uploaded CSV or Parquet file.
+
+    The upload is parsed incrementally and written with multi-row inserts of
+    IMPORT_BATCH_SIZE rows; invalid rows are skipped and listed in ``errors``.
+    """
     logging.info("Load request: %s for user %s", file.filename, username)
-    if not file.filename.lower().endswith('.csv'):
-        raise HTTPException(status_code=400, detail="File must be a CSV")
+    is_parquet = file.filename.lower().endswith('.parquet')
+    if not is_parquet and not file.filename.lower().endswith('.csv'):
+        raise HTTPException(status_code=400, detail="File must be a CSV or Parquet file")
+    if is_parquet:
+        require_parquet()
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f'File too large. Maximum size: {MAX_UPLOAD_SIZE_BYTES / (1024 * 1024):.1f}MB'
+        )
     try:
-        # Read file contents with size validation
-        content_bytes = await file.read()
-        if len(content_bytes) > MAX_UPLOAD_SIZE_BYTES:
-            raise HTTPException(
-                status_code=413, 
-                detail=f'File too large. Maximum size: {MAX_UPLOAD_SIZE_BYTES / (1024 * 1024):.1f}MB'
-            )
-        content = content_bytes.decode('utf-8')
-        reader = csv.DictReader(io.StringIO(content))
-        rows = []
-        for row in reader:
-            rows.append(row)
-        rows = filter_zero_holdings(rows)
-        pname = name or db.query(models.User).filter(models.User.username == username).first().active_portfolio or 'default'
         user = db.query(models.User).filter(models.User.username == username).first()
+        pname = name or user.active_portfolio or 'default'
         portfolio = next((p for p in user.portfolios if p.name == pname), None)
         if portfolio is None:
             portfolio = models.Portfolio(name=pname, user_id=user.id)
             db.add(portfolio)
-            db.commit()
-            db.refresh(portfolio)
-        # delete existing holdings
+            db.flush()
         db.query(models.Holding).filter(models.Holding.portfolio_id == portfolio.id).delete()
-        for row in rows:
-            h = models.Holding(portfolio_id=portfolio.id, symbol=row.get('symbol',''), quantity=float(row.get('quantity',0) or 0), avgcost=float(row.get('avgcost') or 0) if row.get('avgcost') else None, curprice=float(row.get('curprice') or 0) if row.get('curprice') else None, lasttransactiondate=row.get('lasttransactiondate',''), raw=str(row))
-            db.add(h)
+
+        rows, errors, positions = [], [], {}
+        if is_parquet:
+            batches = arrow_io.iter_holding_batches(file.file, IMPORT_BATCH_SIZE)
+        else:
+            text = io.TextIOWrapper(file.file, encoding='utf-8-sig', newline='')
+            batches = csv_import.iter_holding_batches(text, IMPORT_BATCH_SIZE)
+        for records, batch_errors in batches:
+            errors.extend(batch_errors)
+            if not records:
+                continue
+            db.execute(insert(models.Holding), [dict(r, portfolio_id=portfolio.id) for r in records])
+            for r in records:
+                pos = positions.setdefault(r['symbol'], {'quantity': 0.0, 'totalcost': 0.0})
+                pos['quantity'] += r['quantity']
+                pos['totalcost'] += (r['avgcost'] or 0.0) * r['quantity']
+                rows.append({
+                    'symbol': r['symbol'],
+                    'quantity': str(r['quantity']),
+                    'avgcost': str(r['avgcost']) if r['avgcost'] is not None else '',
+                    'curprice': str(r['curprice']) if r['curprice'] is not None else '',
+                    'lasttransactiondate': r['lasttransactiondate'],
+                })
+        # loaded holdings have no ledger history; record them as the ledger baseline
+        ledger.take_snapshot(db, portfolio.id, positions=positions)
+        touch_portfolio_version(db, portfolio.id)
         user.active_portfolio = pname
         db.commit()
-        attach_ticker_names(rows, db)
-        logging.info("Loaded %d rows into %s for user %s", len(rows), pname, username)
-        return {"message": "Portfolio loaded successfully!", "portfolio": rows, "name": pname}
     except Exception as e:
+        db.rollback()
         logging.error("Load error: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
+    invalidate_portfolio_caches(portfolio.id)
+    attach_cached_ticker_names(rows, db)
+    for symbol in {r['symbol'] for r in rows if 'ticker_name' not in r}:
+        background_tasks.add_task(refresh_ticker_name, symbol)
+    logging.info("Loaded %d rows into %s for user %s (%d rejected)", len(rows), pname, username, len(errors))
+    return {"message": "Portfolio loaded successfully!", "portfolio": rows, "name": pname, "errors": errors}
+
+@app.post('/prices/daily/load')
+def load_daily_prices(file: UploadFile = File(...), username: str = Depends(require_auth),
+                      db: Session = Depends(get_db)):
+    """Import daily closes (symbol, date, close) used by history and risk.
+
+    The closes are shared by every user's curves and risk numbers, so only
+    PRICE_ADMIN_USERS may load them. A plain ``def`` so the parse and the
+    bulk writes run in the threadpool, off the event loop.
+    """
+    if username not in PRICE_ADMIN_USERS:
+        raise HTTPException(status_code=403, detail='Not allowed to load daily prices')
+    if not file.filename.lower().endswith('.csv'):
+        raise HTTPException(status_code=400, detail='File must be a CSV')
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f'File too large. Maximum size: {MAX_UPLOAD_SIZE_BYTES / (1024 * 1024):.1f}MB'
+        )
+    try:
+        text = io.TextIOWrapper(file.file, encoding='utf-8-sig', newline='')
+        imported, errors = prices.import_csv(db, text)
+        db.commit()
+    except (UnicodeDecodeError, ValueError) as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    # every cached value curve may depend on the new closes
+    history_cache.clear()
+    logging.info('Imported %d daily closes for %s (%d rows skipped)', imported, username, len(errors))
+    return {'message': 'Daily prices imported', 'imported': imported, 'errors': errors}
 
 @app.post("/portfolio/save")
 def save_portfolio(data: dict, username: str = Depends(require_auth), db: Session = Depends(get_db)):
@@ -904,13 +1500,11 @@ def save_portfolio(data: dict, username: str = Depends(require_auth), db: Sessio
     portfolio = next((p for p in user.portfolios if p.name == pname), None)
     if portfolio is None:
         raise HTTPException(status_code=404, detail='Portfolio not found')
-    rows = []
-    for h in portfolio.holdings:
-        rows.append({'symbol': h.symbol, 'quantity': str(h.quantity), 'avgcost': str(h.avgcost) if h.avgcost is not None else '', 'curprice': str(h.curprice) if h.curprice is not None else '', 'lasttransactiondate': h.lasttransactiondate or ''})
+    rows = [holding_to_row(h) for h in recent_holdings(db, portfolio.id)]
     rows = filter_zero_holdings(rows)
     # save file under username prefix to avoid collisions
     safe_filename = f"{username}_{filename}"
-    full_path = os.path.join(os.path.dirname(__file__), safe_filename)
+    full_path = os.path.join(PORTFOLIO_FILES_DIR, safe_filename)
     logging.info("Saving to: %s", full_path)
     try:
         if not rows:
@@ -922,9 +1516,15 @@ def save_portfolio(data: dict, username: str = Depends(require_auth), db: Sessio
     except Exception as e:
         logging.error("Save error: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
-@app.post("/buy")
-def buy(data: dict, username: str = Depends(require_auth), db: Session = Depends(get_db)):
-    logging.info("Buy request: %s for user %s", data, username)
+def execute_trade(side: str, data: dict, username: str, db: Session, background_tasks: BackgroundTasks):
+    """Run a buy or sell as one unit of work.
+
+    The holding update, the transaction ledger entry and the audit record are
+    committed together; price and ticker-name cache writes are deferred to
+    background tasks so they never share the trade's transaction.
+    """
+    label = side.capitalize()
+    logging.info("%s request: %s for user %s", label, data, username)
     symbol = data.get("symbol")
     quantity = data.get("quantity")
     if not symbol or not quantity:
@@ -935,67 +1535,179 @@ def buy(data: dict, username: str = Depends(require_auth), db: Session = Depends
         portfolio = next((p for p in user.portfolios if p.name == pname), None)
         if portfolio is None:
             raise HTTPException(status_code=404, detail='Portfolio not found')
-        # convert holdings to list
-        rows = []
-        for h in portfolio.holdings:
-            # use internal key 'ticker' for portfolio_manager
-            rows.append({'ticker': h.symbol, 'quantity': str(h.quantity), 'avgcost': str(h.avgcost) if h.avgcost is not None else '', 'curprice': str(h.curprice) if h.curprice is not None else '', 'lasttransactiondate': h.lasttransactiondate or ''})
-        cached_price = get_cached_price(symbol, db, force_refresh=True)
+        cached_price = get_cached_price(symbol, db, force_refresh=True, background_tasks=background_tasks)
         if cached_price is None:
             raise HTTPException(status_code=400, detail=f"Unable to fetch price for {symbol}")
-        new_rows, message = buy_ticker(rows, symbol, str(quantity), price=cached_price)
-        new_rows = filter_zero_holdings(new_rows)
-        # replace holdings
-        db.query(models.Holding).filter(models.Holding.portfolio_id == portfolio.id).delete()
-        for r in new_rows:
-            sym = r.get('ticker') or r.get('symbol') or ''
-            qty_val = float(r.get('quantity') or 0)
-            if qty_val <= 0:
-                continue
-            totalcost_val = r.get('totalcost')
-            avgcost_val = r.get('avgcost')
-            if (avgcost_val is None or avgcost_val == '') and qty_val:
-                if totalcost_val not in (None, ''):
-                    avgcost_val = float(totalcost_val) / qty_val
-            r['avgcost'] = avgcost_val if avgcost_val is not None else r.get('avgcost', '')
-            h = models.Holding(
+
+        def unit():
+            # a retry starts from a rolled-back session, so this re-reads the version
+            version = portfolio.version
+            message = upsert_holding_trade(db, portfolio, symbol, quantity, cached_price, side)
+            # Record transaction
+            db.add(models.Transaction(
+                user_id=user.id,
                 portfolio_id=portfolio.id,
-                symbol=sym,
-                quantity=qty_val,
-                avgcost=float(avgcost_val) if avgcost_val not in (None, '') else None,
-                curprice=float(r.get('curprice') or 0) if r.get('curprice') else None,
-                lasttransactiondate=r.get('lasttransactiondate',''),
-                raw=str(r),
-            )
-            db.add(h)
-        db.commit()
-        # ensure response uses 'symbol' key (legacy clients/tests expect this)
-        for r in new_rows:
-            if 'symbol' not in r and 'ticker' in r:
-                r['symbol'] = r['ticker']
-        attach_ticker_names(new_rows, db, force_refresh=True)
-        logging.info('Buy completed for %s: %s', username, message)
-        
-        # Record transaction
-        transaction = models.Transaction(
-            user_id=user.id,
-            portfolio_id=portfolio.id,
-            symbol=symbol,
-            transaction_type='buy',
-            quantity=float(quantity),
-            price=cached_price,
-            total_amount=float(quantity) * cached_price
-        )
-        db.add(transaction)
-        db.commit()
-        
-        # Audit log successful buy operation
-        log_audit(db, user_id=user.id, action='buy', resource='holding', 
-                  details=f'{symbol} x {quantity}', status='success', username=username)
+                symbol=symbol,
+                transaction_type=side,
+                quantity=float(quantity),
+                price=cached_price,
+                total_amount=float(quantity) * cached_price
+            ))
+            # Audit log successful trade
+            log_audit(db, user_id=user.id, action=side, resource='holding',
+                      details=f'{symbol} x {quantity}', status='success', username=username, commit=False)
+            bump_portfolio_version(db, portfolio.id, version)
+            return message
+
+        message = run_portfolio_unit(db, unit, label, portfolio.id)
+        logging.info('%s completed for %s: %s', label, username, message)
+        holdings = db.query(models.Holding).filter(models.Holding.portfolio_id == portfolio.id).all()
+        new_rows = filter_zero_holdings([holding_to_row(h) for h in holdings])
+        attach_cached_ticker_names(new_rows, db)
+        background_tasks.add_task(refresh_ticker_name, symbol)
+        background_tasks.add_task(ledger.snapshot_if_due, portfolio.id)
         return {"message": message, "portfolio": new_rows, 'name': pname}
+    except HTTPException as e:
+        if e.status_code != 409:
+            db.rollback()
+            logging.error("%s error: %s", label, e)
+            raise HTTPException(status_code=400, detail=str(e))
+        raise
+    except Exception as e:
+        db.rollback()
+        logging.error("%s error: %s", label, e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/buy")
+def buy(data: dict, background_tasks: BackgroundTasks, username: str = Depends(require_auth), db: Session = Depends(get_db)):
+    return execute_trade('buy', data, username, db, background_tasks)
+
+BATCH_MODES = {'all_or_nothing', 'best_effort'}
+
+
+def apply_orders(rows, orders, prices):
+    """Apply orders in sequence to in-memory holding rows.
+
+    A rejected order leaves ``rows`` untouched, since ``buy_ticker`` and
+    ``sell_ticker`` validate before mutating. Returns (rows, results, filled).
+    """
+    results = []
+    filled = []
+    for index, order in enumerate(orders):
+        order = order if isinstance(order, dict) else {}
+        symbol = str(order.get('symbol') or '').strip()
+        side = str(order.get('side') or '').strip().lower()
+        quantity = order.get('quantity')
+        result = {'index': index, 'symbol': symbol, 'side': side, 'quantity': quantity}
+        try:
+            if not symbol or not quantity:
+                raise ValueError('Symbol and quantity required')
+            if side not in ('buy', 'sell'):
+                raise ValueError("side must be 'buy' or 'sell'")
+            price = prices.get(symbol.upper())
+            if price is None:
+                raise ValueError(f'Unable to fetch price for {symbol}')
+            trade = buy_ticker if side == 'buy' else sell_ticker
+            rows, message = trade(rows, symbol, str(quantity), price=price)
+            result.update({'status': 'filled', 'price': price, 'message': message})
+            filled.append(result)
+        except Exception as e:
+            result.update({'status': 'rejected', 'error': str(e)})
+        results.append(result)
+    return rows, results, filled
+
+
+@app.post("/orders/batch")
+def orders_batch(data: dict, background_tasks: BackgroundTasks, username: str = Depends(require_auth), db: Session = Depends(get_db)):
+    """Apply many buys and sells to one portfolio in a single round trip.
+
+    Body: ``{"orders": [{"symbol", "side", "quantity"}, ...], "portfolio": str,
+    "mode": "all_or_nothing" | "best_effort"}``. Prices for every symbol are
+    resolved in one batched lookup, orders are applied in memory in the given
+    order with ``buy_ticker``/``sell_ticker`` semantics, and all holdings,
+    transactions and audit records are committed once. In ``all_or_nothing``
+    mode (the default) any rejected order aborts the whole batch; in
+    ``best_effort`` mode rejected orders are reported and the rest are applied.
+    """
+    orders = data.get('orders')
+    mode = data.get('mode') or 'all_or_nothing'
+    if not isinstance(orders, list) or not orders:
+        raise HTTPException(status_code=400, detail='orders must be a non-empty list')
+    if len(orders) > MAX_BATCH_ORDERS:
+        raise HTTPException(status_code=400, detail=f'Too many orders; maximum is {MAX_BATCH_ORDERS}')
+    if mode not in BATCH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(sorted(BATCH_MODES))}")
+    logging.info("Batch order request: %d orders (%s) for user %s", len(orders), mode, username)
+    user = db.query(models.User).filter(models.User.username == username).first()
+    pname = data.get('portfolio') or user.active_portfolio or 'default'
+    portfolio = next((p for p in user.portfolios if p.name == pname), None)
+    if portfolio is None:
+        raise HTTPException(status_code=404, detail='Portfolio not found')
+
+    symbols = [str(o.get('symbol') or '').strip() for o in orders if isinstance(o, dict)]
+    prices = get_cached_prices(symbols, db, force_refresh=True, background_tasks=background_tasks)
+
+    def unit():
+        version = portfolio.version
+        existing = {
+            h.symbol: h
+            for h in db.query(models.Holding).filter(
+                models.Holding.portfolio_id == portfolio.id,
+                models.Holding.symbol.in_(set(symbols)),
+            ).all()
+        }
+        rows, results, filled = apply_orders([holding_trade_row(h) for h in existing.values()], orders, prices)
+        rejected = len(results) - len(filled)
+        if rejected and mode == 'all_or_nothing':
+            logging.info('Batch order rejected for %s: %d of %d orders failed', username, rejected, len(results))
+            raise HTTPException(status_code=400, detail={'message': 'Batch rejected; no orders were applied', 'results': results})
+        if filled:
+            traded = {r['symbol'] for r in filled}
+            for r in rows:
+                if r.get('ticker') in traded:
+                    write_holding_row(db, portfolio, existing.get(r.get('ticker')), r)
+            for r in filled:
+                db.add(models.Transaction(
+                    user_id=user.id,
+                    portfolio_id=portfolio.id,
+                    symbol=r['symbol'],
+                    transaction_type=r['side'],
+                    quantity=float(r['quantity']),
+                    price=r['price'],
+                    total_amount=float(r['quantity']) * r['price'],
+                ))
+                log_audit(db, user_id=user.id, action=r['side'], resource='holding',
+                          details=f"{r['symbol']} x {r['quantity']} (batch)", status='success',
+                          username=username, commit=False)
+            bump_portfolio_version(db, portfolio.id, version)
+        return results, filled
+
+    try:
+        results, filled = run_portfolio_unit(db, unit, 'Batch order', portfolio.id)
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
-        logging.error("Buy error: %s", e)
+        db.rollback()
+        logging.error("Batch order error: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
+    rejected = len(results) - len(filled)
+    holdings = db.query(models.Holding).filter(models.Holding.portfolio_id == portfolio.id).all()
+    new_rows = filter_zero_holdings([holding_to_row(h) for h in holdings])
+    attach_cached_ticker_names(new_rows, db)
+    if filled:
+        background_tasks.add_task(ledger.snapshot_if_due, portfolio.id)
+    logging.info('Batch order completed for %s: %d filled, %d rejected', username, len(filled), rejected)
+    return {
+        'message': f'{len(filled)} orders filled, {rejected} rejected',
+        'mode': mode,
+        'filled': len(filled),
+        'rejected': rejected,
+        'results': results,
+        'portfolio': new_rows,
+        'name': pname,
+    }
 
 @app.get("/get_price")
 def get_price(symbol: str, db: Session = Depends(get_db)):
@@ -1006,75 +1718,8 @@ def get_price(symbol: str, db: Session = Depends(get_db)):
     return {"price": price}
 
 @app.post("/sell")
-def sell(data: dict, username: str = Depends(require_auth), db: Session = Depends(get_db)):
-    logging.info("Sell request: %s for user %s", data, username)
-    symbol = data.get("symbol")
-    quantity = data.get("quantity")
-    if not symbol or not quantity:
-        raise HTTPException(status_code=400, detail="Symbol and quantity required")
-    try:
-        user = db.query(models.User).filter(models.User.username == username).first()
-        pname = data.get('portfolio') or user.active_portfolio or 'default'
-        portfolio = next((p for p in user.portfolios if p.name == pname), None)
-        if portfolio is None:
-            raise HTTPException(status_code=404, detail='Portfolio not found')
-        rows = []
-        for h in portfolio.holdings:
-            rows.append({'ticker': h.symbol, 'quantity': str(h.quantity), 'avgcost': str(h.avgcost) if h.avgcost is not None else '', 'curprice': str(h.curprice) if h.curprice is not None else '', 'lasttransactiondate': h.lasttransactiondate or ''})
-        cached_price = get_cached_price(symbol, db, force_refresh=True)
-        if cached_price is None:
-            raise HTTPException(status_code=400, detail=f"Unable to fetch price for {symbol}")
-        new_rows, message = sell_ticker(rows, symbol, str(quantity), price=cached_price)
-        new_rows = filter_zero_holdings(new_rows)
-        db.query(models.Holding).filter(models.Holding.portfolio_id == portfolio.id).delete()
-        for r in new_rows:
-            sym = r.get('ticker') or r.get('symbol') or ''
-            qty_val = float(r.get('quantity') or 0)
-            if qty_val <= 0:
-                continue
-            totalcost_val = r.get('totalcost')
-            avgcost_val = r.get('avgcost')
-            if (avgcost_val is None or avgcost_val == '') and qty_val:
-                if totalcost_val not in (None, ''):
-                    avgcost_val = float(totalcost_val) / qty_val
-            r['avgcost'] = avgcost_val if avgcost_val is not None else r.get('avgcost', '')
-            h = models.Holding(
-                portfolio_id=portfolio.id,
-                symbol=sym,
-                quantity=qty_val,
-                avgcost=float(avgcost_val) if avgcost_val not in (None, '') else None,
-                curprice=float(r.get('curprice') or 0) if r.get('curprice') else None,
-                lasttransactiondate=r.get('lasttransactiondate',''),
-                raw=str(r),
-            )
-            db.add(h)
-        db.commit()
-        for r in new_rows:
-            if 'symbol' not in r and 'ticker' in r:
-                r['symbol'] = r['ticker']
-        attach_ticker_names(new_rows, db, force_refresh=True)
-        logging.info('Sell completed for %s: %s', username, message)
-        
-        # Record transaction
-        transaction = models.Transaction(
-            user_id=user.id,
-            portfolio_id=portfolio.id,
-            symbol=symbol,
-            transaction_type='sell',
-            quantity=float(quantity),
-            price=cached_price,
-            total_amount=float(quantity) * cached_price
-        )
-        db.add(transaction)
-        db.commit()
-        
-        # Audit log successful sell operation
-        log_audit(db, user_id=user.id, action='sell', resource='holding',
-                  details=f'{symbol} x {quantity}', status='success', username=username)
-        return {"message": message, "portfolio": new_rows, 'name': pname}
-    except Exception as e:
-        logging.error("Sell error: %s", e)
-        raise HTTPException(status_code=400, detail=str(e))
+def sell(data: dict, background_tasks: BackgroundTasks, username: str = Depends(require_auth), db: Session = Depends(get_db)):
+    return execute_trade('sell', data, username, db, background_tasks)
 
 
 @app.get("/portfolio/file/{filename}")
@@ -1082,86 +1727,432 @@ def get_portfolio_file(filename: str):
     # Basic validation to avoid directory traversal
     if '..' in filename or '/' in filename or '\\' in filename or not filename.lower().endswith('.csv'):
         raise HTTPException(status_code=400, detail="Invalid filename")
-    full_path = os.path.join(os.path.dirname(__file__), filename)
+    full_path = os.path.join(PORTFOLIO_FILES_DIR, filename)
     if not os.path.exists(full_path):
         raise HTTPException(status_code=404, detail="File not found")
     return FileResponse(full_path, media_type='text/csv', filename=filename)
 
 
+
+def stream_portfolio_csv(portfolio_id: int):
+    """Yield a portfolio as CSV straight from a DB cursor.
+
+    Opens its own session because the request session is closed before a
+    streaming body is sent.
+    """
+    db = SessionLocal()
+    try:
+        holdings = (
+            db.query(models.Holding.symbol, models.Holding.quantity, models.Holding.avgcost,
+                     models.Holding.curprice, models.Holding.lasttransactiondate)
+            .filter(models.Holding.portfolio_id == portfolio_id, models.Holding.quantity > 0)
+            .order_by(models.Holding.last_transaction_at.desc().nulls_last(), models.Holding.id)
+            .yield_per(500)
+        )
+        yield from iter_portfolio_csv(holding_to_row(h) for h in holdings)
+    finally:
+        db.close()
+
+
+def require_parquet():
+    try:
+        arrow_io.require_pyarrow()
+    except arrow_io.ArrowUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+
+def stream_csv_rows(fetch, columns):
+    """Yield CSV text for the tuples ``fetch(db)`` returns, in its own session."""
+    db = SessionLocal()
+    try:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for row in fetch(db):
+            writer.writerow(row)
+            if buffer.tell() > 65536:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+        yield buffer.getvalue()
+    finally:
+        db.close()
+
+
+def stream_parquet_rows(fetch, fields):
+    """Yield a Parquet file of the tuples ``fetch(db)`` returns, in its own session.
+
+    The file is spooled (to disk once large) before the first chunk is sent.
+    """
+    db = SessionLocal()
+    try:
+        spool = arrow_io.spool_parquet(fetch(db), fields)
+    finally:
+        db.close()
+    yield from arrow_io.iter_file(spool)
+
+
+def export_response(fetch, fields, filename: str, fmt: str, db: Session):
+    """CSV or Parquet download of the tuples ``fetch(db)`` returns, both streamed."""
+    if fmt == 'parquet':
+        require_parquet()
+        return StreamingResponse(
+            stream_parquet_rows(fetch, fields),
+            media_type=arrow_io.PARQUET_MEDIA_TYPE,
+            headers={'Content-Disposition': f'attachment; filename="{filename}.parquet"'},
+        )
+    if fmt != 'csv':
+        raise HTTPException(status_code=400, detail='format must be csv or parquet')
+    return StreamingResponse(
+        stream_csv_rows(fetch, [name for name, _ in fields]),
+        media_type='text/csv',
+        headers={'Content-Disposition': f'attachment; filename="{filename}.csv"'},
+    )
+
+
+@app.get('/portfolio/export')
+def export_portfolio(name: str = None, format: str = 'csv', username: str = Depends(require_auth),
+                     db: Session = Depends(get_db)):
+    """Download a portfolio as CSV (same columns as /portfolio/save) or as typed
+    Parquet, streamed without saving a file on the server."""
+    user = db.query(models.User).filter(models.User.username == username).first()
+    if not user:
+        raise HTTPException(status_code=404, detail='User not found')
+    pname = name or user.active_portfolio or 'default'
+    portfolio = next((p for p in user.portfolios if p.name == pname), None)
+    if portfolio is None:
+        raise HTTPException(status_code=404, detail='Portfolio not found')
+    filename = re.sub(r'[^A-Za-z0-9_.-]+', '_', pname)
+    if format == 'parquet':
+        def fetch(session):
+            return (
+                session.query(models.Holding.symbol, models.Holding.quantity, models.Holding.avgcost,
+                              models.Holding.curprice, models.Holding.lasttransactiondate,
+                              models.Holding.last_transaction_at)
+                .filter(models.Holding.portfolio_id == portfolio.id, models.Holding.quantity > 0)
+                .order_by(models.Holding.last_transaction_at.desc().nulls_last(), models.Holding.id)
+                .yield_per(arrow_io.EXPORT_BATCH_SIZE)
+            )
+        return export_response(fetch, arrow_io.HOLDING_FIELDS, filename, format, db)
+    if format != 'csv':
+        raise HTTPException(status_code=400, detail='format must be csv or parquet')
+    return StreamingResponse(
+        stream_portfolio_csv(portfolio.id),
+        media_type='text/csv',
+        headers={'Content-Disposition': f'attachment; filename="{filename}.csv"'},
+    )
+
+
+@app.get('/user/transactions/export')
+def export_transactions(format: str = 'csv', username: str = Depends(require_auth), db: Session = Depends(get_db)):
+    """Full transaction history as streamed CSV or typed Parquet."""
+    user = db.query(models.User).filter(models.User.username == username).first()
+    if not user:
+        raise HTTPException(status_code=404, detail='User not found')
+    T = models.Transaction
+
+    def fetch(session):
+        return (
+            session.query(T.id, T.portfolio_id, T.symbol, T.transaction_type, T.quantity, T.price,
+                          T.total_amount, T.created_at, T.notes)
+            .filter(T.user_id == user.id)
+            .order_by(T.id)
+            .yield_per(arrow_io.EXPORT_BATCH_SIZE)
+        )
+    return export_response(fetch, arrow_io.TRANSACTION_FIELDS, 'transactions', format, db)
+
+
+@app.get('/user/audit-log/export')
+def export_audit_log(format: str = 'csv', username: str = Depends(require_auth), db: Session = Depends(get_db)):
+    """Full audit log of the user as streamed CSV or typed Parquet."""
+    user = db.query(models.User).filter(models.User.username == username).first()
+    if not user:
+        raise HTTPException(status_code=404, detail='User not found')
+    A = models.AuditLog
+
+    def fetch(session):
+        return (
+            session.query(A.id, A.action, A.resource, A.status, A.created_at, A.details)
+            .filter(A.user_id == user.id)
+            .order_by(A.id)
+            .yield_per(arrow_io.EXPORT_BATCH_SIZE)
+        )
+    return export_response(fetch, arrow_io.AUDIT_FIELDS, 'audit-log', format, db)
+
+# created in lifespan; get_advisor() builds it on first use otherwise (e.g. tests)
+advisor_client = None
+
+
+def get_advisor():
+    global advisor_client
+    if advisor_client is None:
+        advisor_client = advisor.AdvisorClient.from_env()
+    return advisor_client
+
+
+def save_advice(username: str, profile: dict, data: dict):
+    """Record recommendations in AdvisorHistory (keeping the 3 newest) and
+    return the user's recent history."""
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.username == username).first()
+        if not user:
+            return []
+        db.add(models.AdvisorHistory(
+            user_id=user.id,
+            created_at=utcnow(),
+            profile_json=json.dumps(profile or {}),
+            recommendations_json=json.dumps(data.get('recommendations') or []),
+        ))
+        db.commit()
+        rows = (
+            db.query(models.AdvisorHistory)
+            .filter(models.AdvisorHistory.user_id == user.id)
+            .order_by(models.AdvisorHistory.created_at.desc())
+            .all()
+        )
+        if len(rows) > 3:
+            for old_row in rows[3:]:
+                db.delete(old_row)
+            db.commit()
+        return get_recent_advisor_history(user.id, db)
+    finally:
+        db.close()
+
+
+def read_advice_cache(key: str):
+    db = SessionLocal()
+    try:
+        return advisor.cached_answer(db, key)
+    finally:
+        db.close()
+
+
+def write_advice_cache(key: str, model_name: str, text: str):
+    db = SessionLocal()
+    try:
+        advisor.store_answer(db, key, model_name, text)
+    except Exception as e:
+        # the answer is still returned; it just is not cached
+        logging.warning('Could not cache advisor answer: %s', e)
+    finally:
+        db.close()
+
+
+def update_advisor_job(job_id: str, **changes):
+    job = advisor_jobs.get(job_id)
+    if job is not None:
+        advisor_jobs.set(job_id, dict(job, **changes))
+
+
+def run_advisor_job(job_id: str, client, username: str, prompt: str, profile: dict):
+    """Advisor thread body of a queued /gemini/advise request.
+
+    ``client.generate`` passes the advisor deadline to the model, so a stuck
+    call ends as a failed job instead of holding its pool slot.
+    """
+    def fail(detail):
+        logging.error("Advisor job %s failed: %s", job_id, detail)
+        metrics.increment('advisor_jobs_failed')
+        update_advisor_job(job_id, status='failed', finished_at=utcnow().isoformat(), error=detail)
+
+    update_advisor_job(job_id, status='running', started_at=utcnow().isoformat())
+    try:
+        key = advisor.cache_key(prompt, profile, client.model_name)
+        response_text = read_advice_cache(key)
+        cached = response_text is not None
+        metrics.increment('advisor_cache_lookups')
+        metrics.increment('advisor_cache_hits' if cached else 'advisor_cache_misses')
+        if not cached:
+            response_text = client.generate(prompt)
+        if not response_text:
+            return fail("No response from Gemini API")
+        data = advisor.parse_recommendations(response_text)
+        if not cached and data is not None:
+            write_advice_cache(key, client.model_name, response_text)
+        if data is None:
+            data = {'recommendations': [], 'raw_response': response_text}
+        else:
+            data['history'] = save_advice(username, profile, data)
+    except advisor.AdvisorTimeout as e:
+        metrics.increment('advisor_jobs_timed_out')
+        return fail(str(e))
+    except advisor.AdvisorUnavailable as e:
+        return fail(str(e))
+    except json.JSONDecodeError as e:
+        return fail(f"Failed to parse Gemini response: {str(e)}")
+    except Exception as e:
+        return fail(f"Gemini API error: {str(e)}")
+    data['cached'] = cached
+    update_advisor_job(job_id, status='done', finished_at=utcnow().isoformat(), result=data)
+
+
+def enqueue_advisor_job(client, username: str, prompt: str, profile: dict):
+    """Queue an advisor request on the client's bounded pool; 503 when full."""
+    job_id = uuid.uuid4().hex
+    advisor_jobs.set(job_id, {
+        'id': job_id,
+        'username': username,
+        'status': 'queued',
+        'created_at': utcnow().isoformat(),
+    })
+    try:
+        client.submit(run_advisor_job, job_id, client, username, prompt, profile)
+    except advisor.AdvisorBusy as e:
+        advisor_jobs.invalidate(job_id)
+        raise HTTPException(status_code=503, detail=str(e))
+    metrics.increment('advisor_jobs_submitted')
+    return JSONResponse(
+        status_code=202,
+        content={'job_id': job_id, 'status': 'queued'},
+        headers={'Location': f'/advisor/jobs/{job_id}'},
+    )
+
+
+@app.get('/advisor/jobs/{job_id}')
+def advisor_job(job_id: str, username: str = Depends(require_auth)):
+    """State of a queued advisor request: queued, running, done (with
+    ``result``) or failed (with ``error``)."""
+    job = advisor_jobs.get(job_id)
+    if job is None or job['username'] != username:
+        raise HTTPException(status_code=404, detail='Job not found')
+    return {k: v for k, v in job.items() if k != 'username'}
+
+
 @app.post("/gemini/advise")
-def gemini_advise(request: dict, username: str = Depends(require_auth), db: Session = Depends(get_db)):
-    """Call Gemini API for investment advisor recommendations."""
+async def gemini_advise(request: dict, username: str = Depends(require_auth)):
+    """Call Gemini API for investment advisor recommendations.
+
+    The model call runs on the advisor client's own threads with a deadline
+    (504 when exceeded, 503 when every slot and queue position is taken), so it
+    never holds a request worker. Identical prompt/profile/model requests are
+    answered from the advisor cache; ``cached`` tells which. With
+    ``"async": true`` the request is queued instead and 202 returns a job id
+    to poll at /advisor/jobs/{id}.
+    """
+    prompt = request.get('prompt')
+    profile = request.get('profile') or {}
+    if not prompt:
+        raise HTTPException(status_code=400, detail="Prompt is required")
+    client = get_advisor()
+    if request.get('async'):
+        return enqueue_advisor_job(client, username, prompt, profile)
+    key = advisor.cache_key(prompt, profile, client.model_name)
+    response_text = await run_in_threadpool(read_advice_cache, key)
+    cached = response_text is not None
+    metrics.increment('advisor_cache_lookups')
+    metrics.increment('advisor_cache_hits' if cached else 'advisor_cache_misses')
     try:
-        prompt = request.get('prompt')
-        profile = request.get('profile') or {}
-        if not prompt:
-            raise HTTPException(status_code=400, detail="Prompt is required")
-        
-        # Get Gemini API key from environment
-        api_key = os.environ.get('GEMINI_API_KEY')
-        if not api_key:
-            raise HTTPException(status_code=500, detail="Gemini API key not configured")
-        
-        import google.generativeai as genai
-        genai.configure(api_key=api_key)
-        
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
-        response = model.generate_content(prompt)
-        
-        if not response or not response.text:
+        if not cached:
+            response_text = await client.advise(prompt)
+        if not response_text:
             raise HTTPException(status_code=500, detail="No response from Gemini API")
-        
-        # Parse the response as JSON
-        response_text = response.text
-        
-        # Try to extract JSON from the response
-        json_start = response_text.find('{')
-        json_end = response_text.rfind('}') + 1
-        
-        if json_start == -1 or json_end == 0:
+        data = advisor.parse_recommendations(response_text)
+        if not cached and data is not None:
+            await run_in_threadpool(write_advice_cache, key, client.model_name, response_text)
+        if data is None:
             # If no JSON found, return the raw text
             return {
                 "recommendations": [],
-                "raw_response": response_text
+                "raw_response": response_text,
+                "cached": cached,
             }
-        
-        json_str = response_text[json_start:json_end]
-        data = json.loads(json_str)
-        recs = data.get('recommendations') if isinstance(data, dict) else None
-        if isinstance(recs, list):
-            for rec in recs:
-                if isinstance(rec, dict) and 'symbol' not in rec and 'ticker' in rec:
-                    rec['symbol'] = rec.get('ticker')
-
-        user = db.query(models.User).filter(models.User.username == username).first()
-        if user:
-            history = models.AdvisorHistory(
-                user_id=user.id,
-                created_at=utcnow(),
-                profile_json=json.dumps(profile or {}),
-                recommendations_json=json.dumps(data.get('recommendations') or []),
-            )
-            db.add(history)
-            db.commit()
-            # Keep only the 3 most recent rows
-            rows = (
-                db.query(models.AdvisorHistory)
-                .filter(models.AdvisorHistory.user_id == user.id)
-                .order_by(models.AdvisorHistory.created_at.desc())
-                .all()
-            )
-            if len(rows) > 3:
-                for old_row in rows[3:]:
-                    db.delete(old_row)
-                db.commit()
-        data['history'] = get_recent_advisor_history(user.id, db) if user else []
-        return data
+    except HTTPException:
+        raise
+    except advisor.AdvisorBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except advisor.AdvisorTimeout as e:
+        logging.warning("Gemini API timeout: %s", e)
+        raise HTTPException(status_code=504, detail=str(e))
+    except advisor.AdvisorUnavailable as e:
+        logging.error("Gemini advisor unavailable: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
     except json.JSONDecodeError as e:
         logging.error("JSON parse error: %s", str(e))
         raise HTTPException(status_code=500, detail=f"Failed to parse Gemini response: {str(e)}")
-    except ImportError:
-        logging.error("google-generativeai not installed")
-        raise HTTPException(status_code=500, detail="Gemini API library not installed. Run: pip install google-generativeai")
     except Exception as e:
         logging.error("Gemini API error: %s", str(e))
-        raise HTTPException(status_code=500, detail=f"Gemini API error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Gemini API error: {str(e)}")
+    data['history'] = await run_in_threadpool(save_advice, username, profile, data)
+    data['cached'] = cached
+    return data
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/gemini/advise/stream")
+async def gemini_advise_stream(request: dict, username: str = Depends(require_auth)):
+    """Server-sent events version of /gemini/advise.
+
+    ``token`` events carry answer text as the model produces it, then one
+    ``recommendations`` event carries the same body /gemini/advise returns,
+    or an ``error`` event carries ``status`` and ``detail``. 503 is returned
+    before the stream starts when the advisor is saturated.
+    """
+    prompt = request.get('prompt')
+    profile = request.get('profile') or {}
+    if not prompt:
+        raise HTTPException(status_code=400, detail="Prompt is required")
+    client = get_advisor()
+    key = advisor.cache_key(prompt, profile, client.model_name)
+    cached_text = await run_in_threadpool(read_advice_cache, key)
+    cached = cached_text is not None
+    metrics.increment('advisor_cache_lookups')
+    metrics.increment('advisor_cache_hits' if cached else 'advisor_cache_misses')
+    if cached:
+        async def replay():
+            yield cached_text
+        chunks = replay()
+    else:
+        try:
+            chunks = client.stream(prompt)
+        except advisor.AdvisorBusy as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
+    async def events():
+        scanner = advisor.JSONObjectScanner()
+        parts = []
+        try:
+            async for chunk in chunks:
+                parts.append(chunk)
+                scanner.feed(chunk)
+                yield sse_event('token', {'text': chunk})
+        except advisor.AdvisorTimeout as e:
+            logging.warning("Gemini API timeout: %s", e)
+            yield sse_event('error', {'status': 504, 'detail': str(e)})
+            return
+        except advisor.AdvisorUnavailable as e:
+            logging.error("Gemini advisor unavailable: %s", e)
+            yield sse_event('error', {'status': 500, 'detail': str(e)})
+            return
+        except Exception as e:
+            logging.error("Gemini API error: %s", str(e))
+            yield sse_event('error', {'status': 500, 'detail': f"Gemini API error: {str(e)}"})
+            return
+        response_text = ''.join(parts)
+        if not response_text:
+            yield sse_event('error', {'status': 500, 'detail': "No response from Gemini API"})
+            return
+        data = scanner.data
+        if data is None:
+            try:
+                data = advisor.parse_recommendations(response_text)
+            except json.JSONDecodeError as e:
+                logging.error("JSON parse error: %s", str(e))
+                yield sse_event('error', {'status': 500, 'detail': f"Failed to parse Gemini response: {str(e)}"})
+                return
+        if not cached and data is not None:
+            await run_in_threadpool(write_advice_cache, key, client.model_name, response_text)
+        if data is None:
+            yield sse_event('recommendations', {'recommendations': [], 'raw_response': response_text, 'cached': cached})
+            return
+        data['history'] = await run_in_threadpool(save_advice, username, profile, data)
+        data['cached'] = cached
+        yield sse_event('recommendations', data)
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
@@ -0,0 +1,138 @@
+"""Parquet (Arrow) import and export.
+
+pyarrow is optional and imported only when a Parquet request arrives;
+``require_pyarrow`` raises ``ArrowUnavailable`` when it is not installed.
+Exports are written in row groups of ``EXPORT_BATCH_SIZE`` rows with typed
+columns (float64 quantities and prices, UTC timestamps), so clients can read
+them straight into pandas with ``pd.read_parquet``. The file is spooled to
+disk past ``EXPORT_SPOOL_MAX_BYTES`` and then streamed in chunks, so only one
+row group is held in memory.
+"""
+import tempfile
+from itertools import islice
+
+from . import csv_import
+
+EXPORT_BATCH_SIZE = 10000
+EXPORT_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+EXPORT_CHUNK_SIZE = 65536
+PARQUET_MEDIA_TYPE = 'application/vnd.apache.parquet'
+
+# (column, arrow type name); 'timestamp' is microseconds in UTC
+HOLDING_FIELDS = (
+    ('symbol', 'string'),
+    ('quantity', 'float64'),
+    ('avgcost', 'float64'),
+    ('curprice', 'float64'),
+    ('lasttransactiondate', 'string'),
+    ('last_transaction_at', 'timestamp'),
+)
+TRANSACTION_FIELDS = (
+    ('id', 'int64'),
+    ('portfolio_id', 'int64'),
+    ('symbol', 'string'),
+    ('transaction_type', 'string'),
+    ('quantity', 'float64'),
+    ('price', 'float64'),
+    ('total_amount', 'float64'),
+    ('created_at', 'timestamp'),
+    ('notes', 'string'),
+)
+AUDIT_FIELDS = (
+    ('id', 'int64'),
+    ('action', 'string'),
+    ('resource', 'string'),
+    ('status', 'string'),
+    ('created_at', 'timestamp'),
+    ('details', 'string'),
+)
+
+
+class ArrowUnavailable(RuntimeError):
+    """pyarrow is not installed."""
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ArrowUnavailable('Parquet support requires pyarrow (pip install pyarrow)')
+    return pyarrow, pyarrow.parquet
+
+
+def arrow_schema(fields):
+    pa, _ = require_pyarrow()
+    types = {
+        'string': pa.string(),
+        'float64': pa.float64(),
+        'int64': pa.int64(),
+        'timestamp': pa.timestamp('us', tz='UTC'),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in fields])
+
+
+def write_parquet(rows, fields, sink, batch_size=EXPORT_BATCH_SIZE):
+    """Write an iterable of tuples (in ``fields`` order) to ``sink`` as Parquet,
+    one row group per ``batch_size`` rows."""
+    pa, pq = require_pyarrow()
+    schema = arrow_schema(fields)
+    rows = iter(rows)
+    with pq.ParquetWriter(sink, schema, compression='zstd') as writer:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            columns = list(zip(*batch))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema,
+            ))
+
+
+def spool_parquet(rows, fields, batch_size=EXPORT_BATCH_SIZE, max_size=EXPORT_SPOOL_MAX_BYTES):
+    """Parquet file of ``rows`` in a rewound ``SpooledTemporaryFile``; the caller closes it.
+
+    Parquet needs its footer before it can be read, so the file is finished
+    before streaming; past ``max_size`` bytes it lives on disk, not in memory.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=max_size)
+    try:
+        write_parquet(rows, fields, spool, batch_size)
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+
+def iter_file(handle, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield ``handle`` in chunks and close it."""
+    with handle:
+        while True:
+            chunk = handle.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def iter_holding_batches(source, batch_size=csv_import.IMPORT_BATCH_SIZE):
+    """Yield ``(records, errors)`` from a Parquet file object, like the CSV importer.
+
+    Columns are matched by name with the CSV rules; ``line`` in errors counts
+    data rows from 2 as if the file had a header line.
+    """
+    _, pq = require_pyarrow()
+    parquet = pq.ParquetFile(source)
+    header = parquet.schema_arrow.names
+    parse = csv_import.compile_schema(header)
+
+    def numbered():
+        line = 1
+        for batch in parquet.iter_batches(batch_size=batch_size):
+            columns = [batch.column(i).to_pylist() for i in range(batch.num_columns)]
+            for values in zip(*columns):
+                line += 1
+                yield line, ['' if v is None else str(v) for v in values]
+
+    yield from csv_import.batch_records(numbered(), parse, batch_size)
@@ -0,0 +1,113 @@
+"""Benchmark response encoding and compression on synthetic read payloads.
+
+Serves each payload from FastAPI routes through ``TestClient``: once as a
+plain return value (``jsonable_encoder`` then ``JSONResponse``) and once via
+``fast_json`` as the read endpoints do (``FastJSONResponse``, orjson when
+installed, no encoder pass). Also reports bytes on the wire uncompressed,
+gzipped and, when the ``brotli`` package is installed, brotli-compressed.
+
+    python -m project.bench_serialization [--rows 5000] [--repeat 20]
+"""
+import argparse
+import datetime
+import gzip
+import os
+import time
+
+os.environ.setdefault('FINNHUB_API_KEY', 'benchmark')
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from .api import fast_json, orjson
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def transactions_payload(rows):
+    start = datetime.datetime(2024, 1, 1)
+    return [
+        {
+            'id': i,
+            'symbol': ('AAPL', 'MSFT', 'NVDA', 'GOOG', 'AMZN')[i % 5],
+            'transaction_type': 'buy' if i % 3 else 'sell',
+            'quantity': float(i % 17 + 1),
+            'price': 100.0 + (i % 250) * 0.37,
+            'total_amount': (i % 17 + 1) * (100.0 + (i % 250) * 0.37),
+            'created_at': (start + datetime.timedelta(minutes=i)).isoformat(),
+            'portfolio_id': 1 + i % 4,
+            'notes': None,
+        }
+        for i in range(rows)
+    ]
+
+
+def portfolio_payload(rows):
+    return {
+        'name': 'default',
+        'portfolio': [
+            {
+                'symbol': f'SYM{i}',
+                'quantity': str(float(i % 40 + 1)),
+                'avgcost': str(50.0 + i * 0.01),
+                'curprice': str(55.0 + i * 0.01),
+                'lasttransactiondate': '2025-06-01 10:00:00',
+                'ticker_name': f'Company {i} Inc',
+            }
+            for i in range(rows)
+        ],
+    }
+
+
+def bench_client(payloads):
+    """TestClient for an app serving each payload from ``/std/<name>`` and ``/fast/<name>``."""
+    app = FastAPI()
+
+    def route(payload, wrap):
+        def endpoint():
+            return wrap(payload)
+        return endpoint
+
+    for name, payload in payloads.items():
+        app.get(f'/std/{name}', response_class=JSONResponse)(route(payload, lambda content: content))
+        app.get(f'/fast/{name}')(route(payload, fast_json))
+    return TestClient(app)
+
+
+def time_request(client, path, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = client.get(path).content
+        best = min(best, time.perf_counter() - started)
+    return best, body
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m project.bench_serialization', description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    print(f"orjson: {'yes' if orjson else 'no'}  brotli: {'yes' if brotli else 'no'}  rows: {args.rows}")
+    payloads = {'transactions': transactions_payload(args.rows), 'portfolio': portfolio_payload(args.rows)}
+    client = bench_client(payloads)
+    for name in payloads:
+        std_time, body = time_request(client, f'/std/{name}', args.repeat)
+        fast_time, _ = time_request(client, f'/fast/{name}', args.repeat)
+        sizes = [f'raw {len(body):>9,} B', f'gzip {len(gzip.compress(body, 6)):>8,} B']
+        if brotli:
+            sizes.append(f'br {len(brotli.compress(body, quality=5)):>8,} B')
+        print(
+            f'{name:<13} request std {std_time * 1000:7.2f} ms  fast {fast_time * 1000:7.2f} ms '
+            f'({std_time / fast_time:4.1f}x)  ' + '  '.join(sizes)
+        )
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
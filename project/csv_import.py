@@ -0,0 +1,166 @@
+"""Streaming CSV import of holdings.
+
+The header is compiled once into a list of (column index, converter) steps,
+so each data row is parsed from the plain ``csv.reader`` list without
+building a dict. Rows are yielded in batches ready for a multi-row
+``insert(models.Holding)``; rows that fail validation are reported with
+their line number instead of aborting the import.
+
+Accepted columns: ``symbol`` (or ``ticker``), ``quantity``, and optionally
+``avgcost`` (or ``totalcost``, divided by quantity), ``curprice`` and
+``lasttransactiondate``. Header names are case-insensitive.
+"""
+import csv
+import datetime
+import math
+
+IMPORT_BATCH_SIZE = 1000
+# accepted besides ISO 8601 in ``lasttransactiondate``
+TIMESTAMP_FORMATS = ('%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M', '%m/%d/%Y', '%Y/%m/%d')
+
+
+class SchemaError(ValueError):
+    """The header cannot be mapped onto the holdings schema."""
+
+
+def _text(value):
+    return value.strip()
+
+
+def _symbol(value):
+    value = value.strip().upper()
+    if not value:
+        raise ValueError('symbol is empty')
+    return value
+
+
+def _quantity(value):
+    value = float(value) if value.strip() else 0.0
+    if not math.isfinite(value):
+        raise ValueError('quantity must be a finite number')
+    if value < 0:
+        raise ValueError('quantity must not be negative')
+    return value
+
+
+def _optional_float(value):
+    value = value.strip()
+    if not value:
+        return None
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError('prices and costs must be finite numbers')
+    return value
+
+
+# (field, accepted header names, converter, required)
+HOLDING_SCHEMA = (
+    ('symbol', ('symbol', 'ticker'), _symbol, True),
+    ('quantity', ('quantity', 'qty'), _quantity, True),
+    ('avgcost', ('avgcost',), _optional_float, False),
+    ('totalcost', ('totalcost',), _optional_float, False),
+    ('curprice', ('curprice',), _optional_float, False),
+    ('lasttransactiondate', ('lasttransactiondate',), _text, False),
+)
+
+
+def compile_schema(header, schema=HOLDING_SCHEMA):
+    """Return ``parse(values) -> dict`` for rows under ``header``."""
+    index = {name.strip().lower(): i for i, name in enumerate(header)}
+    steps = []
+    missing = []
+    for field, names, convert, required in schema:
+        position = next((index[n] for n in names if n in index), None)
+        if position is None and required:
+            missing.append(field)
+        steps.append((field, position, convert))
+    if missing:
+        raise SchemaError(f"CSV is missing column(s): {', '.join(missing)}")
+
+    def parse(values):
+        width = len(values)
+        return {
+            field: convert(values[position] if position is not None and position < width else '')
+            for field, position, convert in steps
+        }
+
+    return parse
+
+
+def parse_timestamp(value):
+    """Parse a free-form ``lasttransactiondate`` into an aware UTC datetime, or None.
+
+    Naive values are taken to be UTC.
+    """
+    if isinstance(value, datetime.datetime):
+        parsed = value
+    else:
+        value = (value or '').strip()
+        if not value:
+            return None
+        try:
+            parsed = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            for fmt in TIMESTAMP_FORMATS:
+                try:
+                    parsed = datetime.datetime.strptime(value, fmt)
+                    break
+                except ValueError:
+                    continue
+            else:
+                return None
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=datetime.UTC)
+    return parsed.astimezone(datetime.UTC)
+
+
+def holding_record(parsed):
+    """Normalize a parsed row into holdings column values (None for an empty position)."""
+    quantity = parsed['quantity']
+    if quantity <= 0:
+        return None
+    avgcost = parsed['avgcost']
+    if avgcost is None and parsed['totalcost'] is not None:
+        avgcost = parsed['totalcost'] / quantity
+    return {
+        'symbol': parsed['symbol'],
+        'quantity': quantity,
+        'avgcost': avgcost,
+        'curprice': parsed['curprice'],
+        'lasttransactiondate': parsed['lasttransactiondate'],
+        'last_transaction_at': parse_timestamp(parsed['lasttransactiondate']),
+    }
+
+
+def batch_records(numbered_rows, parse, batch_size=IMPORT_BATCH_SIZE):
+    """Yield ``(records, errors)`` batches from ``(line, values)`` pairs.
+
+    ``errors`` are ``{'line', 'error'}`` dicts; blank rows and rows with zero
+    quantity are skipped silently.
+    """
+    records, errors = [], []
+    for line, values in numbered_rows:
+        if not any(v.strip() for v in values):
+            continue
+        try:
+            record = holding_record(parse(values))
+        except ValueError as e:
+            errors.append({'line': line, 'error': str(e)})
+            continue
+        if record is not None:
+            records.append(record)
+        if len(records) >= batch_size:
+            yield records, errors
+            records, errors = [], []
+    if records or errors:
+        yield records, errors
+
+
+def iter_holding_batches(text, batch_size=IMPORT_BATCH_SIZE):
+    """Yield ``(records, errors)`` per batch read from the text stream ``text``."""
+    reader = csv.reader(text)
+    header = next(reader, None)
+    if header is None:
+        raise SchemaError('CSV is empty')
+    parse = compile_schema(header)
+    yield from batch_records(((reader.line_num, values) for values in reader), parse, batch_size)
@@ -0,0 +1,217 @@
+"""Daily portfolio value reconstructed from the transaction ledger.
+
+Positions are rebuilt for every calendar day with one ``cumsum`` over a
+(day x symbol) matrix of signed trade quantities. Ledger snapshots that reset
+positions (CSV loads, portfolio resets) enter the same matrix as correction
+rows, so the curve matches ``ledger.derive_positions`` on each snapshot day.
+
+Prices come from ``daily_prices``; days without a stored close fall back to
+the trade price (or the snapshot average cost) and are forward-filled, so a
+curve is available offline. Value is positions times prices summed per day;
+``net_invested`` accumulates trade cash flows plus positions added or removed
+by snapshots, valued at that day's price.
+"""
+import datetime
+
+import numpy as np
+from sqlalchemy import func
+
+from . import models
+
+EPS = 1e-9
+
+
+def forward_fill(matrix):
+    """Carry the last non-NaN value of each column down the rows."""
+    rows = np.where(np.isnan(matrix), 0, np.arange(matrix.shape[0])[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return matrix[rows, np.arange(matrix.shape[1])]
+
+
+def normalize_symbols(values):
+    """Stripped, upper-cased symbols as a str array; trades keep the case they
+    were typed in while ``daily_prices`` stores upper case."""
+    return np.char.upper(np.char.strip(np.asarray(values, dtype=str)))
+
+
+def normalize_positions(positions):
+    """Ledger-form positions keyed by normalized symbol, summing any duplicates."""
+    merged = {}
+    for sym, pos in positions.items():
+        into = merged.setdefault((sym or '').strip().upper(), {'quantity': 0.0, 'totalcost': 0.0})
+        into['quantity'] += pos['quantity'] or 0.0
+        into['totalcost'] += pos['totalcost'] or 0.0
+    return merged
+
+
+def nav_curve(transactions, snapshots, daily, end):
+    """Compute the daily value curve.
+
+    ``transactions`` is a dict of parallel arrays ``id``, ``symbol``,
+    ``side``, ``quantity``, ``price`` and ``day`` (``datetime64[D]``);
+    ``snapshots`` is a list of ``(last_transaction_id, day, positions)`` with
+    ledger-form positions; ``daily`` holds arrays ``symbol``, ``day`` and
+    ``close``. Returns column arrays ``date``, ``value`` and
+    ``net_invested`` from the first ledger day through ``end``.
+    """
+    snapshots = sorted(
+        ((last_id, day, normalize_positions(positions)) for last_id, day, positions in snapshots),
+        key=lambda s: s[0],
+    )
+    snap_symbols = [sym for _, _, positions in snapshots for sym in positions]
+    t_names = normalize_symbols(transactions['symbol'])
+    symbols = np.unique(np.concatenate([t_names, np.asarray(snap_symbols, dtype=str)]))
+    event_days = np.concatenate([
+        np.asarray(transactions['day'], dtype='datetime64[D]'),
+        np.asarray([day for _, day, _ in snapshots], dtype='datetime64[D]'),
+    ])
+    end = np.datetime64(end, 'D')
+    if not len(event_days) or event_days.min() > end:
+        return {'date': np.array([], dtype='datetime64[D]'), 'value': np.zeros(0), 'net_invested': np.zeros(0)}
+    first = event_days.min()
+    dates = np.arange(first, end + 1)
+    n_days, n_sym = len(dates), len(symbols)
+
+    ids = np.asarray(transactions['id'], dtype=np.int64)
+    keep = np.asarray(transactions['day'], dtype='datetime64[D]') <= end
+    ids = ids[keep]
+    t_sym = np.searchsorted(symbols, t_names[keep])
+    t_day = (np.asarray(transactions['day'], dtype='datetime64[D]')[keep] - first).astype(np.int64)
+    t_price = np.asarray(transactions['price'], dtype=float)[keep]
+    signed = np.where(
+        np.asarray(transactions['side'], dtype=str)[keep] == 'buy', 1.0, -1.0,
+    ) * np.asarray(transactions['quantity'], dtype=float)[keep]
+
+    deltas = np.zeros((n_days, n_sym))
+    np.add.at(deltas, (t_day, t_sym), signed)
+    flows = np.bincount(t_day, weights=signed * t_price, minlength=n_days)
+
+    prices = np.full((n_days, n_sym), np.nan)
+    order = np.argsort(ids, kind='stable')
+    prices[t_day[order], t_sym[order]] = t_price[order]
+
+    corrections = []
+    applied = np.zeros(n_sym)
+    for last_id, day, positions in snapshots:
+        row = int((np.datetime64(day, 'D') - first).astype(np.int64))
+        if row >= n_days:
+            continue
+        through = np.bincount(t_sym[ids <= last_id], weights=signed[ids <= last_id], minlength=n_sym)
+        target = np.zeros(n_sym)
+        for sym, pos in positions.items():
+            col = np.searchsorted(symbols, sym)
+            target[col] = pos['quantity']
+            if pos['quantity'] and np.isnan(prices[row, col]):
+                prices[row, col] = pos['totalcost'] / pos['quantity']
+        correction = target - through - applied
+        correction[np.abs(correction) < EPS] = 0.0
+        deltas[row] += correction
+        applied += correction
+        corrections.append((row, correction))
+
+    # stored closes win over trade prices on the same day
+    d_names = normalize_symbols(daily['symbol'])
+    d_sym = np.minimum(np.searchsorted(symbols, d_names), max(n_sym - 1, 0))
+    d_day = (np.asarray(daily['day'], dtype='datetime64[D]') - first).astype(np.int64)
+    use = (d_day >= 0) & (d_day < n_days) & (symbols[d_sym] == d_names) if n_sym else d_day < 0
+    prices[d_day[use], d_sym[use]] = np.asarray(daily['close'], dtype=float)[use]
+    prices = forward_fill(prices)
+
+    for row, correction in corrections:
+        flows[row] += np.nansum(correction * prices[row])
+
+    positions = np.cumsum(deltas, axis=0)
+    positions[np.abs(positions) < EPS] = 0.0
+    value = np.nansum(np.where(positions != 0.0, positions * prices, 0.0), axis=1)
+    return {'date': dates, 'value': value, 'net_invested': np.cumsum(flows)}
+
+
+def load_inputs(db, portfolio_id, end):
+    """Read the ledger, retained snapshots and stored closes for one portfolio."""
+    rows = (
+        db.query(models.Transaction.id, models.Transaction.symbol, models.Transaction.transaction_type,
+                 models.Transaction.quantity, models.Transaction.price, models.Transaction.created_at)
+        .filter(models.Transaction.portfolio_id == portfolio_id)
+        .order_by(models.Transaction.id)
+        .all()
+    )
+    transactions = {
+        'id': [r[0] for r in rows],
+        'symbol': [(r[1] or '').strip().upper() for r in rows],
+        'side': [r[2] for r in rows],
+        'quantity': [r[3] for r in rows],
+        'price': [r[4] for r in rows],
+        'day': np.array([r[5].date() if r[5] else end for r in rows], dtype='datetime64[D]'),
+    }
+    snapshots = [
+        (s.last_transaction_id, s.created_at.date() if s.created_at else end,
+         normalize_positions({p.symbol: {'quantity': p.quantity, 'totalcost': p.totalcost} for p in s.positions}))
+        for s in (
+            db.query(models.LedgerSnapshot)
+            .filter(models.LedgerSnapshot.portfolio_id == portfolio_id)
+            .order_by(models.LedgerSnapshot.id)
+            .all()
+        )
+    ]
+    symbols = set(transactions['symbol']) | {sym for _, _, positions in snapshots for sym in positions}
+    closes = []
+    if symbols:
+        closes = (
+            db.query(models.DailyPrice.symbol, models.DailyPrice.date, models.DailyPrice.close)
+            .filter(models.DailyPrice.symbol.in_(symbols), models.DailyPrice.date <= end)
+            .all()
+        )
+    daily = {
+        'symbol': [c[0] for c in closes],
+        'day': np.array([c[1] for c in closes], dtype='datetime64[D]'),
+        'close': [c[2] for c in closes],
+    }
+    return transactions, snapshots, daily
+
+
+def cache_stamp(db, portfolio_id, end):
+    """Cheap fingerprint of everything a portfolio's curve depends on."""
+    last_txn = (
+        db.query(func.max(models.Transaction.id))
+        .filter(models.Transaction.portfolio_id == portfolio_id)
+        .scalar()
+    )
+    last_snapshot = (
+        db.query(func.max(models.LedgerSnapshot.id))
+        .filter(models.LedgerSnapshot.portfolio_id == portfolio_id)
+        .scalar()
+    )
+    # max(updated_at) catches closes overwritten in place, which leave count and max(id) alone
+    prices = db.query(
+        func.count(models.DailyPrice.id), func.max(models.DailyPrice.id), func.max(models.DailyPrice.updated_at)
+    ).one()
+    return (last_txn, last_snapshot, tuple(prices), end)
+
+
+def portfolio_history(db, portfolio_id, start=None, end=None, cache=None):
+    """Daily value curve of a portfolio from ``start`` through ``end`` (default today).
+
+    With ``cache`` (an ``LRUCache``) the full curve is reused until the
+    ledger, its snapshots or the stored closes change.
+    """
+    end = end or datetime.date.today()
+    stamp = cache_stamp(db, portfolio_id, end) if cache is not None else None
+    hit = cache.get(portfolio_id) if cache is not None else None
+    if hit is not None and hit[0] == stamp:
+        curve = hit[1]
+    else:
+        curve = nav_curve(*load_inputs(db, portfolio_id, end), end)
+        if cache is not None:
+            cache.set(portfolio_id, (stamp, curve))
+    if start is not None:
+        keep = curve['date'] >= np.datetime64(start, 'D')
+        curve = {key: values[keep] for key, values in curve.items()}
+    return curve
+
+
+def points(curve):
+    """Curve columns as a list of ``{'date', 'value', 'net_invested'}`` dicts."""
+    return [
+        {'date': str(d), 'value': v, 'net_invested': n}
+        for d, v, n in zip(curve['date'], curve['value'].tolist(), curve['net_invested'].tolist())
+    ]
@@ -0,0 +1,330 @@
+"""Ledger-derived positions.
+
+Holdings are maintained by mutation on every trade, while ``transactions``
+records each buy and sell. This module rebuilds positions from that ledger
+using the same total-cost arithmetic as ``buy_ticker``/``sell_ticker``:
+a buy adds ``quantity * price`` to the total cost, a sell subtracts it, and a
+position that reaches zero quantity is closed.
+
+Replaying everything is avoided with periodic per-portfolio snapshots: current
+positions are the latest snapshot plus the transactions recorded after it.
+
+Run ``python -m project.ledger reconcile`` to list holdings that diverge from
+the ledger.
+"""
+import argparse
+import logging
+import os
+import sys
+
+from sqlalchemy import func, select
+
+from .db import SessionLocal
+from . import models
+
+LEDGER_SNAPSHOT_INTERVAL = int(os.environ.get('LEDGER_SNAPSHOT_INTERVAL', '100'))
+LEDGER_SNAPSHOTS_KEPT = int(os.environ.get('LEDGER_SNAPSHOTS_KEPT', '2'))
+QUANTITY_TOLERANCE = 1e-6
+
+
+def apply_transaction(positions, symbol, side, quantity, price):
+    """Fold one ledger entry into ``positions`` ({symbol: {'quantity', 'totalcost'}})."""
+    pos = positions.setdefault(symbol, {'quantity': 0.0, 'totalcost': 0.0})
+    amount = quantity * price
+    if side == 'buy':
+        pos['quantity'] += quantity
+        pos['totalcost'] = round(pos['totalcost'] + amount, 2)
+    else:
+        pos['quantity'] -= quantity
+        pos['totalcost'] = round(pos['totalcost'] - amount, 2)
+    if abs(pos['quantity']) < QUANTITY_TOLERANCE:
+        del positions[symbol]
+    return positions
+
+
+def replay(transactions, positions=None):
+    """Apply transactions (ordered by id) on top of ``positions``."""
+    positions = {} if positions is None else positions
+    for t in transactions:
+        apply_transaction(positions, t.symbol, t.transaction_type, t.quantity, t.price)
+    return positions
+
+
+def latest_snapshot(db, portfolio_id):
+    return (
+        db.query(models.LedgerSnapshot)
+        .filter(models.LedgerSnapshot.portfolio_id == portfolio_id)
+        .order_by(models.LedgerSnapshot.id.desc())
+        .first()
+    )
+
+
+def latest_baseline(db, portfolio_id):
+    """Newest snapshot that replaced the positions; ledger rows up to it no longer apply."""
+    return (
+        db.query(models.LedgerSnapshot)
+        .filter(models.LedgerSnapshot.portfolio_id == portfolio_id, models.LedgerSnapshot.baseline.is_(True))
+        .order_by(models.LedgerSnapshot.id.desc())
+        .first()
+    )
+
+
+def snapshot_positions(snapshot):
+    if snapshot is None:
+        return {}
+    return {p.symbol: {'quantity': p.quantity, 'totalcost': p.totalcost} for p in snapshot.positions}
+
+
+def derive_positions(db, portfolio_id):
+    """Rebuild current positions as latest snapshot plus the ledger tail.
+
+    Returns ``(positions, last_transaction_id, tail_length)``.
+    """
+    snapshot = latest_snapshot(db, portfolio_id)
+    positions = snapshot_positions(snapshot)
+    last_id = snapshot.last_transaction_id if snapshot else 0
+    tail = (
+        db.query(models.Transaction)
+        .filter(models.Transaction.portfolio_id == portfolio_id, models.Transaction.id > last_id)
+        .order_by(models.Transaction.id)
+        .all()
+    )
+    replay(tail, positions)
+    if tail:
+        last_id = tail[-1].id
+    return positions, last_id, len(tail)
+
+
+def last_transaction_id(db, portfolio_id):
+    value = (
+        db.query(func.max(models.Transaction.id))
+        .filter(models.Transaction.portfolio_id == portfolio_id)
+        .scalar()
+    )
+    return value or 0
+
+
+def take_snapshot(db, portfolio_id, positions=None, last_id=None):
+    """Stage a snapshot; the caller commits.
+
+    Without ``positions`` the snapshot is derived from the ledger. Pass the
+    current holdings (with ``last_id`` set to the newest ledger row) to
+    record them as the new baseline, e.g. after a CSV load or a reset.
+    """
+    baseline = positions is not None
+    if positions is None:
+        positions, last_id, _ = derive_positions(db, portfolio_id)
+    elif last_id is None:
+        last_id = last_transaction_id(db, portfolio_id)
+    snapshot = models.LedgerSnapshot(portfolio_id=portfolio_id, last_transaction_id=last_id, baseline=baseline)
+    for symbol, pos in positions.items():
+        snapshot.positions.append(models.LedgerSnapshotPosition(
+            symbol=symbol, quantity=pos['quantity'], totalcost=pos['totalcost'],
+        ))
+    db.add(snapshot)
+    prune_snapshots(db, portfolio_id)
+    return snapshot
+
+
+def prune_snapshots(db, portfolio_id, keep=LEDGER_SNAPSHOTS_KEPT):
+    """Drop all but the ``keep`` newest persisted snapshots of a portfolio.
+
+    The newest baseline is always kept, since tax lots are matched from it.
+    """
+    baseline = latest_baseline(db, portfolio_id)
+    old = (
+        db.query(models.LedgerSnapshot)
+        .filter(models.LedgerSnapshot.portfolio_id == portfolio_id)
+        .order_by(models.LedgerSnapshot.id.desc())
+        .offset(max(keep - 1, 0))
+        .all()
+    )
+    for snapshot in old:
+        if baseline is None or snapshot.id != baseline.id:
+            db.delete(snapshot)
+
+
+def holdings_positions(holdings):
+    """Positions in ledger form from Holding rows.
+
+    Several lot rows of one symbol (as CSV loads allow) are summed, like the
+    baseline ``load_portfolio`` records.
+    """
+    positions = {}
+    for h in holdings:
+        if not h.quantity or h.quantity <= 0:
+            continue
+        pos = positions.setdefault(h.symbol, {'quantity': 0.0, 'totalcost': 0.0})
+        pos['quantity'] += h.quantity
+        pos['totalcost'] += (h.avgcost or 0.0) * h.quantity
+    return positions
+
+
+def snapshot_if_due(portfolio_id, interval=None):
+    """Snapshot a portfolio once its ledger tail reaches ``interval`` rows.
+
+    Opens its own session so it can run as a background task after a trade.
+    """
+    interval = LEDGER_SNAPSHOT_INTERVAL if interval is None else interval
+    db = SessionLocal()
+    try:
+        snapshot = latest_snapshot(db, portfolio_id)
+        last_id = snapshot.last_transaction_id if snapshot else 0
+        tail_length = (
+            db.query(func.count(models.Transaction.id))
+            .filter(models.Transaction.portfolio_id == portfolio_id, models.Transaction.id > last_id)
+            .scalar()
+        )
+        if tail_length >= interval:
+            take_snapshot(db, portfolio_id)
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        logging.error('Ledger snapshot failed for portfolio %s: %s', portfolio_id, e)
+    finally:
+        db.close()
+
+
+def compare_positions(portfolio_id, holdings, ledger, tolerance=0.01):
+    """List per-symbol differences between holdings and ledger positions."""
+    divergences = []
+    for symbol in sorted(set(holdings) | set(ledger)):
+        h = holdings.get(symbol, {'quantity': 0.0, 'totalcost': 0.0})
+        l = ledger.get(symbol, {'quantity': 0.0, 'totalcost': 0.0})
+        h_avg = h['totalcost'] / h['quantity'] if h['quantity'] else None
+        l_avg = l['totalcost'] / l['quantity'] if l['quantity'] else None
+        qty_diff = abs(h['quantity'] - l['quantity']) > QUANTITY_TOLERANCE
+        avg_diff = (h_avg is None) != (l_avg is None) or (
+            h_avg is not None and abs(h_avg - l_avg) > tolerance
+        )
+        if qty_diff or avg_diff:
+            divergences.append({
+                'portfolio_id': portfolio_id,
+                'symbol': symbol,
+                'holding_quantity': h['quantity'],
+                'ledger_quantity': l['quantity'],
+                'holding_avgcost': h_avg,
+                'ledger_avgcost': l_avg,
+            })
+    return divergences
+
+
+def reconcile(db, batch_size=500, tolerance=0.01):
+    """Yield divergences between ``holdings`` and the ledger for every portfolio.
+
+    Portfolios are walked in id order ``batch_size`` at a time; each batch costs
+    a fixed number of queries (holdings, latest snapshots, their positions and
+    the ledger tails) regardless of how many portfolios it holds.
+    """
+    after_id = 0
+    while True:
+        ids = [
+            row[0] for row in
+            db.query(models.Portfolio.id)
+            .filter(models.Portfolio.id > after_id)
+            .order_by(models.Portfolio.id)
+            .limit(batch_size)
+            .all()
+        ]
+        if not ids:
+            return
+        after_id = ids[-1]
+
+        holdings = {pid: [] for pid in ids}
+        for h in db.query(models.Holding).filter(models.Holding.portfolio_id.in_(ids)).all():
+            holdings[h.portfolio_id].append(h)
+
+        latest_ids = (
+            select(func.max(models.LedgerSnapshot.id))
+            .where(models.LedgerSnapshot.portfolio_id.in_(ids))
+            .group_by(models.LedgerSnapshot.portfolio_id)
+        )
+        snapshots = {
+            s.portfolio_id: s
+            for s in db.query(models.LedgerSnapshot).filter(models.LedgerSnapshot.id.in_(latest_ids)).all()
+        }
+        ledger = {pid: {} for pid in ids}
+        last_ids = {pid: 0 for pid in ids}
+        snapshot_owner = {s.id: s.portfolio_id for s in snapshots.values()}
+        for s in snapshots.values():
+            last_ids[s.portfolio_id] = s.last_transaction_id
+        if snapshot_owner:
+            for p in (
+                db.query(models.LedgerSnapshotPosition)
+                .filter(models.LedgerSnapshotPosition.snapshot_id.in_(list(snapshot_owner)))
+                .all()
+            ):
+                ledger[snapshot_owner[p.snapshot_id]][p.symbol] = {'quantity': p.quantity, 'totalcost': p.totalcost}
+
+        tail = (
+            db.query(models.Transaction)
+            .filter(
+                models.Transaction.portfolio_id.in_(ids),
+                models.Transaction.id > min(last_ids.values()),
+            )
+            .order_by(models.Transaction.id)
+            .yield_per(1000)
+        )
+        for t in tail:
+            if t.id > last_ids[t.portfolio_id]:
+                apply_transaction(ledger[t.portfolio_id], t.symbol, t.transaction_type, t.quantity, t.price)
+
+        for pid in ids:
+            yield from compare_positions(pid, holdings_positions(holdings[pid]), ledger[pid], tolerance)
+        db.expunge_all()
+
+
+def _snapshot_all(db, from_holdings=False, batch_size=500):
+    count = 0
+    after_id = 0
+    while True:
+        portfolios = (
+            db.query(models.Portfolio)
+            .filter(models.Portfolio.id > after_id)
+            .order_by(models.Portfolio.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not portfolios:
+            return count
+        after_id = portfolios[-1].id
+        for p in portfolios:
+            positions = holdings_positions(p.holdings) if from_holdings else None
+            take_snapshot(db, p.id, positions=positions)
+            count += 1
+        db.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m project.ledger', description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+    rec = sub.add_parser('reconcile', help='report holdings that diverge from the transaction ledger')
+    rec.add_argument('--batch-size', type=int, default=500)
+    rec.add_argument('--tolerance', type=float, default=0.01, help='allowed avgcost difference')
+    snap = sub.add_parser('snapshot', help='snapshot every portfolio')
+    snap.add_argument('--from-holdings', action='store_true',
+                      help='record current holdings as the baseline instead of the ledger-derived positions')
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        if args.command == 'snapshot':
+            count = _snapshot_all(db, from_holdings=args.from_holdings)
+            print(f'Snapshotted {count} portfolios')
+            return 0
+        found = 0
+        for d in reconcile(db, batch_size=args.batch_size, tolerance=args.tolerance):
+            found += 1
+            print(
+                f"portfolio={d['portfolio_id']} symbol={d['symbol']} "
+                f"holdings={d['holding_quantity']}@{d['holding_avgcost']} "
+                f"ledger={d['ledger_quantity']}@{d['ledger_avgcost']}"
+            )
+        print(f'{found} divergent positions')
+        return 1 if found else 0
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,246 @@
+"""Tax-lot matching over the ``transactions`` ledger.
+
+Every buy opens a lot; sells close lots either first-in-first-out or
+last-in-first-out. The result lists open lots with their unrealized P&L and
+every closed (buy, sell) pair with its realized P&L and holding period.
+
+FIFO is computed without a per-transaction loop: within each symbol, buys
+and sells are laid out as consecutive intervals on the cumulative-quantity
+axis, and the overlap of a buy interval with a sell interval is exactly the
+quantity that sell takes from that lot. All symbols share one axis (each
+gets its own band), so a whole ledger is matched with a handful of
+``cumsum``/``searchsorted`` calls. LIFO depends on which buys exist at the
+time of each sell, so it walks the ledger once with a per-symbol stack.
+
+Positions recorded by a baseline snapshot (a reset or CSV load) enter as
+opening lots with transaction id 0. Sells of quantity that no earlier buy or
+opening lot covers are reported as unmatched rather than being charged
+against later buys.
+"""
+import numpy as np
+
+METHODS = ('fifo', 'lifo')
+SECONDS_PER_DAY = 86400.0
+EPS = 1e-9
+
+
+def _group_starts(groups):
+    return np.r_[0, np.flatnonzero(np.diff(groups)) + 1]
+
+
+def _group_cumsum(values, groups):
+    """Inclusive cumulative sum restarting at each run of ``groups`` (sorted)."""
+    if not len(values):
+        return values.astype(float)
+    total = np.cumsum(values)
+    starts = _group_starts(groups)
+    lengths = np.diff(np.r_[starts, len(values)])
+    return total - np.repeat(total[starts] - values[starts], lengths)
+
+
+def _group_shift(values, groups):
+    """Previous value within each group, 0 at the first row of a group."""
+    shifted = np.r_[0.0, values[:-1]]
+    shifted[_group_starts(groups)] = 0.0
+    return shifted
+
+
+def _uncovered_sells(groups, buy_qty, sell_qty):
+    """Per-row sell quantity not covered by buys earlier in the same symbol.
+
+    With D = cumulative sells - cumulative buys, the quantity sold short up to
+    a row is the running maximum of max(D, 0); each sell adds its increment.
+    """
+    deficit = _group_cumsum(sell_qty, groups) - _group_cumsum(buy_qty, groups)
+    # offset each group so a plain running maximum restarts per group
+    scale = 2.0 * (np.abs(deficit).max() if len(deficit) else 0.0) + 1.0
+    offset = groups * scale
+    running = np.maximum.accumulate(deficit + offset) - offset
+    short = np.maximum(running, 0.0)
+    return short - _group_shift(short, groups)
+
+
+def _fifo(groups, is_buy, quantity):
+    buy_qty = np.where(is_buy, quantity, 0.0)
+    sell_qty = np.where(is_buy, 0.0, quantity)
+    unmatched = _uncovered_sells(groups, buy_qty, sell_qty)
+    matched = sell_qty - unmatched
+
+    n_groups = int(groups.max()) + 1 if len(groups) else 0
+    band_width = np.bincount(groups, weights=buy_qty, minlength=n_groups)
+    band_start = np.cumsum(band_width) - band_width
+
+    buy_rows = np.flatnonzero(is_buy & (quantity > EPS))
+    sell_rows = np.flatnonzero(matched > EPS)
+    buy_end = _group_cumsum(buy_qty, groups)[buy_rows] + band_start[groups[buy_rows]]
+    buy_start = buy_end - quantity[buy_rows]
+    sell_end = _group_cumsum(matched, groups)[sell_rows] + band_start[groups[sell_rows]]
+    sell_start = sell_end - matched[sell_rows]
+
+    edges = np.unique(np.concatenate([buy_start, buy_end, sell_start, sell_end]))
+    lo, hi = edges[:-1], edges[1:]
+    keep = (hi - lo) > EPS
+    lo, hi = lo[keep], hi[keep]
+    mid = (lo + hi) / 2.0
+    length = hi - lo
+
+    bi = np.searchsorted(buy_end, mid, side='right')
+    covered = bi < len(buy_rows)
+    bi, mid, length = bi[covered], mid[covered], length[covered]
+    si = np.searchsorted(sell_end, mid, side='right')
+    sold = si < len(sell_rows)
+    sold[sold] = sell_start[si[sold]] <= mid[sold]
+
+    remaining = np.zeros(len(quantity))
+    remaining[buy_rows] = np.bincount(bi[~sold], weights=length[~sold], minlength=len(buy_rows))
+    return buy_rows[bi[sold]], sell_rows[si[sold]], length[sold], remaining, unmatched
+
+
+def _lifo(groups, is_buy, quantity):
+    remaining = np.where(is_buy, quantity, 0.0)
+    unmatched = np.zeros(len(quantity))
+    stacks = {}
+    buys, sells, sizes = [], [], []
+    for row in range(len(quantity)):
+        stack = stacks.setdefault(groups[row], [])
+        if is_buy[row]:
+            stack.append(row)
+            continue
+        need = quantity[row]
+        while need > EPS and stack:
+            lot = stack[-1]
+            take = min(need, remaining[lot])
+            buys.append(lot)
+            sells.append(row)
+            sizes.append(take)
+            remaining[lot] -= take
+            need -= take
+            if remaining[lot] <= EPS:
+                stack.pop()
+        unmatched[row] = max(need, 0.0)
+    return (
+        np.asarray(buys, dtype=int), np.asarray(sells, dtype=int),
+        np.asarray(sizes, dtype=float), remaining, unmatched,
+    )
+
+
+def match_lots(ids, symbols, sides, quantities, prices, timestamps, method='fifo',
+               as_of=None, current_prices=None, opening=None, opened_at=0.0):
+    """Match a ledger into lots.
+
+    ``ids``/``symbols``/``sides``/``quantities``/``prices``/``timestamps`` are
+    parallel sequences (timestamps as epoch seconds); rows are processed in
+    ``ids`` order. ``opening`` holds ledger-form positions (``quantity``,
+    ``totalcost``) of a baseline taken at ``opened_at``, matched before every
+    row. Symbols are compared stripped and upper-cased, and
+    ``current_prices`` maps those to a price for unrealized P&L.
+
+    Returns a dict of column arrays under ``open``, ``realized`` and
+    ``unmatched``.
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}")
+    opening = {sym: pos for sym, pos in (opening or {}).items() if pos['quantity'] > EPS}
+    n_open = len(opening)
+    ids = np.concatenate([np.zeros(n_open, dtype=np.int64), np.asarray(ids, dtype=np.int64)])
+    symbols = np.concatenate([np.asarray(list(opening), dtype=str), np.asarray(symbols, dtype=str)])
+    sides = np.concatenate([np.full(n_open, 'buy'), np.asarray(sides, dtype=str)])
+    quantities = np.concatenate([
+        np.array([pos['quantity'] for pos in opening.values()], dtype=float), np.asarray(quantities, dtype=float),
+    ])
+    prices = np.concatenate([
+        np.array([pos['totalcost'] / pos['quantity'] for pos in opening.values()], dtype=float),
+        np.asarray(prices, dtype=float),
+    ])
+    timestamps = np.concatenate([np.full(n_open, float(opened_at)), np.asarray(timestamps, dtype=float)])
+
+    order = np.argsort(ids, kind='stable')
+    symbols = np.char.upper(np.char.strip(symbols))
+    names, codes = np.unique(symbols[order], return_inverse=True)
+    # group rows by symbol, keeping ledger order within a symbol
+    by_symbol = np.argsort(codes, kind='stable')
+    order, codes = order[by_symbol], codes[by_symbol]
+    ids = ids[order]
+    is_buy = np.asarray(sides, dtype=str)[order] == 'buy'
+    quantity = np.asarray(quantities, dtype=float)[order]
+    price = np.asarray(prices, dtype=float)[order]
+    ts = np.asarray(timestamps, dtype=float)[order]
+
+    if len(ids):
+        engine = _fifo if method == 'fifo' else _lifo
+        buy_rows, sell_rows, matched_qty, remaining, unmatched = engine(codes, is_buy, quantity)
+    else:
+        buy_rows = sell_rows = np.array([], dtype=int)
+        matched_qty = remaining = unmatched = np.array([], dtype=float)
+    if as_of is None:
+        as_of = ts.max() if len(ts) else 0.0
+
+    open_rows = np.flatnonzero(remaining > EPS)
+    open_qty = remaining[open_rows]
+    current_prices = current_prices or {}
+    current = np.array([
+        np.nan if current_prices.get(name) is None else current_prices[name] for name in names
+    ], dtype=float)
+    open_current = current[codes[open_rows]]
+    short_rows = np.flatnonzero(unmatched > EPS)
+    return {
+        'open': {
+            'transaction_id': ids[open_rows],
+            'symbol': names[codes[open_rows]],
+            'opened_at': ts[open_rows],
+            'quantity': open_qty,
+            'cost_price': price[open_rows],
+            'cost_basis': open_qty * price[open_rows],
+            'current_price': open_current,
+            'market_value': open_qty * open_current,
+            'unrealized_pnl': open_qty * (open_current - price[open_rows]),
+            'holding_days': (as_of - ts[open_rows]) / SECONDS_PER_DAY,
+        },
+        'realized': {
+            'buy_transaction_id': ids[buy_rows],
+            'sell_transaction_id': ids[sell_rows],
+            'symbol': names[codes[buy_rows]],
+            'opened_at': ts[buy_rows],
+            'closed_at': ts[sell_rows],
+            'quantity': matched_qty,
+            'cost_price': price[buy_rows],
+            'sale_price': price[sell_rows],
+            'realized_pnl': matched_qty * (price[sell_rows] - price[buy_rows]),
+            'holding_days': (ts[sell_rows] - ts[buy_rows]) / SECONDS_PER_DAY,
+        },
+        'unmatched': {
+            'transaction_id': ids[short_rows],
+            'symbol': names[codes[short_rows]],
+            'quantity': unmatched[short_rows],
+        },
+    }
+
+
+def summarize(report):
+    """Totals per symbol and overall from a ``match_lots`` report."""
+    open_, realized = report['open'], report['realized']
+    names = np.unique(np.concatenate([open_['symbol'], realized['symbol']]).astype(str))
+    open_idx = np.searchsorted(names, open_['symbol'].astype(str))
+    real_idx = np.searchsorted(names, realized['symbol'].astype(str))
+    size = len(names)
+    per_symbol = {
+        'symbol': names,
+        'open_quantity': np.bincount(open_idx, weights=open_['quantity'], minlength=size),
+        'cost_basis': np.bincount(open_idx, weights=open_['cost_basis'], minlength=size),
+        'market_value': np.bincount(open_idx, weights=np.nan_to_num(open_['market_value']), minlength=size),
+        'unrealized_pnl': np.bincount(open_idx, weights=np.nan_to_num(open_['unrealized_pnl']), minlength=size),
+        'realized_pnl': np.bincount(real_idx, weights=realized['realized_pnl'], minlength=size),
+    }
+    totals = {key: float(values.sum()) for key, values in per_symbol.items() if key != 'symbol'}
+    del totals['open_quantity']
+    return per_symbol, totals
+
+
+def columns_to_records(columns):
+    """Turn a dict of equal-length arrays into a list of JSON-safe dicts (NaN -> None)."""
+    keys = list(columns)
+    values = [
+        [None if isinstance(v, float) and v != v else v for v in np.asarray(columns[k]).tolist()]
+        for k in keys
+    ]
+    return [dict(zip(keys, row)) for row in zip(*values)]
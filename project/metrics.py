@@ -0,0 +1,30 @@
+"""Process-local counters for operational metrics (served at ``GET /metrics``).
+
+Counters live in memory, so each worker process reports its own values.
+"""
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+
+
+def increment(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def get(name):
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot():
+    with _lock:
+        return dict(_counters)
+
+
+def rate(numerator, denominator):
+    """Ratio of two counters, 0.0 when the denominator is still zero."""
+    with _lock:
+        total = _counters.get(denominator, 0)
+        return _counters.get(numerator, 0) / total if total else 0.0
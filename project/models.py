@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Date, Float, Text, Boolean, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from .db import Base
 import datetime
@@ -23,6 +23,7 @@ class Portfolio(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    version = Column(Integer, nullable=False, default=0)  # bumped on every holdings change (optimistic locking)
 
     owner = relationship('User', back_populates='portfolios')
     holdings = relationship('Holding', back_populates='portfolio', cascade='all, delete-orphan')
@@ -36,10 +37,19 @@ class Holding(Base):
     avgcost = Column(Float, nullable=True)
     curprice = Column(Float, nullable=True)
     lasttransactiondate = Column(String, nullable=True)
+    # parsed lasttransactiondate (UTC) so ordering happens in SQL
+    last_transaction_at = Column(DateTime, nullable=True)
     raw = Column(Text, nullable=True)
 
     portfolio = relationship('Portfolio', back_populates='holdings')
 
+    __table_args__ = (
+        # trades locate a single row by (portfolio_id, symbol)
+        Index('ix_holdings_portfolio_symbol', 'portfolio_id', 'symbol'),
+        # portfolio listings are newest activity first
+        Index('ix_holdings_portfolio_last_transaction_at', 'portfolio_id', 'last_transaction_at'),
+    )
+
 class SessionToken(Base):
     __tablename__ = 'session_tokens'
     id = Column(Integer, primary_key=True, index=True)
@@ -75,6 +85,15 @@ class AdvisorHistory(Base):
 
     user = relationship('User')
 
+class AdvisorCache(Base):
+    """Model answers keyed by a hash of the normalized prompt, profile and model name."""
+    __tablename__ = 'advisor_cache'
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String(64), unique=True, index=True, nullable=False)
+    model = Column(String, nullable=False)
+    response_text = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=utcnow, index=True)
+
 class AuditLog(Base):
     __tablename__ = 'audit_logs'
     id = Column(Integer, primary_key=True, index=True)
@@ -102,3 +121,34 @@ class Transaction(Base):
 
     user = relationship('User')
     portfolio = relationship('Portfolio')
+
+class LedgerSnapshot(Base):
+    __tablename__ = 'ledger_snapshots'
+    id = Column(Integer, primary_key=True, index=True)
+    portfolio_id = Column(Integer, ForeignKey('portfolios.id'), nullable=False, index=True)
+    last_transaction_id = Column(Integer, nullable=False, default=0)  # ledger rows folded into this snapshot
+    created_at = Column(DateTime, nullable=False, default=utcnow)
+    # positions were replaced (reset, CSV load) rather than derived; earlier ledger rows no longer apply
+    baseline = Column(Boolean, nullable=False, default=False)
+
+    positions = relationship('LedgerSnapshotPosition', back_populates='snapshot', cascade='all, delete-orphan')
+
+class LedgerSnapshotPosition(Base):
+    __tablename__ = 'ledger_snapshot_positions'
+    id = Column(Integer, primary_key=True, index=True)
+    snapshot_id = Column(Integer, ForeignKey('ledger_snapshots.id'), nullable=False, index=True)
+    symbol = Column(String, nullable=False)
+    quantity = Column(Float, nullable=False)
+    totalcost = Column(Float, nullable=False, default=0.0)
+
+    snapshot = relationship('LedgerSnapshot', back_populates='positions')
+
+class DailyPrice(Base):
+    __tablename__ = 'daily_prices'
+    __table_args__ = (UniqueConstraint('symbol', 'date', name='uq_daily_prices_symbol_date'),)
+    id = Column(Integer, primary_key=True, index=True)
+    symbol = Column(String, nullable=False, index=True)
+    date = Column(Date, nullable=False)
+    close = Column(Float, nullable=False)
+    # bumped on every insert or overwrite so caches can see changed closes
+    updated_at = Column(DateTime, nullable=True, default=utcnow, index=True)
@@ -1,4 +1,11 @@
-import csv, os, time, pandas, requests
+import csv, datetime, io, os, time, requests
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .csv_import import parse_timestamp
+except ImportError:
+    # run as a script from project/ (project.py)
+    from csv_import import parse_timestamp
 
 _PRICE_UNSET = object()
 _SYMBOLS_CACHE = {}
@@ -34,6 +41,89 @@ def retrieve_portfolio(infile):
         raise OSError("Input file could not be read")
 
 
+PORTFOLIO_FIELDS = ["ticker", "quantity", "totalcost", "lasttransactiondate"]
+
+
+def _normalize_row(r):
+    """Map a holdings row onto PORTFOLIO_FIELDS."""
+    rr = {}
+    # ticker/symbol compatibility
+    rr['ticker'] = r.get('ticker') or r.get('symbol') or ''
+    rr['quantity'] = r.get('quantity') or r.get('qty') or ''
+    # totalcost may come from totalcost or avgcost/curprice
+    if 'totalcost' in r and r.get('totalcost') != '':
+        rr['totalcost'] = r.get('totalcost')
+    elif 'avgcost' in r and r.get('avgcost') != '' and rr['quantity']:
+        try:
+            rr['totalcost'] = str(round(float(rr['quantity']) * float(r.get('avgcost')), 2))
+        except Exception:
+            rr['totalcost'] = ''
+    elif 'curprice' in r and r.get('curprice') != '' and rr['quantity']:
+        try:
+            rr['totalcost'] = str(round(float(rr['quantity']) * float(r.get('curprice')), 2))
+        except Exception:
+            rr['totalcost'] = ''
+    else:
+        rr['totalcost'] = r.get('totalcost','')
+    rr['lasttransactiondate'] = r.get('lasttransactiondate','')
+    return rr
+
+
+# Yield a saved portfolio (csv) one normalized holding at a time, without loading the file
+def iter_portfolio(infile):
+    if check_file_is_csv(infile) == False:
+        raise Exception("Not a CSV file")
+    try:
+        with open(infile, newline="") as rfile:
+            for row in csv.DictReader(rfile):
+                yield _normalize_row(row)
+    except FileNotFoundError:
+        raise FileNotFoundError("Input file does not exist")
+    except OSError:
+        raise OSError("Input file could not be read")
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+# Keep holdings for the given tickers and/or with at least min_quantity, lazily
+def filter_portfolio(holdings, tickers=None, min_quantity=None):
+    wanted = {t.strip().upper() for t in tickers} if tickers else None
+    for r in holdings:
+        if wanted is not None and r['ticker'].strip().upper() not in wanted:
+            continue
+        if min_quantity is not None and _to_float(r['quantity']) < min_quantity:
+            continue
+        yield r
+
+
+# Total quantity and cost per ticker; memory grows with distinct tickers, not rows
+def aggregate_portfolio(holdings):
+    totals = {}
+    for r in holdings:
+        entry = totals.setdefault(r['ticker'].strip().upper(), {'quantity': 0.0, 'totalcost': 0.0, 'rows': 0})
+        entry['quantity'] += _to_float(r['quantity'])
+        entry['totalcost'] += _to_float(r['totalcost'])
+        entry['rows'] += 1
+    return totals
+
+
+_OLDEST = datetime.datetime.min.replace(tzinfo=datetime.UTC)
+
+
+def _utcnow_iso():
+    return datetime.datetime.now(datetime.UTC).isoformat()
+
+
+def _recency_key(row):
+    stamp = parse_timestamp(row.get('lasttransactiondate'))
+    return (stamp is not None, stamp or _OLDEST)
+
+
 # Write a portfolio in memory into a flat file
 def write_portfolio(holdingslist, outfile):
     try:
@@ -44,39 +134,12 @@ def write_portfolio(holdingslist, outfile):
                 raise ValueError("Not a CSV file")
             else:
                 with open(outfile, 'w', newline='') as wfile:
-                    fieldnames = ["ticker", "quantity", "totalcost", "lasttransactiondate"]
-                    writer = csv.DictWriter(wfile, fieldnames=fieldnames)
+                    writer = csv.DictWriter(wfile, fieldnames=PORTFOLIO_FIELDS)
                     writer.writeheader()
                     # normalize rows to expected fields
-                    norm_rows = []
-                    for r in holdingslist:
-                        rr = {}
-                        # ticker/symbol compatibility
-                        rr['ticker'] = r.get('ticker') or r.get('symbol') or ''
-                        rr['quantity'] = r.get('quantity') or r.get('qty') or ''
-                        # totalcost may come from totalcost or avgcost/curprice
-                        if 'totalcost' in r and r.get('totalcost') != '':
-                            rr['totalcost'] = r.get('totalcost')
-                        elif 'avgcost' in r and r.get('avgcost') != '' and rr['quantity']:
-                            try:
-                                rr['totalcost'] = str(round(float(rr['quantity']) * float(r.get('avgcost')), 2))
-                            except Exception:
-                                rr['totalcost'] = ''
-                        elif 'curprice' in r and r.get('curprice') != '' and rr['quantity']:
-                            try:
-                                rr['totalcost'] = str(round(float(rr['quantity']) * float(r.get('curprice')), 2))
-                            except Exception:
-                                rr['totalcost'] = ''
-                        else:
-                            rr['totalcost'] = r.get('totalcost','')
-                        rr['lasttransactiondate'] = r.get('lasttransactiondate','')
-                        norm_rows.append(rr)
-                    # sort by lasttransactiondate descending (newest first) if available
-                    try:
-                        sorted_rows = sorted(norm_rows, key=lambda r: pandas.to_datetime(r.get('lasttransactiondate')), reverse=True)
-                    except Exception:
-                        sorted_rows = norm_rows
-                    writer.writerows(sorted_rows)
+                    norm_rows = [_normalize_row(r) for r in holdingslist]
+                    # sort by lasttransactiondate descending (newest first); undated rows last
+                    writer.writerows(sorted(norm_rows, key=_recency_key, reverse=True))
                 count = len(holdingslist)
                 return f"Portfolio written successfully! Wrote {count} records to {outfile}"
     except FileNotFoundError:
@@ -85,6 +148,36 @@ def write_portfolio(holdingslist, outfile):
         raise OSError("Output file could not be written")
 
 
+# Yield a portfolio as CSV text, header first, one line per holding
+def iter_portfolio_csv(holdings):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=PORTFOLIO_FIELDS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    for r in holdings:
+        buffer.seek(0)
+        buffer.truncate(0)
+        writer.writerow(_normalize_row(r))
+        yield buffer.getvalue()
+
+
+# Write holdings from any iterable (e.g. a generator) row by row, in the order given
+def stream_portfolio(holdings, outfile):
+    if check_file_is_csv(outfile) == False:
+        raise ValueError("Not a CSV file")
+    try:
+        count = -1  # the header is the first chunk
+        with open(outfile, 'w', newline='') as wfile:
+            for chunk in iter_portfolio_csv(holdings):
+                wfile.write(chunk)
+                count += 1
+        return f"Portfolio written successfully! Wrote {count} records to {outfile}"
+    except FileNotFoundError:
+        raise FileNotFoundError("Output file not found")
+    except OSError:
+        raise OSError("Output file could not be written")
+
+
 def _compute_totalcost(rowdict, quantity):
     if rowdict.get('totalcost') not in (None, ''):
         try:
@@ -139,7 +232,7 @@ def sell_ticker(holdingslist, symbol, amt, price=_PRICE_UNSET):
                     rowdict["totalcost"] = round(existing_totalcost - (amt_int * tickerprice), 2)
                     rowdict["curprice"] = tickerprice
                     # record UTC timestamp for the transaction
-                    rowdict["lasttransactiondate"] = pandas.Timestamp.now(tz='UTC').isoformat()
+                    rowdict["lasttransactiondate"] = _utcnow_iso()
                     subtracted = True
                     break
         if not subtracted:
@@ -181,12 +274,12 @@ def buy_ticker(holdingslist, symbol, amt, price=_PRICE_UNSET):
                 rowdict["totalcost"] = round(existing_totalcost + (amt_int * tickerprice), 2)
                 rowdict["curprice"] = tickerprice
                 # record UTC timestamp for the transaction
-                rowdict["lasttransactiondate"] = pandas.Timestamp.now(tz='UTC').isoformat()
+                rowdict["lasttransactiondate"] = _utcnow_iso()
                 added = True
                 break
         if not added:
             # use UTC ISO timestamp for transaction time
-            utcnow = pandas.Timestamp.now(tz='UTC').isoformat()
+            utcnow = _utcnow_iso()
             rowdict = {"ticker": symbol, "quantity": amt_int, "totalcost": round((amt_int * tickerprice), 2), "curprice": tickerprice, "lasttransactiondate": utcnow}
             holdingslist.append(rowdict)
         return holdingslist, f"Transaction completed successfully! Bought {amt_int} shares of {symbol} at ${tickerprice} each."
@@ -194,6 +287,45 @@ def buy_ticker(holdingslist, symbol, amt, price=_PRICE_UNSET):
         raise e
 
 
+# Read a trades file: csv with side (B/S or buy/sell), ticker and quantity columns
+def read_trades(infile):
+    if check_file_is_csv(infile) == False:
+        raise ValueError("Not a CSV file")
+    trades = []
+    try:
+        with open(infile, newline="") as rfile:
+            for line, row in enumerate(csv.DictReader(rfile), start=2):
+                row = {(k or '').strip().lower(): (v or '').strip() for k, v in row.items()}
+                if not any(row.values()):
+                    continue
+                side = row.get('side', '').upper()
+                if side not in ('B', 'S', 'BUY', 'SELL'):
+                    raise ValueError(f"Line {line}: side must be B or S")
+                ticker = (row.get('ticker') or row.get('symbol') or '').upper()
+                if not ticker:
+                    raise ValueError(f"Line {line}: ticker is missing")
+                trades.append({'line': line, 'side': side[0], 'ticker': ticker, 'quantity': row.get('quantity', '')})
+    except FileNotFoundError:
+        raise FileNotFoundError("Trades file does not exist")
+    except OSError:
+        raise OSError("Trades file could not be read")
+    return trades
+
+
+# Apply trades in order at already resolved prices; a failed trade is reported and leaves the holdings untouched
+def apply_trades(holdingslist, trades, prices):
+    results = []
+    for t in trades:
+        price = prices.get(t['ticker'])
+        trade = buy_ticker if t['side'] == 'B' else sell_ticker
+        try:
+            holdingslist, message = trade(holdingslist, t['ticker'], t['quantity'], price=price)
+            results.append(dict(t, ok=True, price=price, message=message))
+        except Exception as e:
+            results.append(dict(t, ok=False, price=price, message=str(e)))
+    return holdingslist, results
+
+
 def check_file_is_csv(filename):
     if not filename.lower().endswith('.csv'):
         return False
@@ -219,6 +351,15 @@ def get_ticker_price(symbol):
         return None
 
 
+def get_ticker_prices(symbols, max_workers=8):
+    """Look up several tickers concurrently; returns {symbol: price or None}."""
+    unique = list(dict.fromkeys(s for s in symbols if s))
+    if not unique:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique)))) as pool:
+        return dict(zip(unique, pool.map(get_ticker_price, unique)))
+
+
 def _extract_profile_name(data):
     if not isinstance(data, dict):
         return None
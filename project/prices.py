@@ -0,0 +1,105 @@
+"""Import daily closes into ``daily_prices``.
+
+The CSV needs ``symbol``, ``date`` (YYYY-MM-DD) and ``close`` columns; an
+existing (symbol, date) row is overwritten. Run
+``python -m project.prices import closes.csv`` or upload the file to
+``POST /prices/daily/load``.
+"""
+import argparse
+import csv
+import datetime
+import sys
+
+from .db import SessionLocal
+from . import models
+
+IMPORT_BATCH_SIZE = 1000
+REQUIRED_COLUMNS = ('symbol', 'date', 'close')
+
+
+def parse_rows(reader):
+    """Validate CSV rows into ``(symbol, date, close)`` tuples.
+
+    Returns ``(rows, errors)`` where errors are ``{'line', 'error'}`` dicts.
+    """
+    missing = [c for c in REQUIRED_COLUMNS if c not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"CSV is missing column(s): {', '.join(missing)}")
+    rows, errors = [], []
+    for line, row in enumerate(reader, start=2):
+        try:
+            symbol = (row['symbol'] or '').strip().upper()
+            if not symbol:
+                raise ValueError('symbol is empty')
+            day = datetime.date.fromisoformat((row['date'] or '').strip())
+            close = float(row['close'])
+            if close <= 0:
+                raise ValueError('close must be positive')
+        except (TypeError, ValueError) as e:
+            errors.append({'line': line, 'error': str(e)})
+            continue
+        rows.append((symbol, day, close))
+    return rows, errors
+
+
+def upsert_daily_prices(db, rows, batch_size=IMPORT_BATCH_SIZE):
+    """Insert or overwrite closes in batches; the caller commits. Returns the row count."""
+    latest = {(symbol, day): close for symbol, day, close in rows}
+    items = list(latest.items())
+    for i in range(0, len(items), batch_size):
+        batch = dict(items[i:i + batch_size])
+        symbols = {symbol for symbol, _ in batch}
+        days = [day for _, day in batch]
+        existing = (
+            db.query(models.DailyPrice)
+            .filter(
+                models.DailyPrice.symbol.in_(symbols),
+                models.DailyPrice.date >= min(days),
+                models.DailyPrice.date <= max(days),
+            )
+            .all()
+        )
+        now = models.utcnow()
+        for price in existing:
+            key = (price.symbol, price.date)
+            if key in batch:
+                close = batch.pop(key)
+                if price.close != close:
+                    price.close = close
+                    price.updated_at = now
+        db.add_all([
+            models.DailyPrice(symbol=symbol, date=day, close=close, updated_at=now)
+            for (symbol, day), close in batch.items()
+        ])
+        db.flush()
+    return len(items)
+
+
+def import_csv(db, handle):
+    """Parse and upsert a CSV file object; returns ``(imported, errors)``."""
+    rows, errors = parse_rows(csv.DictReader(handle))
+    return upsert_daily_prices(db, rows), errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m project.prices', description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+    imp = sub.add_parser('import', help='import daily closes from a CSV file')
+    imp.add_argument('path')
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        with open(args.path, newline='', encoding='utf-8') as handle:
+            imported, errors = import_csv(db, handle)
+        db.commit()
+        for e in errors:
+            print(f"line {e['line']}: {e['error']}")
+        print(f'Imported {imported} closes ({len(errors)} rows skipped)')
+        return 1 if errors else 0
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,73 @@
+import argparse
+import functools
 import sys
-from portfolio_manager import retrieve_portfolio, write_portfolio, buy_ticker, sell_ticker, get_ticker_price
+from portfolio_manager import retrieve_portfolio, iter_portfolio, filter_portfolio, aggregate_portfolio, write_portfolio, buy_ticker, sell_ticker, get_ticker_prices, read_trades, apply_trades
+from quote_cache import QUOTE_CACHE_PATH, QUOTE_CACHE_TTL_SECONDS, cached_prices
 
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Portfolio Management Tool. Runs interactively unless --trades is given.")
+    parser.add_argument("--trades", help="CSV of trades to apply in batch (columns: side, ticker, quantity)")
+    parser.add_argument("--portfolio", help="portfolio CSV the trades are applied to")
+    parser.add_argument("--output", help="where to write the result (default: --portfolio)")
+    parser.add_argument("--dry-run", action="store_true", help="show what would happen without writing")
+    parser.add_argument("--workers", type=int, default=16, help="concurrent price lookups (default: 16)")
+    parser.add_argument("--quote-cache", default=QUOTE_CACHE_PATH, help=f"SQLite quote cache file (default: {QUOTE_CACHE_PATH})")
+    parser.add_argument("--ttl", type=int, default=QUOTE_CACHE_TTL_SECONDS, help=f"seconds a cached quote stays fresh (default: {QUOTE_CACHE_TTL_SECONDS})")
+    parser.add_argument("--offline", action="store_true", help="trade against cached quotes only, never call FinnHub")
+    args = parser.parse_args(argv)
+    if args.trades and not args.portfolio:
+        parser.error("--trades requires --portfolio")
+    return args
+
+
+# Prices for several tickers through the quote cache file
+def quote_prices(args, symbols):
+    fetch = functools.partial(get_ticker_prices, max_workers=args.workers)
+    return cached_prices(symbols, fetch, path=args.quote_cache, ttl_seconds=args.ttl, offline=args.offline)
+
+
+# Apply a whole trades file at once: one concurrent price pass, then all trades in memory
+def run_batch(args):
+    holdingslist, message = retrieve_portfolio(args.portfolio)
+    print(f">> {message}")
+    trades = read_trades(args.trades)
+    prices = quote_prices(args, [t["ticker"] for t in trades])
+    holdingslist, results = apply_trades(holdingslist, trades, prices)
+    bought = sold = 0.0
+    failed = 0
+    for r in results:
+        if r["ok"]:
+            amount = float(r["quantity"]) * r["price"]
+            if r["side"] == "B":
+                bought += amount
+            else:
+                sold += amount
+            print(f"line {r['line']}: {r['message']}")
+        else:
+            failed += 1
+            print(f"line {r['line']}: FAILED {r['side']} {r['quantity']} {r['ticker']}: {r['message']}")
+    print(f">> {len(results)} trades: {len(results) - failed} ok, {failed} failed; bought ${bought:,.2f}, sold ${sold:,.2f}")
+    if args.dry_run:
+        print(">> Dry run: portfolio not written")
+        return 1 if failed else 0
+    if failed:
+        # all or nothing, so a partly applied rebalance is never saved
+        print(">> Portfolio not written because some trades failed")
+        return 1
+    print(f">> {write_portfolio(holdingslist, args.output or args.portfolio)}")
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.trades:
+        try:
+            sys.exit(run_batch(args))
+        except Exception as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+
     print("======================================================")
     print("Welcome to Portfolio Management Tool 1.0")
     print("Enter \"R\" to retrieve a portfolio from a saved file")
@@ -10,6 +75,8 @@ def main():
     print("Enter \"B\" to buy a ticker with quantity and add that into the current portfolio")
     print("Enter \"S\" to sell a ticker with quantity from the current portfolio")
     print("Enter \"P\" to display the current portfolio content")
+    print("Enter \"T\" to show totals by ticker of a saved file without loading it")
+    print("Enter \"F\" to list the holdings of given tickers in a saved file without loading it")
     print("Press \"Ctrl-C\" to exit the program")
     print("======================================================")
 
@@ -29,6 +96,20 @@ def main():
                     resultlist, message = retrieve_portfolio(infile)
                     print(f">> {message}")
                     holdingslist = resultlist
+                case "T":
+                    infile = input("Please specify the portfolio file name (in CSV): ")
+                    totals = aggregate_portfolio(iter_portfolio(infile))
+                    for ticker, entry in sorted(totals.items()):
+                        print(f"{ticker}: quantity {entry['quantity']:g}, totalcost {entry['totalcost']:.2f} ({entry['rows']} rows)")
+                    print(f">> {len(totals)} tickers")
+                case "F":
+                    infile = input("Please specify the portfolio file name (in CSV): ")
+                    tickers = [t for t in input("Please enter the tickers, separated by \",\": ").split(",") if t.strip()]
+                    count = 0
+                    for item in filter_portfolio(iter_portfolio(infile), tickers=tickers):
+                        print(item)
+                        count += 1
+                    print(f">> {count} matching holdings")
                 case "W":
                     outfile = input("Please specify the portfolio file name (in CSV): ")
                     message = write_portfolio(holdingslist, outfile)
@@ -36,24 +117,24 @@ def main():
                 case "B":
                     symbol, amt = input("Please enter the ticker, followed by \",\", and the desired quantity: ").upper().split(",")
                     amt = amt.strip()
-                    tickerprice = get_ticker_price(symbol)
+                    tickerprice = quote_prices(args, [symbol])[symbol]
                     if tickerprice is None:
                         print(f"Error: Unable to fetch current price for {symbol}")
                         continue
                     response = input(f"{symbol} is currently trading at ${tickerprice}. Do you want to proceed (y/n)? ")
                     if response.lower() == "y":
-                        holdingslist, message = buy_ticker(holdingslist, symbol, amt)
+                        holdingslist, message = buy_ticker(holdingslist, symbol, amt, price=tickerprice)
                         print(f">> {message}")
                 case "S":
                     symbol, amt = input("Please enter the ticker, followed by \",\", and the desired quantity: ").upper().split(",")
                     amt = amt.strip()
-                    tickerprice = get_ticker_price(symbol)
+                    tickerprice = quote_prices(args, [symbol])[symbol]
                     if tickerprice is None:
                         print(f"Error: Unable to fetch current price for {symbol}")
                         continue
                     response = input(f"{symbol} is currently trading at ${tickerprice}. Do you want to proceed (y/n)? ")
                     if response.lower() == "y":
-                        holdingslist, message = sell_ticker(holdingslist, symbol, amt)
+                        holdingslist, message = sell_ticker(holdingslist, symbol, amt, price=tickerprice)
                         print(f">> {message}")
         except (EOFError, KeyboardInterrupt):
             # Ctrl-C for exiting the program
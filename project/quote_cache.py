@@ -0,0 +1,98 @@
+"""Persistent quote cache for the command line tool.
+
+Quotes are kept in a small SQLite file using the same ``price_cache`` table
+as ``models.PriceCache`` (symbol, price, updated_at in UTC), so the file can
+also be the API database itself. Only the standard library is used, so the
+CLI keeps working without the API dependencies installed.
+"""
+import datetime
+import os
+import sqlite3
+
+QUOTE_CACHE_PATH = os.path.expanduser(os.environ.get('QUOTE_CACHE_PATH', '~/.gunners_quotes.db'))
+QUOTE_CACHE_TTL_SECONDS = int(os.environ.get('QUOTE_CACHE_TTL_SECONDS', '600'))
+
+# mirrors models.PriceCache
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS price_cache ('
+    'id INTEGER NOT NULL PRIMARY KEY, symbol VARCHAR NOT NULL, price FLOAT, updated_at DATETIME)',
+    'CREATE INDEX IF NOT EXISTS ix_price_cache_id ON price_cache (id)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS ix_price_cache_symbol ON price_cache (symbol)',
+)
+
+
+def _utcnow():
+    return datetime.datetime.now(datetime.UTC)
+
+
+def connect(path=QUOTE_CACHE_PATH):
+    conn = sqlite3.connect(os.path.expanduser(path))
+    for statement in SCHEMA:
+        conn.execute(statement)
+    return conn
+
+
+def load_quotes(conn, symbols):
+    """Cached ``{symbol: (price, updated_at)}`` for the symbols that have a row."""
+    symbols = list(dict.fromkeys(symbols))
+    quotes = {}
+    # stay below SQLite's bound-parameter limit
+    for start in range(0, len(symbols), 500):
+        chunk = symbols[start:start + 500]
+        rows = conn.execute(
+            f"SELECT symbol, price, updated_at FROM price_cache WHERE symbol IN ({','.join('?' * len(chunk))})",
+            chunk,
+        )
+        for symbol, price, updated_at in rows:
+            stamp = datetime.datetime.fromisoformat(updated_at) if updated_at else None
+            if stamp is not None and stamp.tzinfo is None:
+                stamp = stamp.replace(tzinfo=datetime.UTC)
+            quotes[symbol] = (price, stamp)
+    return quotes
+
+
+def store_quotes(conn, prices, now=None):
+    """Upsert ``{symbol: price}``; symbols without a price are not stored."""
+    # same naive-UTC text format SQLAlchemy writes for the API's DateTime columns
+    stamp = (now or _utcnow()).astimezone(datetime.UTC).replace(tzinfo=None).isoformat(' ', 'microseconds')
+    with conn:
+        conn.executemany(
+            'INSERT INTO price_cache (symbol, price, updated_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(symbol) DO UPDATE SET price = excluded.price, updated_at = excluded.updated_at',
+            [(symbol, price, stamp) for symbol, price in prices.items() if price is not None],
+        )
+
+
+def cached_prices(symbols, fetch, path=QUOTE_CACHE_PATH, ttl_seconds=QUOTE_CACHE_TTL_SECONDS, offline=False, now=None):
+    """Resolve ``{symbol: price or None}`` through the cache file.
+
+    Cached prices younger than ``ttl_seconds`` are used as is and the rest are
+    looked up with ``fetch(symbols) -> {symbol: price}`` and stored; a failed
+    lookup falls back to the stale cached price. Offline, nothing is fetched
+    and any cached price is used regardless of age.
+    """
+    symbols = list(dict.fromkeys(s for s in symbols if s))
+    now = now or _utcnow()
+    conn = connect(path)
+    try:
+        quotes = load_quotes(conn, symbols)
+        prices = {}
+        stale = []
+        for symbol in symbols:
+            price, updated_at = quotes.get(symbol, (None, None))
+            fresh = updated_at is not None and (now - updated_at).total_seconds() <= ttl_seconds
+            if price is not None and (offline or fresh):
+                prices[symbol] = price
+            else:
+                prices[symbol] = None
+                stale.append(symbol)
+        if stale and not offline:
+            fetched = fetch(stale)
+            store_quotes(conn, fetched, now=now)
+            for symbol in stale:
+                # like the API cache, fall back to a stale price when the lookup fails
+                price = fetched.get(symbol)
+                prices[symbol] = price if price is not None else quotes.get(symbol, (None, None))[0]
+        return prices
+    finally:
+        conn.close()
@@ -0,0 +1,127 @@
+"""Portfolio risk from locally stored daily closes.
+
+Closes are pivoted into a (day x symbol) matrix and turned into daily
+returns. With current market-value weights ``w`` the portfolio variance is
+``w' C w`` for the sample covariance ``C`` of those returns; beta, maximum
+drawdown and historical value-at-risk come from the weighted return series.
+Nothing here calls an upstream price API.
+"""
+import datetime
+
+import numpy as np
+
+from . import models
+from .history import forward_fill
+
+TRADING_DAYS = 252
+
+
+def close_matrix(symbols, days, closes, columns):
+    """Pivot ``(symbol, day, close)`` rows into dates and a forward-filled
+    (day x column) matrix; columns without data stay NaN."""
+    distinct = list(dict.fromkeys(columns))
+    lookup = {symbol: i for i, symbol in enumerate(distinct)}
+    dates, day_idx = np.unique(np.asarray(days, dtype='datetime64[D]'), return_inverse=True)
+    col_idx = np.array([lookup.get(s, -1) for s in symbols], dtype=np.int64)
+    matrix = np.full((len(dates), len(distinct)), np.nan)
+    known = col_idx >= 0
+    matrix[day_idx[known], col_idx[known]] = np.asarray(closes, dtype=float)[known]
+    return dates, forward_fill(matrix)[:, [lookup[c] for c in columns]]
+
+
+def simple_returns(matrix):
+    """Day-over-day returns; rows where any column lacks a price are dropped."""
+    returns = matrix[1:] / matrix[:-1] - 1.0
+    return returns[~np.isnan(returns).any(axis=1)]
+
+
+def max_drawdown(returns):
+    """Largest peak-to-trough loss of the compounded return series (a positive fraction)."""
+    if not len(returns):
+        return 0.0
+    wealth = np.concatenate([[1.0], np.cumprod(1.0 + returns)])
+    peaks = np.maximum.accumulate(wealth)
+    return float(np.max(1.0 - wealth / peaks))
+
+
+def portfolio_risk(matrix, quantities, benchmark=None, confidence=0.95):
+    """Risk metrics for fixed ``quantities`` over the columns of ``matrix``.
+
+    ``benchmark`` is an optional close series aligned with ``matrix`` rows.
+    Returns a dict of scalars (volatility is annualized; VaR is one day, as a
+    fraction and in currency at the latest value).
+    """
+    quantities = np.asarray(quantities, dtype=float)
+    data = matrix if benchmark is None else np.column_stack([matrix, benchmark])
+    returns = simple_returns(data)
+    asset_returns = returns[:, :len(quantities)]
+    last = matrix[-1] if len(matrix) else np.zeros(len(quantities))
+    values = np.nan_to_num(last) * quantities
+    total = values.sum()
+    weights = values / total if total > 0 else np.zeros(len(quantities))
+
+    result = {
+        'observations': int(len(returns)),
+        'market_value': float(total),
+        'volatility': None,
+        'beta': None,
+        'max_drawdown': None,
+        'var': None,
+        'var_amount': None,
+    }
+    if len(returns) < 2 or total <= 0:
+        return result
+    cov = np.atleast_2d(np.cov(asset_returns, rowvar=False))
+    daily_var = float(weights @ cov @ weights)
+    series = asset_returns @ weights
+    loss = -np.percentile(series, (1.0 - confidence) * 100.0)
+    result.update({
+        'volatility': float(np.sqrt(max(daily_var, 0.0) * TRADING_DAYS)),
+        'max_drawdown': max_drawdown(series),
+        'var': float(max(loss, 0.0)),
+        'var_amount': float(max(loss, 0.0) * total),
+    })
+    if benchmark is not None:
+        bench = returns[:, -1]
+        pair = np.cov(series, bench)
+        if pair[1, 1] > 0:
+            result['beta'] = float(pair[0, 1] / pair[1, 1])
+    return result
+
+
+def load_closes(db, symbols, start=None):
+    """Stored closes for ``symbols`` as parallel lists, oldest first."""
+    query = (
+        db.query(models.DailyPrice.symbol, models.DailyPrice.date, models.DailyPrice.close)
+        .filter(models.DailyPrice.symbol.in_(list(symbols)))
+    )
+    if start is not None:
+        query = query.filter(models.DailyPrice.date >= start)
+    rows = query.order_by(models.DailyPrice.date).all()
+    return [r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows]
+
+
+def holdings_risk(db, quantities, benchmark, window, confidence=0.95, today=None):
+    """Risk of ``{symbol: quantity}`` over the last ``window`` trading days of
+    stored closes, against the ``benchmark`` symbol when it has data."""
+    symbols = sorted(quantities)
+    benchmark = benchmark.strip().upper()
+    columns = symbols + [benchmark]
+    # calendar days are a generous bound on `window` trading days
+    since = (today or datetime.date.today()) - datetime.timedelta(days=window * 2 + 10)
+    dates, matrix = close_matrix(*load_closes(db, columns, start=since), columns)
+    dates, matrix = dates[-(window + 1):], matrix[-(window + 1):]
+    bench = matrix[:, -1]
+    priced = ~np.isnan(matrix[:, :-1]).all(axis=0) if len(dates) else np.zeros(len(symbols), dtype=bool)
+    result = portfolio_risk(
+        matrix[:, :-1][:, priced], [quantities[s] for s, ok in zip(symbols, priced) if ok],
+        benchmark=None if np.isnan(bench).all() else bench, confidence=confidence,
+    )
+    result.update({
+        'benchmark': benchmark,
+        'start': str(dates[0]) if len(dates) else None,
+        'end': str(dates[-1]) if len(dates) else None,
+        # positions without stored closes are left out of every metric
+        'missing_prices': [s for s, ok in zip(symbols, priced) if not ok],
+    })
+    return result
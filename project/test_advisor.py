@@ -0,0 +1,281 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Set test API key before importing modules that require it
+if not os.environ.get('FINNHUB_API_KEY'):
+    os.environ['FINNHUB_API_KEY'] = 'd619kb9r01qn5qe72j2gd619kb9r01qn5qe72j30'  # Test key
+
+DB_PATH = os.path.join(tempfile.gettempdir(), 'gunners_test_advisor.db')
+if os.path.exists(DB_PATH):
+    os.remove(DB_PATH)
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+import pytest
+from fastapi.testclient import TestClient
+from project import init_db
+
+# Initialize DB tables before importing `api`
+init_db.init_db()
+from project import api, advisor
+import importlib
+importlib.reload(api)
+client = TestClient(api.app)
+
+PASSWORD = 'AdvisorPass12345'
+ANSWER = 'Here you go: {"recommendations": [{"ticker": "AAPL", "action": "buy"}]} Good luck.'
+
+
+class FakeAdvisor(advisor.AdvisorClient):
+    """Answers from ``answer`` after ``delay`` seconds instead of calling Gemini."""
+
+    def __init__(self, answer=ANSWER, delay=0.0, **kwargs):
+        super().__init__(api_key='test', **kwargs)
+        self.answer = answer
+        self.delay = delay
+        self.prompts = []
+
+    def generate(self, prompt):
+        self.prompts.append(prompt)
+        time.sleep(self.delay)
+        return self.answer
+
+    def generate_stream(self, prompt):
+        self.prompts.append(prompt)
+        for i in range(0, len(self.answer), 7):
+            time.sleep(self.delay)
+            yield self.answer[i:i + 7]
+
+
+@pytest.fixture
+def fake_advisor(monkeypatch):
+    def install(**kwargs):
+        client_ = FakeAdvisor(**kwargs)
+        monkeypatch.setattr(api, 'advisor_client', client_)
+        return client_
+    yield install
+    if isinstance(api.advisor_client, FakeAdvisor):
+        api.advisor_client.close()
+
+
+def login(username):
+    client.post('/register', json={'username': username, 'password': PASSWORD})
+    r = client.post('/login', json={'username': username, 'password': PASSWORD})
+    assert r.status_code == 200
+    return {'X-CSRF-Token': r.json()['csrf_token']}
+
+
+def test_advise_parses_and_records_history(fake_advisor):
+    headers = login('advisoruser1')
+    fake_advisor()
+    r = client.post('/gemini/advise', json={'prompt': 'ideas?', 'profile': {'risk': 'low'}}, headers=headers)
+    assert r.status_code == 200
+    data = r.json()
+    assert data['recommendations'] == [{'ticker': 'AAPL', 'action': 'buy', 'symbol': 'AAPL'}]
+    assert data['history'][0]['profile'] == {'risk': 'low'}
+    assert client.post('/gemini/advise', json={}, headers=headers).status_code == 400
+
+
+def test_advise_deadline_and_queue_bound(fake_advisor):
+    headers = login('advisoruser2')
+    fake_advisor(delay=1.0, timeout_seconds=0.05)
+    r = client.post('/gemini/advise', json={'prompt': 'slow'}, headers=headers)
+    assert r.status_code == 504
+
+    busy = fake_advisor(max_concurrency=1, max_queue=0)
+    release = threading.Event()
+    busy.submit(release.wait)
+    try:
+        r = client.post('/gemini/advise', json={'prompt': 'busy'}, headers=headers)
+        assert r.status_code == 503
+        assert busy.prompts == []
+    finally:
+        release.set()
+
+
+def test_advise_deadline_frees_the_advisor_slot(monkeypatch):
+    headers = login('advisoruser9')
+    monkeypatch.setattr(advisor, 'ADVISOR_STUB_DELAY_SECONDS', 5.0)
+    stub = advisor.AdvisorClient(model_name='stub', backend='stub', timeout_seconds=0.2, max_concurrency=1, max_queue=0)
+    monkeypatch.setattr(api, 'advisor_client', stub)
+    try:
+        assert client.post('/gemini/advise', json={'prompt': 'hung 1'}, headers=headers).status_code == 504
+        deadline = time.monotonic() + 2.0
+        while stub.in_flight and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert stub.in_flight == 0
+        assert client.post('/gemini/advise', json={'prompt': 'hung 2'}, headers=headers).status_code == 504
+    finally:
+        stub.close()
+
+
+def test_advise_without_api_key(monkeypatch):
+    headers = login('advisoruser3')
+    monkeypatch.setattr(api, 'advisor_client', advisor.AdvisorClient(api_key=None))
+    r = client.post('/gemini/advise', json={'prompt': 'hi'}, headers=headers)
+    assert r.status_code == 500
+    assert r.json()['detail'] == 'Gemini API key not configured'
+
+
+def test_identical_requests_are_served_from_cache(fake_advisor):
+    headers = login('advisoruser4')
+    fake = fake_advisor()
+    hits = api.metrics.get('advisor_cache_hits')
+    body = {'prompt': 'Cached   ideas?', 'profile': {'risk': 'high', 'horizon': 5}}
+    first = client.post('/gemini/advise', json=body, headers=headers).json()
+    same = {'prompt': ' Cached ideas? ', 'profile': {'horizon': 5, 'risk': 'high'}}
+    second = client.post('/gemini/advise', json=same, headers=headers).json()
+    assert (first['cached'], second['cached']) == (False, True)
+    assert second['recommendations'] == first['recommendations']
+    assert len(fake.prompts) == 1
+    assert api.metrics.get('advisor_cache_hits') == hits + 1
+    assert 'advisor_cache_hit_rate' in client.get('/metrics').json()
+    other = client.post('/gemini/advise', json=dict(body, profile={'risk': 'low'}), headers=headers).json()
+    assert other['cached'] is False and len(fake.prompts) == 2
+
+
+def test_answers_without_json_are_not_cached(fake_advisor):
+    headers = login('advisoruser11')
+    fake = fake_advisor(answer='Sorry, no ideas today.')
+    body = {'prompt': 'raw only'}
+    first = client.post('/gemini/advise', json=body, headers=headers).json()
+    assert first['raw_response'] == 'Sorry, no ideas today.'
+    client.post('/gemini/advise', json=body, headers=headers)
+    read_events(client.post('/gemini/advise/stream', json=body, headers=headers))
+    assert len(fake.prompts) == 3
+
+
+def test_advisor_cache_ttl_and_size_bound():
+    import datetime
+    db = api.SessionLocal()
+    try:
+        start = datetime.datetime(2030, 1, 1, tzinfo=datetime.UTC)
+        for i in range(3):
+            advisor.store_answer(db, f'k{i}', 'm', f'answer {i}', ttl_seconds=60, max_entries=2,
+                                 now=start + datetime.timedelta(seconds=i))
+        assert advisor.cached_answer(db, 'k0', ttl_seconds=60, now=start) is None
+        assert advisor.cached_answer(db, 'k2', ttl_seconds=60, now=start + datetime.timedelta(seconds=10)) == 'answer 2'
+        assert advisor.cached_answer(db, 'k2', ttl_seconds=60, now=start + datetime.timedelta(seconds=120)) is None
+        assert advisor.cached_answer(db, 'k2', ttl_seconds=0, now=start) is None
+    finally:
+        db.query(api.models.AdvisorCache).filter(api.models.AdvisorCache.key.like('k_')).delete(synchronize_session=False)
+        db.commit()
+        db.close()
+
+
+def read_events(response):
+    events = []
+    for block in response.text.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def test_json_object_scanner_handles_split_chunks():
+    text = 'Note {not json} then {"recommendations": [{"ticker": "X", "why": "a } in \\"text\\""}]} tail {"b": 1}'
+    scanner = advisor.JSONObjectScanner()
+    results = [scanner.feed(text[i:i + 3]) for i in range(0, len(text), 3)]
+    assert results[0] is None
+    assert scanner.data == {'recommendations': [{'ticker': 'X', 'why': 'a } in "text"', 'symbol': 'X'}]}
+
+
+def test_advise_stream_sends_tokens_then_recommendations(fake_advisor):
+    headers = login('advisoruser5')
+    fake_advisor()
+    body = {'prompt': 'stream please', 'profile': {'risk': 'mid'}}
+    r = client.post('/gemini/advise/stream', json=body, headers=headers)
+    assert r.status_code == 200
+    assert r.headers['content-type'].startswith('text/event-stream')
+    events = read_events(r)
+    tokens = [data['text'] for name, data in events if name == 'token']
+    assert len(tokens) > 1 and ''.join(tokens) == ANSWER
+    name, final = events[-1]
+    assert name == 'recommendations'
+    assert final['recommendations'][0]['symbol'] == 'AAPL' and final['cached'] is False
+    assert final['history'][0]['profile'] == {'risk': 'mid'}
+    again = read_events(client.post('/gemini/advise/stream', json=body, headers=headers))
+    assert again[-1][1]['cached'] is True
+
+    fake_advisor(delay=0.5, timeout_seconds=0.05)
+    events = read_events(client.post('/gemini/advise/stream', json={'prompt': 'slow stream'}, headers=headers))
+    assert events[-1] == ('error', {'status': 504, 'detail': 'Advisor did not respond within 0.05 seconds'})
+    busy = fake_advisor(max_concurrency=1, max_queue=0)
+    release = threading.Event()
+    busy.submit(release.wait)
+    try:
+        assert client.post('/gemini/advise/stream', json={'prompt': 'busy stream'}, headers=headers).status_code == 503
+    finally:
+        release.set()
+
+
+def wait_for_job(job_id, headers, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        r = client.get(f'/advisor/jobs/{job_id}', headers=headers)
+        assert r.status_code == 200
+        job = r.json()
+        if job['status'] in ('done', 'failed') or time.monotonic() > deadline:
+            return job
+        time.sleep(0.02)
+
+
+def test_async_advise_job_with_stub_backend(monkeypatch):
+    monkeypatch.setattr(advisor, 'ADVISOR_BACKEND', 'stub')
+    monkeypatch.setattr(api, 'advisor_client', None)
+    headers = login('advisoruser6')
+    r = client.post('/gemini/advise', json={'prompt': 'queue me', 'profile': {'goal': 'growth'}, 'async': True},
+                    headers=headers)
+    assert r.status_code == 202
+    job_id = r.json()['job_id']
+    assert r.headers['location'] == f'/advisor/jobs/{job_id}'
+    assert api.get_advisor().model_name == 'stub'
+
+    job = wait_for_job(job_id, headers)
+    assert job['status'] == 'done'
+    assert [rec['symbol'] for rec in job['result']['recommendations']] == ['VTI', 'BND']
+    history = client.get('/advisor/history', headers=headers).json()['history']
+    assert history[0]['profile'] == {'goal': 'growth'}
+
+    other = login('advisoruser7')
+    assert client.get(f'/advisor/jobs/{job_id}', headers=other).status_code == 404
+    assert client.get('/advisor/jobs/unknown', headers=other).status_code == 404
+    api.advisor_client.close()
+
+
+def test_async_advise_job_failure_and_queue_bound(fake_advisor):
+    headers = login('advisoruser8')
+    fake_advisor(answer='{"recommendations": [broken]}')
+    job_id = client.post('/gemini/advise', json={'prompt': 'bad json', 'async': True}, headers=headers).json()['job_id']
+    job = wait_for_job(job_id, headers)
+    assert job['status'] == 'failed' and job['error'].startswith('Failed to parse Gemini response')
+
+    busy = fake_advisor(max_concurrency=1, max_queue=0)
+    release = threading.Event()
+    busy.submit(release.wait)
+    try:
+        r = client.post('/gemini/advise', json={'prompt': 'full', 'async': True}, headers=headers)
+        assert r.status_code == 503
+    finally:
+        release.set()
+
+
+def test_async_advise_job_times_out(monkeypatch):
+    headers = login('advisoruser10')
+    monkeypatch.setattr(advisor, 'ADVISOR_STUB_DELAY_SECONDS', 5.0)
+    stub = advisor.AdvisorClient(model_name='stub', backend='stub', timeout_seconds=0.2, max_concurrency=1, max_queue=0)
+    monkeypatch.setattr(api, 'advisor_client', stub)
+    timed_out = api.metrics.get('advisor_jobs_timed_out')
+    try:
+        job_id = client.post('/gemini/advise', json={'prompt': 'stuck job', 'async': True}, headers=headers).json()['job_id']
+        job = wait_for_job(job_id, headers)
+        assert job['status'] == 'failed'
+        assert job['error'] == 'Advisor did not respond within 0.2 seconds'
+        assert api.metrics.get('advisor_jobs_timed_out') == timed_out + 1
+        deadline = time.monotonic() + 2.0
+        while stub.in_flight and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert client.post('/gemini/advise', json={'prompt': 'next', 'async': True}, headers=headers).status_code == 202
+    finally:
+        stub.close()
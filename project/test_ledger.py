@@ -0,0 +1,244 @@
+import os
+import tempfile
+
+# Set test API key before importing modules that require it
+if not os.environ.get('FINNHUB_API_KEY'):
+    os.environ['FINNHUB_API_KEY'] = 'd619kb9r01qn5qe72j2gd619kb9r01qn5qe72j30'  # Test key
+
+DB_PATH = os.path.join(tempfile.gettempdir(), 'gunners_test_ledger.db')
+if os.path.exists(DB_PATH):
+    os.remove(DB_PATH)
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+import pytest
+from fastapi.testclient import TestClient
+from project import init_db
+
+# Initialize DB tables before importing `api`
+init_db.init_db()
+from project import api, models, ledger
+import importlib
+importlib.reload(api)
+client = TestClient(api.app)
+
+PASSWORD = 'LedgerPass12345'
+PRICES = {'AAPL': 100.0, 'MSFT': 50.0}
+
+
+@pytest.fixture(autouse=True)
+def fake_quotes(monkeypatch):
+    """Serve prices from PRICES instead of Finnhub."""
+    monkeypatch.setattr(api, 'get_ticker_price', lambda symbol: PRICES.get(symbol))
+    monkeypatch.setattr(api, 'get_ticker_prices', lambda symbols: {s: PRICES.get(s) for s in symbols})
+    monkeypatch.setattr(api, 'get_ticker_name', lambda symbol, **kwargs: None)
+
+
+def setup_user(username):
+    client.post('/register', json={'username': username, 'password': PASSWORD})
+    r = client.post('/login', json={'username': username, 'password': PASSWORD})
+    assert r.status_code == 200
+    db = api.SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.username == username).first()
+        portfolio_id = next(p.id for p in user.portfolios if p.name == 'default')
+    finally:
+        db.close()
+    return {'X-CSRF-Token': r.json()['csrf_token']}, portfolio_id
+
+
+def divergences_for(portfolio_id):
+    db = api.SessionLocal()
+    try:
+        return [d for d in ledger.reconcile(db, batch_size=2) if d['portfolio_id'] == portfolio_id]
+    finally:
+        db.close()
+
+
+def test_replay_matches_trade_arithmetic():
+    positions = {}
+    ledger.apply_transaction(positions, 'AAPL', 'buy', 10, 100.0)
+    ledger.apply_transaction(positions, 'AAPL', 'buy', 10, 120.0)
+    ledger.apply_transaction(positions, 'AAPL', 'sell', 5, 130.0)
+    assert positions == {'AAPL': {'quantity': 15, 'totalcost': 1550.0}}
+    ledger.apply_transaction(positions, 'AAPL', 'sell', 15, 130.0)
+    assert positions == {}
+
+
+def test_ledger_positions_match_holdings_across_snapshots():
+    headers, portfolio_id = setup_user('ledgeruser1')
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 10}, headers=headers).status_code == 200
+    assert client.post('/buy', json={'symbol': 'MSFT', 'quantity': 4}, headers=headers).status_code == 200
+    ledger.snapshot_if_due(portfolio_id, interval=1)
+    PRICES['AAPL'] = 130.0
+    try:
+        assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 5}, headers=headers).status_code == 200
+        assert client.post('/sell', json={'symbol': 'MSFT', 'quantity': 4}, headers=headers).status_code == 200
+    finally:
+        PRICES['AAPL'] = 100.0
+
+    db = api.SessionLocal()
+    try:
+        snapshot = ledger.latest_snapshot(db, portfolio_id)
+        assert snapshot is not None and snapshot.last_transaction_id > 0
+        positions, _, tail_length = ledger.derive_positions(db, portfolio_id)
+    finally:
+        db.close()
+    assert tail_length == 2
+    assert positions == {'AAPL': {'quantity': 15, 'totalcost': 1650.0}}
+    assert divergences_for(portfolio_id) == []
+
+
+def test_reconcile_reports_drifted_holding():
+    headers, portfolio_id = setup_user('ledgeruser2')
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 3}, headers=headers).status_code == 200
+    db = api.SessionLocal()
+    try:
+        holding = db.query(models.Holding).filter(models.Holding.portfolio_id == portfolio_id).first()
+        holding.avgcost = 90.0
+        db.commit()
+    finally:
+        db.close()
+    found = divergences_for(portfolio_id)
+    assert len(found) == 1
+    assert found[0]['symbol'] == 'AAPL'
+    assert found[0]['ledger_avgcost'] == pytest.approx(100.0)
+
+
+def test_reconcile_sums_lot_rows_of_a_loaded_portfolio():
+    headers, portfolio_id = setup_user('ledgeruser3')
+    csv_text = 'Ticker,Quantity,TotalCost,LastTransactionDate\nAAPL,2,200,2025-01-02\nAAPL,3,360,2025-01-03\n'
+    r = client.post('/portfolio/load', files={'file': ('lots.csv', csv_text, 'text/csv')}, headers=headers)
+    assert r.status_code == 200
+    assert divergences_for(portfolio_id) == []
+    db = api.SessionLocal()
+    try:
+        holdings = db.query(models.Holding).filter(models.Holding.portfolio_id == portfolio_id).all()
+    finally:
+        db.close()
+    assert ledger.holdings_positions(holdings) == {'AAPL': {'quantity': 5.0, 'totalcost': pytest.approx(560.0)}}
+
+
+def test_nav_curve_uses_daily_closes_and_snapshot_baseline():
+    import datetime
+    from project import history
+    day = datetime.date(2026, 1, 1)
+    transactions = {
+        'id': [1, 2, 3],
+        'symbol': ['AAPL', 'AAPL', 'MSFT'],
+        'side': ['buy', 'sell', 'buy'],
+        'quantity': [10.0, 4.0, 2.0],
+        'price': [100.0, 110.0, 50.0],
+        'day': history.np.array([day, day + datetime.timedelta(days=2), day + datetime.timedelta(days=3)],
+                                dtype='datetime64[D]'),
+    }
+    # day 4: positions reloaded from CSV as 5 XYZ at 20
+    snapshots = [(3, day + datetime.timedelta(days=4), {'XYZ': {'quantity': 5.0, 'totalcost': 100.0}})]
+    daily = {
+        'symbol': ['AAPL', 'AAPL'],
+        'day': history.np.array([day + datetime.timedelta(days=1), day + datetime.timedelta(days=3)],
+                                dtype='datetime64[D]'),
+        'close': [105.0, 120.0],
+    }
+    curve = history.nav_curve(transactions, snapshots, daily, day + datetime.timedelta(days=5))
+    assert len(curve['date']) == 6
+    assert curve['value'].tolist() == pytest.approx([1000.0, 1050.0, 660.0, 820.0, 100.0, 100.0])
+    # trade cash flows, then the reload swaps 6 AAPL @120 and 2 MSFT @50 for 5 XYZ @20
+    assert curve['net_invested'].tolist() == pytest.approx([1000.0, 1000.0, 560.0, 660.0, -60.0, -60.0])
+
+
+def test_portfolio_history_endpoint_is_cached_and_invalidated_by_trades():
+    headers, portfolio_id = setup_user('historyuser1')
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 2}, headers=headers).status_code == 200
+    r = client.get('/portfolio/history')
+    assert r.status_code == 200
+    points = r.json()['points']
+    assert points[-1]['value'] == pytest.approx(200.0)
+    assert api.history_cache.get(portfolio_id) is not None
+
+    assert client.post('/buy', json={'symbol': 'MSFT', 'quantity': 1}, headers=headers).status_code == 200
+    assert api.history_cache.get(portfolio_id) is None
+    assert client.get('/portfolio/history').json()['points'][-1]['value'] == pytest.approx(250.0)
+    assert client.get('/portfolio/history', params={'start': '2999-01-01'}).json()['points'] == []
+    assert client.get('/portfolio/history', params={'start': 'soon'}).status_code == 400
+
+
+def test_history_uses_stored_closes_for_lower_case_trades():
+    import datetime
+    from project import prices
+    headers, portfolio_id = setup_user('historyuser2')
+    assert client.post('/buy', json={'symbol': 'msft', 'quantity': 2}, headers=headers).status_code == 200
+    db = api.SessionLocal()
+    try:
+        prices.upsert_daily_prices(db, [('MSFT', datetime.date.today(), 75.0)])
+        db.commit()
+        points = client.get('/portfolio/history').json()['points']
+        assert points[-1]['value'] == pytest.approx(150.0)
+    finally:
+        db.query(models.DailyPrice).filter(models.DailyPrice.symbol == 'MSFT').delete()
+        db.commit()
+        db.close()
+
+
+def test_history_stamp_changes_when_a_close_is_overwritten():
+    import datetime
+    from project import history, prices
+    day = datetime.date(2026, 2, 2)
+    db = api.SessionLocal()
+    try:
+        prices.upsert_daily_prices(db, [('STAMPX', day, 10.0)])
+        db.commit()
+        before = history.cache_stamp(db, 0, day)
+        prices.upsert_daily_prices(db, [('STAMPX', day, 10.0)])
+        db.commit()
+        assert history.cache_stamp(db, 0, day) == before
+        prices.upsert_daily_prices(db, [('STAMPX', day, 11.0)])
+        db.commit()
+        assert history.cache_stamp(db, 0, day) != before
+    finally:
+        db.query(api.models.DailyPrice).filter(api.models.DailyPrice.symbol == 'STAMPX').delete()
+        db.commit()
+        db.close()
+
+
+def test_risk_metrics_from_covariance():
+    import numpy as np
+    from project import risk
+    closes = np.array([[10.0, 20.0], [11.0, 19.0], [9.9, 20.9], [10.89, 19.855]])
+    bench = np.array([100.0, 105.0, 99.75, 104.7375])
+    result = risk.portfolio_risk(closes, [1.0, 0.0], benchmark=bench, confidence=0.9)
+    # all weight on the first column: +10%, -10%, +10% daily returns
+    returns = np.array([0.1, -0.1, 0.1])
+    assert result['market_value'] == pytest.approx(10.89)
+    assert result['volatility'] == pytest.approx(np.std(returns, ddof=1) * np.sqrt(252))
+    assert result['beta'] == pytest.approx(2.0)
+    assert result['max_drawdown'] == pytest.approx(0.1)
+    assert result['var'] == pytest.approx(-np.percentile(returns, 10))
+
+
+def test_daily_price_import_feeds_risk_endpoint(monkeypatch):
+    import datetime
+    headers, _ = setup_user('riskuser1')
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 2}, headers=headers).status_code == 200
+    today = datetime.date.today()
+    lines = ['symbol,date,close']
+    for i, (aapl, bench) in enumerate([(100, 400), (102, 404), (99, 400), (101, 402), (103, 406)]):
+        day = today - datetime.timedelta(days=5 - i)
+        lines += [f'AAPL,{day},{aapl}', f'RISKBENCH,{day},{bench}']
+    lines.append('AAPL,not-a-date,1')
+    files = {'file': ('closes.csv', '\n'.join(lines), 'text/csv')}
+    assert client.post('/prices/daily/load', files=files, headers=headers).status_code == 403
+    monkeypatch.setattr(api, 'PRICE_ADMIN_USERS', {'riskuser1'})
+    r = client.post('/prices/daily/load', files=files, headers=headers)
+    assert r.status_code == 200
+    assert r.json()['imported'] == 10
+    assert [e['line'] for e in r.json()['errors']] == [12]
+    # re-importing overwrites instead of duplicating
+    assert client.post('/prices/daily/load', files=files, headers=headers).json()['imported'] == 10
+
+    data = client.get('/portfolio/risk', params={'benchmark': 'riskbench'}).json()
+    assert data['observations'] == 4
+    assert data['market_value'] == pytest.approx(206.0)
+    assert data['volatility'] > 0 and data['beta'] > 0
+    assert data['max_drawdown'] == pytest.approx(1 - 99 / 102)
+    assert data['missing_prices'] == []
+    assert client.get('/portfolio/risk', params={'confidence': 2}).status_code == 400
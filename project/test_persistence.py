@@ -39,7 +39,8 @@ def auth_request(client_obj, method, path, **kwargs):
     # Cookies are automatically handled by TestClient
     return getattr(client_obj, method)(path, **kwargs)
 
-def test_register_login_create_buy_save_download(tmp_path):
+def test_register_login_create_buy_save_download(tmp_path, monkeypatch):
+    monkeypatch.setattr(api, 'PORTFOLIO_FILES_DIR', str(tmp_path))
     # register
     r = client.post('/register', json={'username': USERNAME, 'password': PASSWORD})
     assert r.status_code == 200
@@ -69,6 +70,7 @@ def test_register_login_create_buy_save_download(tmp_path):
     assert saved.get('saved_count') == 1
     saved_filename = saved.get('saved_filename')
     assert saved_filename and saved_filename.endswith(fname)
+    assert (tmp_path / saved_filename).exists()
 
     # download file
     r = client.get(f"/portfolio/file/{saved_filename}")
@@ -4,8 +4,9 @@ if not os.environ.get('FINNHUB_API_KEY'):
     os.environ['FINNHUB_API_KEY'] = 'd619kb9r01qn5qe72j2gd619kb9r01qn5qe72j30'  # Test key
 # Ensure tests use an in-memory database to avoid mixing with existing file DB
 os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
-from project import get_ticker_price, check_file_is_csv, write_portfolio, retrieve_portfolio
-import pandas, pytest
+from project import get_ticker_price, check_file_is_csv, write_portfolio, stream_portfolio, retrieve_portfolio
+from project import iter_portfolio, filter_portfolio, aggregate_portfolio
+import pandas, pytest, subprocess, sys
 
 
 def test_get_ticker_price_1():
@@ -55,3 +56,80 @@ def test_retrieve_portfolio_2():
     holdingslist = retrieve_portfolio("pytest_01.csv")
     assert len(holdingslist) == 2
 
+
+# Stream holdings from a generator and read them back
+def test_stream_portfolio(tmp_path):
+    outfile = str(tmp_path / "streamed.csv")
+    rows = ({"symbol": f"T{i}", "quantity": str(i + 1), "avgcost": "2"} for i in range(3))
+    assert stream_portfolio(rows, outfile).endswith(f"Wrote 3 records to {outfile}")
+    holdingslist, _ = retrieve_portfolio(outfile)
+    assert [(r["ticker"], r["totalcost"]) for r in holdingslist] == [("T0", "2.0"), ("T1", "4.0"), ("T2", "6.0")]
+
+
+# Aggregate and filter a saved file lazily, one row at a time
+def test_iter_portfolio_aggregate_and_filter(tmp_path):
+    infile = tmp_path / "dump.csv"
+    infile.write_text("ticker,quantity,totalcost,lasttransactiondate\nnvda,2,100,\nTSM,1,50,\nNVDA,3,120,\n")
+    rows = iter_portfolio(str(infile))
+    assert next(rows) == {"ticker": "nvda", "quantity": "2", "totalcost": "100", "lasttransactiondate": ""}
+    totals = aggregate_portfolio(iter_portfolio(str(infile)))
+    assert totals == {"NVDA": {"quantity": 5.0, "totalcost": 220.0, "rows": 2}, "TSM": {"quantity": 1.0, "totalcost": 50.0, "rows": 1}}
+    assert [r["quantity"] for r in filter_portfolio(iter_portfolio(str(infile)), tickers=["nvda"], min_quantity=3)] == ["3"]
+    with pytest.raises(FileNotFoundError):
+        next(iter_portfolio(str(tmp_path / "missing.csv")))
+
+
+# Apply a trades file at prices resolved up front; failed trades are reported
+def test_read_and_apply_trades(tmp_path):
+    from project.portfolio_manager import read_trades, apply_trades
+    trades_file = tmp_path / "trades.csv"
+    trades_file.write_text("side,ticker,quantity\nbuy,nvda,3\nS,NVDA,1\nS,TSM,1\nB,XYZ,1\n")
+    trades = read_trades(str(trades_file))
+    assert [(t["side"], t["ticker"]) for t in trades] == [("B", "NVDA"), ("S", "NVDA"), ("S", "TSM"), ("B", "XYZ")]
+    holdings, results = apply_trades([], trades, {"NVDA": 10.0, "TSM": 5.0})
+    assert [r["ok"] for r in results] == [True, True, False, False]
+    assert [(h["ticker"], h["quantity"], h["totalcost"]) for h in holdings] == [("NVDA", 2, 20.0)]
+    trades_file.write_text("side,ticker,quantity\nX,NVDA,3\n")
+    with pytest.raises(ValueError):
+        read_trades(str(trades_file))
+
+
+# Quotes are served from the cache file while fresh, and offline regardless of age
+def test_quote_cache(tmp_path):
+    import datetime
+    from project.quote_cache import cached_prices
+    path = str(tmp_path / "quotes.db")
+    calls = []
+
+    def fetch(symbols):
+        calls.append(list(symbols))
+        return {s: {"NVDA": 10.0}.get(s) for s in symbols}
+
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+    assert cached_prices(["NVDA", "TSM"], fetch, path=path, ttl_seconds=60, now=start) == {"NVDA": 10.0, "TSM": None}
+    assert cached_prices(["NVDA"], fetch, path=path, ttl_seconds=60, now=start + datetime.timedelta(seconds=30)) == {"NVDA": 10.0}
+    assert calls == [["NVDA", "TSM"]]
+    later = start + datetime.timedelta(days=1)
+    assert cached_prices(["NVDA", "TSM"], fetch, path=path, ttl_seconds=60, offline=True, now=later) == {"NVDA": 10.0, "TSM": None}
+    assert len(calls) == 1
+    assert cached_prices(["NVDA"], lambda symbols: {}, path=path, ttl_seconds=60, now=later) == {"NVDA": 10.0}
+
+
+# Importing the portfolio helpers (API workers, CLI) must not pull in pandas
+def test_portfolio_manager_import_does_not_load_pandas():
+    code = "import sys, project.portfolio_manager; print('pandas' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert out.stdout.strip() == "False"
+
+
+# Rows are written newest first whatever the timestamp format; undated rows go last
+def test_write_portfolio_sorts_by_timestamp(tmp_path):
+    outfile = str(tmp_path / "sorted.csv")
+    rows = [{"ticker": "OLD", "quantity": "1", "totalcost": "1", "lasttransactiondate": "01/02/2024"},
+            {"ticker": "NONE", "quantity": "1", "totalcost": "1", "lasttransactiondate": ""},
+            {"ticker": "NEW", "quantity": "1", "totalcost": "1", "lasttransactiondate": "2025-05-01T00:00:00+00:00"},
+            {"ticker": "MID", "quantity": "1", "totalcost": "1", "lasttransactiondate": pandas.Timestamp("2024-06-01")}]
+    write_portfolio(rows, outfile)
+    holdingslist, _ = retrieve_portfolio(outfile)
+    assert [r["ticker"] for r in holdingslist] == ["NEW", "MID", "OLD", "NONE"]
@@ -0,0 +1,557 @@
+import os
+import tempfile
+
+# Set test API key before importing modules that require it
+if not os.environ.get('FINNHUB_API_KEY'):
+    os.environ['FINNHUB_API_KEY'] = 'd619kb9r01qn5qe72j2gd619kb9r01qn5qe72j30'  # Test key
+
+DB_PATH = os.path.join(tempfile.gettempdir(), 'gunners_test_trades.db')
+if os.path.exists(DB_PATH):
+    os.remove(DB_PATH)
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+import pytest
+from fastapi.testclient import TestClient
+from project import init_db
+
+# Initialize DB tables before importing `api`
+init_db.init_db()
+from project import api, models
+import importlib
+importlib.reload(api)
+client = TestClient(api.app)
+
+PASSWORD = 'TradePass12345'
+PRICES = {'AAPL': 100.0, 'MSFT': 50.0}
+
+
+@pytest.fixture(autouse=True)
+def fake_quotes(monkeypatch):
+    """Serve prices from PRICES instead of Finnhub."""
+    monkeypatch.setattr(api, 'get_ticker_price', lambda symbol: PRICES.get(symbol))
+    monkeypatch.setattr(api, 'get_ticker_prices', lambda symbols: {s: PRICES.get(s) for s in symbols})
+    monkeypatch.setattr(api, 'get_ticker_name', lambda symbol, **kwargs: None)
+
+
+def login(username):
+    r = client.post('/register', json={'username': username, 'password': PASSWORD})
+    assert r.status_code == 200
+    r = client.post('/login', json={'username': username, 'password': PASSWORD})
+    assert r.status_code == 200
+    return r.json().get('csrf_token', '')
+
+
+def holdings_for(username):
+    db = api.SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.username == username).first()
+        portfolio = next(p for p in user.portfolios if p.name == 'default')
+        return {h.symbol: (h.id, h.quantity, h.avgcost) for h in portfolio.holdings}
+    finally:
+        db.close()
+
+
+def test_app_starts_with_lifespan():
+    with TestClient(api.app) as started:
+        assert api.advisor_client is not None
+        assert started.get('/health').status_code == 200
+
+
+def test_buy_updates_single_row_and_recomputes_avgcost():
+    csrf = login('tradeuser1')
+    headers = {'X-CSRF-Token': csrf}
+    assert client.post('/buy', json={'symbol': 'MSFT', 'quantity': 5}, headers=headers).status_code == 200
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 10}, headers=headers).status_code == 200
+    before = holdings_for('tradeuser1')
+
+    PRICES['AAPL'] = 120.0
+    try:
+        r = client.post('/buy', json={'symbol': 'AAPL', 'quantity': 10}, headers=headers)
+    finally:
+        PRICES['AAPL'] = 100.0
+    assert r.status_code == 200
+    assert sorted(row['symbol'] for row in r.json()['portfolio']) == ['AAPL', 'MSFT']
+
+    after = holdings_for('tradeuser1')
+    # the untouched holding keeps its row; the traded one is updated in place
+    assert after['MSFT'] == before['MSFT']
+    assert after['AAPL'][0] == before['AAPL'][0]
+    assert after['AAPL'][1] == 20
+    assert after['AAPL'][2] == pytest.approx(110.0)
+
+
+def test_sell_to_zero_deletes_row():
+    csrf = login('tradeuser2')
+    headers = {'X-CSRF-Token': csrf}
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 3}, headers=headers).status_code == 200
+    r = client.post('/sell', json={'symbol': 'AAPL', 'quantity': 3}, headers=headers)
+    assert r.status_code == 200
+    assert r.json()['portfolio'] == []
+    assert holdings_for('tradeuser2') == {}
+
+
+def test_sell_more_than_held_is_rejected():
+    csrf = login('tradeuser3')
+    headers = {'X-CSRF-Token': csrf}
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 2}, headers=headers).status_code == 200
+    r = client.post('/sell', json={'symbol': 'AAPL', 'quantity': 5}, headers=headers)
+    assert r.status_code == 400
+    assert holdings_for('tradeuser3')['AAPL'][1] == 2
+
+
+def test_trade_writes_holding_transaction_and_audit_together(monkeypatch):
+    csrf = login('tradeuser4')
+    headers = {'X-CSRF-Token': csrf}
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 4}, headers=headers).status_code == 200
+
+    def failing_audit(*args, **kwargs):
+        raise RuntimeError('audit store unavailable')
+
+    monkeypatch.setattr(api, 'log_audit', failing_audit)
+    r = client.post('/buy', json={'symbol': 'MSFT', 'quantity': 1}, headers=headers)
+    assert r.status_code == 400
+    # nothing from the failed trade is persisted
+    assert set(holdings_for('tradeuser4')) == {'AAPL'}
+    txns = client.get('/user/transactions').json()
+    assert [t['symbol'] for t in txns] == ['AAPL']
+    buys = [log for log in client.get('/user/audit-log').json() if log['action'] == 'buy']
+    assert len(buys) == 1
+
+
+def test_trade_price_cache_written_in_background():
+    csrf = login('tradeuser5')
+    assert client.post('/buy', json={'symbol': 'MSFT', 'quantity': 1}, headers={'X-CSRF-Token': csrf}).status_code == 200
+    db = api.SessionLocal()
+    try:
+        cached = db.query(models.PriceCache).filter(models.PriceCache.symbol == 'MSFT').first()
+        assert cached is not None and cached.price == PRICES['MSFT']
+    finally:
+        db.close()
+
+
+def test_batch_orders_best_effort_applies_valid_orders():
+    csrf = login('batchuser1')
+    orders = [
+        {'symbol': 'AAPL', 'side': 'buy', 'quantity': 10},
+        {'symbol': 'MSFT', 'side': 'buy', 'quantity': 4},
+        {'symbol': 'AAPL', 'side': 'sell', 'quantity': 3},
+        {'symbol': 'MSFT', 'side': 'sell', 'quantity': 99},
+        {'symbol': 'NOPE', 'side': 'buy', 'quantity': 1},
+    ]
+    r = client.post('/orders/batch', json={'orders': orders, 'mode': 'best_effort'}, headers={'X-CSRF-Token': csrf})
+    assert r.status_code == 200
+    data = r.json()
+    assert data['filled'] == 3 and data['rejected'] == 2
+    assert [res['status'] for res in data['results']] == ['filled', 'filled', 'filled', 'rejected', 'rejected']
+    held = holdings_for('batchuser1')
+    assert held['AAPL'][1] == 7 and held['MSFT'][1] == 4
+    assert len(client.get('/user/transactions').json()) == 3
+
+
+def test_batch_orders_all_or_nothing_rolls_back():
+    csrf = login('batchuser2')
+    orders = [
+        {'symbol': 'AAPL', 'side': 'buy', 'quantity': 10},
+        {'symbol': 'MSFT', 'side': 'sell', 'quantity': 1},
+    ]
+    r = client.post('/orders/batch', json={'orders': orders}, headers={'X-CSRF-Token': csrf})
+    assert r.status_code == 400
+    assert r.json()['detail']['results'][1]['status'] == 'rejected'
+    assert holdings_for('batchuser2') == {}
+    assert client.get('/user/transactions').json() == []
+
+
+def test_portfolio_lots_fifo_and_lifo():
+    csrf = login('lotsuser1')
+    headers = {'X-CSRF-Token': csrf}
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 10}, headers=headers).status_code == 200
+    PRICES['AAPL'] = 120.0
+    try:
+        assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 10}, headers=headers).status_code == 200
+        assert client.post('/sell', json={'symbol': 'AAPL', 'quantity': 15}, headers=headers).status_code == 200
+    finally:
+        PRICES['AAPL'] = 100.0
+
+    fifo = client.get('/portfolio/lots', params={'method': 'fifo'}).json()
+    assert [(lot['quantity'], lot['cost_price']) for lot in fifo['open_lots']] == [(5.0, 120.0)]
+    assert fifo['totals']['realized_pnl'] == pytest.approx(10 * 20.0)
+    assert fifo['unmatched_sells'] == []
+
+    lifo = client.get('/portfolio/lots', params={'method': 'lifo'}).json()
+    assert [(lot['quantity'], lot['cost_price']) for lot in lifo['open_lots']] == [(5.0, 100.0)]
+    assert lifo['totals']['realized_pnl'] == pytest.approx(5 * 20.0)
+
+    assert client.get('/portfolio/lots', params={'method': 'hifo'}).status_code == 400
+
+
+def test_portfolio_lots_start_from_the_latest_baseline(monkeypatch):
+    csrf = login('lotsuser3')
+    headers = {'X-CSRF-Token': csrf}
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 10}, headers=headers).status_code == 200
+    assert client.post('/portfolio/reset', headers=headers).status_code == 200
+    monkeypatch.setitem(PRICES, 'NVDA', 80.0)
+    assert client.post('/buy', json={'symbol': 'nvda', 'quantity': 2}, headers=headers).status_code == 200
+    assert client.post('/buy', json={'symbol': 'NVDA', 'quantity': 1}, headers=headers).status_code == 200
+    assert client.post('/sell', json={'symbol': 'nvda', 'quantity': 2}, headers=headers).status_code == 200
+    report = client.get('/portfolio/lots').json()
+    assert [(lot['symbol'], lot['quantity']) for lot in report['open_lots']] == [('NVDA', 1.0)]
+    assert report['unmatched_sells'] == []
+
+    csv_text = 'Ticker,Quantity,TotalCost,LastTransactionDate\nMSFT,4,160,2025-01-02\n'
+    r = client.post('/portfolio/load', files={'file': ('p.csv', csv_text, 'text/csv')}, headers=headers)
+    assert r.status_code == 200
+    assert client.post('/sell', json={'symbol': 'MSFT', 'quantity': 1}, headers=headers).status_code == 200
+    report = client.get('/portfolio/lots', params={'symbol': 'msft'}).json()
+    assert [(lot['transaction_id'], lot['quantity'], lot['cost_price']) for lot in report['open_lots']] == [(0, 3.0, 40.0)]
+    assert report['totals']['realized_pnl'] == pytest.approx(1 * (50.0 - 40.0))
+    assert report['unmatched_sells'] == []
+
+
+def test_symbol_filters_ignore_case(monkeypatch):
+    csrf = login('lotsuser2')
+    headers = {'X-CSRF-Token': csrf}
+    monkeypatch.setitem(PRICES, 'NVDA', 80.0)
+    assert client.post('/buy', json={'symbol': 'nvda', 'quantity': 2}, headers=headers).status_code == 200
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 1}, headers=headers).status_code == 200
+    for symbol in ('nvda', 'NVDA'):
+        txns = client.get('/user/transactions', params={'symbol': symbol}).json()
+        assert [t['symbol'] for t in txns] == ['nvda']
+        lots_ = client.get('/portfolio/lots', params={'symbol': symbol}).json()
+        assert [lot['quantity'] for lot in lots_['open_lots']] == [2.0]
+
+
+def racing_upsert(monkeypatch, races):
+    """Commit a competing version bump before the first ``races`` trade attempts."""
+    original = api.upsert_holding_trade
+    calls = {'n': 0}
+
+    def upsert(db, portfolio, *args, **kwargs):
+        calls['n'] += 1
+        if calls['n'] <= races:
+            other = api.SessionLocal()
+            try:
+                api.touch_portfolio_version(other, portfolio.id)
+                other.commit()
+            finally:
+                other.close()
+        return original(db, portfolio, *args, **kwargs)
+
+    monkeypatch.setattr(api, 'upsert_holding_trade', upsert)
+    return calls
+
+
+def test_trade_retries_after_version_conflict(monkeypatch):
+    csrf = login('occuser1')
+    headers = {'X-CSRF-Token': csrf}
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 2}, headers=headers).status_code == 200
+    conflicts_before = api.metrics.get('trade_conflicts')
+    calls = racing_upsert(monkeypatch, races=1)
+    r = client.post('/buy', json={'symbol': 'AAPL', 'quantity': 3}, headers=headers)
+    assert r.status_code == 200
+    assert calls['n'] == 2
+    assert api.metrics.get('trade_conflicts') == conflicts_before + 1
+    assert holdings_for('occuser1')['AAPL'][1] == 5
+    assert len(client.get('/user/transactions').json()) == 2
+    assert client.get('/metrics').json()['trade_conflict_rate'] > 0
+
+
+def test_trade_gives_up_after_bounded_retries(monkeypatch):
+    csrf = login('occuser2')
+    headers = {'X-CSRF-Token': csrf}
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 2}, headers=headers).status_code == 200
+    calls = racing_upsert(monkeypatch, races=api.TRADE_MAX_RETRIES)
+    r = client.post('/buy', json={'symbol': 'AAPL', 'quantity': 3}, headers=headers)
+    assert r.status_code == 409
+    assert calls['n'] == api.TRADE_MAX_RETRIES
+    assert holdings_for('occuser2')['AAPL'][1] == 2
+    assert len(client.get('/user/transactions').json()) == 1
+
+
+def test_portfolio_analytics_weights_and_concentration():
+    csrf = login('analyticsuser1')
+    headers = {'X-CSRF-Token': csrf}
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 3}, headers=headers).status_code == 200
+    assert client.post('/buy', json={'symbol': 'MSFT', 'quantity': 2}, headers=headers).status_code == 200
+    PRICES['AAPL'] = 200.0
+    try:
+        data = client.get('/portfolio/analytics').json()
+    finally:
+        PRICES['AAPL'] = 100.0
+    # cached quotes are still fresh, so the endpoint values at the traded price
+    assert data['num_holdings'] == 2
+    assert data['total_cost_basis'] == pytest.approx(400.0)
+    assert data['total_current_value'] == pytest.approx(400.0)
+    weights = {h['symbol']: h['weight'] for h in data['holdings']}
+    assert weights == {'AAPL': pytest.approx(0.75), 'MSFT': pytest.approx(0.25)}
+    assert data['concentration']['hhi'] == pytest.approx(0.75 ** 2 + 0.25 ** 2)
+    assert data['concentration']['top_weight'] == pytest.approx(0.75)
+    assert sorted(g['group'] for g in data['groups']) == ['AAPL', 'MSFT']
+
+
+def test_analytics_core_values_many_portfolios_at_once():
+    from project import analytics
+    frame = analytics.position_frame(
+        [(1, 'AAPL', 2, 10.0, None), (2, 'AAPL', 1, 20.0, None), (2, 'XYZ', 4, 5.0, 6.0), (2, 'ZERO', 0, 1.0, 1.0)],
+        {'AAPL': 15.0},
+        {'AAPL': 'Apple', 'XYZ': 'Apple'},
+    )
+    result = analytics.analyze(frame)
+    totals = result['portfolios']
+    assert totals['portfolio_id'].tolist() == [1, 2]
+    assert totals['total_cost_basis'].tolist() == pytest.approx([20.0, 40.0])
+    # XYZ has no quote and falls back to its stored price
+    assert totals['total_current_value'].tolist() == pytest.approx([30.0, 39.0])
+    assert totals['num_holdings'].tolist() == [1, 2]
+    positions, groups, summary = analytics.portfolio_view(result, 2)
+    assert positions['symbol'].tolist() == ['AAPL', 'XYZ']
+    assert groups['group'].tolist() == ['Apple'] and groups['weight'].tolist() == pytest.approx([1.0])
+    assert summary['top_weight'] == pytest.approx(24.0 / 39.0)
+
+
+def test_all_portfolio_analytics_prices_shared_symbols_once(monkeypatch):
+    csrf = login('analyticsuser2')
+    headers = {'X-CSRF-Token': csrf}
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 2}, headers=headers).status_code == 200
+    assert client.post('/portfolio/create', json={'name': 'growth'}, headers=headers).status_code == 200
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 1}, headers=headers).status_code == 200
+    assert client.post('/buy', json={'symbol': 'MSFT', 'quantity': 2}, headers=headers).status_code == 200
+
+    passes = []
+    original = api.get_cached_prices
+    monkeypatch.setattr(api, 'get_cached_prices', lambda symbols, db, **kw: passes.append(sorted(symbols)) or original(symbols, db, **kw))
+    r = client.get('/portfolio/analytics/all')
+    assert r.status_code == 200
+    assert passes == [['AAPL', 'MSFT']]
+    data = r.json()
+    assert [p['portfolio_name'] for p in data['portfolios']] == ['default', 'growth']
+    by_name = {p['portfolio_name']: p for p in data['portfolios']}
+    assert by_name['default']['total_current_value'] == pytest.approx(200.0)
+    assert by_name['growth']['total_current_value'] == pytest.approx(200.0)
+    consolidated = data['consolidated']
+    assert consolidated['total_current_value'] == pytest.approx(400.0)
+    assert {h['symbol']: h['quantity'] for h in consolidated['holdings']} == {'AAPL': 3.0, 'MSFT': 2.0}
+    assert consolidated['concentration']['top_weight'] == pytest.approx(0.75)
+
+
+def test_portfolio_analytics_served_from_cache_until_holdings_change(monkeypatch):
+    csrf = login('analyticsuser3')
+    headers = {'X-CSRF-Token': csrf}
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 1}, headers=headers).status_code == 200
+    passes = []
+    original = api.get_cached_prices
+    monkeypatch.setattr(api, 'get_cached_prices', lambda symbols, db, **kw: passes.append(1) or original(symbols, db, **kw))
+
+    first = client.get('/portfolio/analytics').json()
+    assert client.get('/portfolio/analytics').json() == first
+    assert len(passes) == 1
+
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 1}, headers=headers).status_code == 200
+    assert client.get('/portfolio/analytics').json()['holdings'][0]['quantity'] == 2.0
+    assert len(passes) == 2
+
+    # a newer quote for one of its symbols also invalidates the entry
+    api.store_cached_price('AAPL', 130.0)
+    assert client.get('/portfolio/analytics').json()['total_current_value'] == pytest.approx(260.0)
+    assert len(passes) == 3
+
+
+def test_read_endpoints_answer_304_until_data_changes():
+    csrf = login('etaguser1')
+    headers = {'X-CSRF-Token': csrf}
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 1}, headers=headers).status_code == 200
+    paths = ['/portfolio', '/portfolio/analytics', '/user/transactions', '/advisor/history']
+    tags = {}
+    for path in paths:
+        r = client.get(path)
+        assert r.status_code == 200
+        tags[path] = r.headers['ETag']
+        again = client.get(path, headers={'If-None-Match': tags[path]})
+        assert again.status_code == 304
+        assert again.content == b''
+        assert again.headers['ETag'] == tags[path]
+    assert client.get('/user/transactions', params={'limit': 5},
+                      headers={'If-None-Match': tags['/user/transactions']}).status_code == 200
+
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 1}, headers=headers).status_code == 200
+    for path in ['/portfolio', '/portfolio/analytics', '/user/transactions']:
+        r = client.get(path, headers={'If-None-Match': tags[path]})
+        assert r.status_code == 200 and r.headers['ETag'] != tags[path]
+    assert client.get('/advisor/history', headers={'If-None-Match': tags['/advisor/history']}).status_code == 304
+
+
+def test_ticker_rename_changes_portfolio_and_analytics_etags():
+    csrf = login('etaguser2')
+    headers = {'X-CSRF-Token': csrf}
+    assert client.post('/buy', json={'symbol': 'MSFT', 'quantity': 1}, headers=headers).status_code == 200
+    tags = {path: client.get(path).headers['ETag'] for path in ['/portfolio', '/portfolio/analytics']}
+    db = api.SessionLocal()
+    try:
+        db.add(models.TickerMetadata(symbol='MSFT', name='Microsoft Corp', updated_at=api.utcnow()))
+        db.commit()
+    finally:
+        db.close()
+    for path, tag in tags.items():
+        r = client.get(path, headers={'If-None-Match': tag})
+        assert r.status_code == 200 and r.headers['ETag'] != tag
+    assert client.get('/portfolio').json()['portfolio'][0]['ticker_name'] == 'Microsoft Corp'
+
+
+def test_fast_json_matches_standard_encoding_and_large_bodies_are_compressed():
+    import json
+    payload = {'rows': [{'symbol': 'AAPL', 'quantity': 1.5, 'note': None}], 'count': 1}
+    assert json.loads(api.FastJSONResponse(payload).body) == json.loads(api.JSONResponse(payload).body)
+
+    csrf = login('gzipuser1')
+    headers = {'X-CSRF-Token': csrf}
+    assert client.get('/user/transactions', headers={'Accept-Encoding': 'gzip'}).headers.get('content-encoding') is None
+    orders = [{'symbol': 'AAPL', 'side': 'buy', 'quantity': 1} for _ in range(30)]
+    assert client.post('/orders/batch', json={'orders': orders}, headers=headers).status_code == 200
+    r = client.get('/user/transactions', headers={'Accept-Encoding': 'gzip'})
+    assert r.status_code == 200
+    assert r.headers['content-encoding'] == 'gzip'
+    assert len(r.json()) == 30
+
+
+def test_fast_json_skips_the_encoder_and_keeps_headers(monkeypatch):
+    import datetime
+    import json
+    response = api.Response()
+    response.headers['ETag'] = '"abc"'
+    payload = {'day': datetime.date(2026, 1, 2), 'value': 1.5}
+    fast = api.fast_json(payload, response)
+    assert fast.headers['ETag'] == '"abc"'
+    assert json.loads(fast.body) == {'day': '2026-01-02', 'value': 1.5}
+    # without orjson the standard encoder still gets jsonable input
+    monkeypatch.setattr(api, 'orjson', None)
+    assert json.loads(api.fast_json(payload).body) == {'day': '2026-01-02', 'value': 1.5}
+
+
+def test_portfolio_load_rejects_non_finite_numbers():
+    csrf = login('loaduser2')
+    lines = ['Ticker,Quantity,AvgCost', 'AAPL,2,100', 'NANQ,nan,1', 'INFQ,inf,1', 'BADC,1,-inf']
+    r = client.post('/portfolio/load', files={'file': ('nan.csv', '\n'.join(lines), 'text/csv')},
+                    headers={'X-CSRF-Token': csrf})
+    assert r.status_code == 200
+    assert r.json()['errors'] == [
+        {'line': 3, 'error': 'quantity must be a finite number'},
+        {'line': 4, 'error': 'quantity must be a finite number'},
+        {'line': 5, 'error': 'prices and costs must be finite numbers'},
+    ]
+    assert set(holdings_for('loaduser2')) == {'AAPL'}
+
+
+def test_portfolio_load_streams_rows_and_reports_bad_ones():
+    csrf = login('loaduser1')
+    lines = ['Ticker,Quantity,TotalCost,LastTransactionDate', 'aapl,10,1000,2025-01-02']
+    lines += [f'SYM{i},{i + 1},{(i + 1) * 2.0},2025-01-03' for i in range(25)]
+    lines += ['MSFT,abc,10,2025-01-04', 'ZERO,0,0,2025-01-04', ',1,1,2025-01-04', '']
+    files = {'file': ('broker.csv', '\n'.join(lines), 'text/csv')}
+    original = api.IMPORT_BATCH_SIZE
+    api.IMPORT_BATCH_SIZE = 10
+    try:
+        r = client.post('/portfolio/load', files=files, headers={'X-CSRF-Token': csrf})
+    finally:
+        api.IMPORT_BATCH_SIZE = original
+    assert r.status_code == 200
+    data = r.json()
+    assert len(data['portfolio']) == 26
+    assert [e['line'] for e in data['errors']] == [28, 30]
+    held = holdings_for('loaduser1')
+    assert len(held) == 26 and held['AAPL'][1:] == (10.0, 100.0)
+    db = api.SessionLocal()
+    try:
+        portfolio_id = db.get(models.Holding, held['AAPL'][0]).portfolio_id
+        snapshot = api.ledger.latest_snapshot(db, portfolio_id)
+        assert {p.symbol for p in snapshot.positions} == set(held)
+    finally:
+        db.close()
+
+    bad = {'file': ('bad.csv', 'name,amount\nx,1\n', 'text/csv')}
+    r = client.post('/portfolio/load', files=bad, headers={'X-CSRF-Token': csrf})
+    assert r.status_code == 400 and 'missing column' in r.json()['detail']
+    assert len(holdings_for('loaduser1')) == 26
+
+
+def test_portfolio_is_ordered_by_parsed_transaction_time():
+    csrf = login('orderuser1')
+    lines = ['symbol,quantity,avgcost,lasttransactiondate',
+             'OLD,1,1,01/15/2024', 'NONE,1,1,', 'NEW,1,1,2025-03-01T09:00:00+02:00', 'MID,1,1,2025-03-01 06:30:00']
+    files = {'file': ('dates.csv', '\n'.join(lines), 'text/csv')}
+    assert client.post('/portfolio/load', files=files, headers={'X-CSRF-Token': csrf}).status_code == 200
+    assert [row['symbol'] for row in client.get('/portfolio').json()['portfolio']] == ['NEW', 'MID', 'OLD', 'NONE']
+    db = api.SessionLocal()
+    try:
+        stored = db.get(models.Holding, holdings_for('orderuser1')['NEW'][0]).last_transaction_at
+        assert stored.replace(tzinfo=None) == api.datetime.datetime(2025, 3, 1, 7, 0)
+    finally:
+        db.close()
+
+    client.post('/buy', json={'symbol': 'AAPL', 'quantity': 1}, headers={'X-CSRF-Token': csrf})
+    assert client.get('/portfolio').json()['portfolio'][0]['symbol'] == 'AAPL'
+
+
+def test_portfolio_export_streams_csv_from_the_database():
+    csrf = login('exportuser1')
+    headers = {'X-CSRF-Token': csrf}
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 2}, headers=headers).status_code == 200
+    assert client.post('/buy', json={'symbol': 'MSFT', 'quantity': 4}, headers=headers).status_code == 200
+    r = client.get('/portfolio/export')
+    assert r.status_code == 200
+    assert r.headers['content-type'].startswith('text/csv')
+    assert 'filename="default.csv"' in r.headers['content-disposition']
+    lines = r.text.splitlines()
+    assert lines[0] == 'ticker,quantity,totalcost,lasttransactiondate'
+    assert sorted(line.split(',')[:3] for line in lines[1:]) == [['AAPL', '2.0', '200.0'], ['MSFT', '4.0', '200.0']]
+    assert client.get('/portfolio/export', params={'name': 'nope'}).status_code == 404
+
+
+def test_exports_as_csv_and_parquet_unavailable(monkeypatch):
+    csrf = login('exportuser2')
+    headers = {'X-CSRF-Token': csrf}
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 3}, headers=headers).status_code == 200
+    r = client.get('/user/transactions/export')
+    assert r.status_code == 200
+    lines = r.text.splitlines()
+    assert lines[0].split(',') == [name for name, _ in api.arrow_io.TRANSACTION_FIELDS]
+    assert lines[1].split(',')[2:6] == ['AAPL', 'buy', '3.0', '100.0']
+    r = client.get('/user/audit-log/export')
+    assert r.status_code == 200
+    assert r.text.splitlines()[0].startswith('id,action,resource')
+    assert client.get('/user/transactions/export', params={'format': 'xml'}).status_code == 400
+
+    def unavailable():
+        raise api.arrow_io.ArrowUnavailable('Parquet support requires pyarrow')
+    monkeypatch.setattr(api.arrow_io, 'require_pyarrow', unavailable)
+    assert client.get('/portfolio/export', params={'format': 'parquet'}).status_code == 501
+    assert client.get('/user/transactions/export', params={'format': 'parquet'}).status_code == 501
+    r = client.post('/portfolio/load', files={'file': ('p.parquet', b'PAR1', 'application/octet-stream')}, headers=headers)
+    assert r.status_code == 501
+
+
+def test_parquet_round_trip():
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+    import io
+    csrf = login('parquetuser1')
+    headers = {'X-CSRF-Token': csrf}
+    assert client.post('/buy', json={'symbol': 'AAPL', 'quantity': 2}, headers=headers).status_code == 200
+    assert client.post('/buy', json={'symbol': 'MSFT', 'quantity': 4}, headers=headers).status_code == 200
+
+    r = client.get('/portfolio/export', params={'format': 'parquet'})
+    assert r.status_code == 200
+    assert 'filename="default.parquet"' in r.headers['content-disposition']
+    table = pq.read_table(io.BytesIO(r.content))
+    assert table.schema.field('quantity').type == pa.float64()
+    assert sorted(zip(table.column('symbol').to_pylist(), table.column('quantity').to_pylist())) == [('AAPL', 2.0), ('MSFT', 4.0)]
+
+    r = client.get('/user/transactions/export', params={'format': 'parquet'})
+    table = pq.read_table(io.BytesIO(r.content))
+    assert pa.types.is_timestamp(table.schema.field('created_at').type)
+    assert table.num_rows == 2
+
+    sink = io.BytesIO()
+    pq.write_table(pa.table({'ticker': ['nvda', 'GOOG'], 'qty': [5.0, -1.0], 'avgcost': [10.0, 20.0]}), sink)
+    r = client.post('/portfolio/load', files={'file': ('q.parquet', sink.getvalue(), 'application/octet-stream')}, headers=headers)
+    assert r.status_code == 200
+    assert r.json()['errors'] == [{'line': 3, 'error': 'quantity must not be negative'}]
+    assert set(holdings_for('parquetuser1')) == {'NVDA'}